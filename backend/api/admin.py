@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Project, Tag, Yarn, ProjectYarn, ProjectProgress, ProgressImage
+from .models import Project, Tag, Yarn, ProjectYarn, ProjectProgress, ProgressImage, Task
 
 class ProjectYarnInline(admin.TabularInline):
     model = ProjectYarn
@@ -60,3 +60,10 @@ class ProjectProgressAdmin(admin.ModelAdmin):
     date_hierarchy = "date"
     autocomplete_fields = ("project",)
     inlines = [ProgressImageInline]
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "attempts", "max_attempts", "run_at", "locked_by", "finished")
+    list_filter = ("status", "name")
+    search_fields = ("name", "last_error")
+    readonly_fields = ("created", "finished", "locked_until", "locked_by", "last_error")
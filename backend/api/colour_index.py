@@ -0,0 +1,124 @@
+"""
+Nearest-colour lookups over a user's yarns.
+
+Each process keeps, per user, the yarn ids and an (n, 3) float matrix of
+their stored CIELAB values, and ranks them against a query colour with a
+vectorized CIEDE2000 ΔE. A matrix is reused while the user's yarns are
+unchanged: yarn signals drop it locally, and a (count, last updated) stamp
+read with each lookup catches writes made by other processes.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.db.models import Count, Max
+
+from .models import Yarn
+
+MAX_USERS = 64
+
+_lock = threading.Lock()
+_matrices = OrderedDict()  # user_id -> (stamp, ids, lab)
+
+
+def _stamp(user_id):
+    agg = Yarn.objects.filter(user_id=user_id).aggregate(n=Count("id"), last=Max("updated_at"))
+    return (agg["n"], agg["last"])
+
+
+def _load(user_id):
+    rows = list(
+        Yarn.objects.filter(user_id=user_id, lab_l__isnull=False)
+        .order_by("pk")
+        .values_list("pk", "lab_l", "lab_a", "lab_b")
+    )
+    ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    lab = np.array([r[1:] for r in rows], dtype=np.float64).reshape(len(rows), 3)
+    return ids, lab
+
+
+def matrix(user_id):
+    """
+    (ids, lab) for the user's yarns, from the process cache when current.
+    """
+    stamp = _stamp(user_id)
+    with _lock:
+        hit = _matrices.get(user_id)
+        if hit is not None and hit[0] == stamp:
+            _matrices.move_to_end(user_id)
+            return hit[1], hit[2]
+    ids, lab = _load(user_id)
+    with _lock:
+        _matrices[user_id] = (stamp, ids, lab)
+        _matrices.move_to_end(user_id)
+        while len(_matrices) > MAX_USERS:
+            _matrices.popitem(last=False)
+    return ids, lab
+
+
+def invalidate(user_id):
+    with _lock:
+        _matrices.pop(user_id, None)
+
+
+def delta_e_2000(lab, ref):
+    """
+    CIEDE2000 distance from `ref` (3,) to every row of `lab` (n, 3).
+    """
+    L1, a1, b1 = ref
+    L2, a2, b2 = lab[:, 0], lab[:, 1], lab[:, 2]
+
+    c1 = np.hypot(a1, b1)
+    c2 = np.hypot(a2, b2)
+    c_bar7 = ((c1 + c2) / 2) ** 7
+    g = 0.5 * (1 - np.sqrt(c_bar7 / (c_bar7 + 25.0 ** 7)))
+    a1p, a2p = (1 + g) * a1, (1 + g) * a2
+    c1p, c2p = np.hypot(a1p, b1), np.hypot(a2p, b2)
+    h1p = np.degrees(np.arctan2(b1, a1p)) % 360
+    h2p = np.degrees(np.arctan2(b2, a2p)) % 360
+
+    dLp = L2 - L1
+    dCp = c2p - c1p
+    dh = h2p - h1p
+    dh = np.where(dh > 180, dh - 360, np.where(dh < -180, dh + 360, dh))
+    dh = np.where(c1p * c2p == 0, 0.0, dh)
+    dHp = 2 * np.sqrt(c1p * c2p) * np.sin(np.radians(dh / 2))
+
+    L_bar = (L1 + L2) / 2
+    c_bar_p = (c1p + c2p) / 2
+    h_sum = h1p + h2p
+    h_bar = np.where(
+        c1p * c2p == 0, h_sum,
+        np.where(np.abs(h1p - h2p) <= 180, h_sum / 2,
+                 np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2)),
+    )
+    t = (1 - 0.17 * np.cos(np.radians(h_bar - 30)) + 0.24 * np.cos(np.radians(2 * h_bar))
+         + 0.32 * np.cos(np.radians(3 * h_bar + 6)) - 0.20 * np.cos(np.radians(4 * h_bar - 63)))
+    s_l = 1 + 0.015 * (L_bar - 50) ** 2 / np.sqrt(20 + (L_bar - 50) ** 2)
+    s_c = 1 + 0.045 * c_bar_p
+    s_h = 1 + 0.015 * c_bar_p * t
+    c_bar_p7 = c_bar_p ** 7
+    r_t = (-2 * np.sqrt(c_bar_p7 / (c_bar_p7 + 25.0 ** 7))
+           * np.sin(np.radians(60 * np.exp(-(((h_bar - 275) / 25) ** 2)))))
+    return np.sqrt(
+        (dLp / s_l) ** 2 + (dCp / s_c) ** 2 + (dHp / s_h) ** 2
+        + r_t * (dCp / s_c) * (dHp / s_h)
+    )
+
+
+def nearest(user_id, lab, k=10, exclude=None, max_delta_e=None):
+    """
+    [(yarn_id, ΔE)] for the k yarns closest to `lab`, nearest first.
+    """
+    ids, matrix_ = matrix(user_id)
+    if not len(ids):
+        return []
+    distances = delta_e_2000(matrix_, np.asarray(lab, dtype=np.float64))
+    if exclude is not None:
+        distances = np.where(ids == exclude, np.inf, distances)
+    if max_delta_e is not None:
+        distances = np.where(distances <= max_delta_e, distances, np.inf)
+    k = min(k, len(ids))
+    top = np.argpartition(distances, k - 1)[:k]
+    top = top[np.argsort(distances[top], kind="stable")]
+    return [(int(ids[i]), float(distances[i])) for i in top if np.isfinite(distances[i])]
@@ -0,0 +1,43 @@
+"""
+Hex colours -> CIELAB (D65), the space yarn similarity is measured in.
+"""
+
+def hex_to_rgb(value):
+    """
+    "#AABBCC" / "abc" -> (170, 187, 204); None for anything else.
+    """
+    value = (value or "").strip().lstrip("#")
+    if len(value) == 3:
+        value = "".join(ch * 2 for ch in value)
+    if len(value) != 6:
+        return None
+    try:
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        return None
+
+
+def _linear(channel):
+    c = channel / 255.0
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+
+def _f(t):
+    return t ** (1 / 3) if t > (6 / 29) ** 3 else t / (3 * (6 / 29) ** 2) + 4 / 29
+
+
+def rgb_to_lab(rgb):
+    r, g, b = (_linear(c) for c in rgb)
+    x = (0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047
+    y = 0.2126729 * r + 0.7151522 * g + 0.0721750 * b
+    z = (0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883
+    fx, fy, fz = _f(x), _f(y), _f(z)
+    return (116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz))
+
+
+def hex_to_lab(value):
+    """
+    (L*, a*, b*) for a hex colour, or None when it doesn't parse.
+    """
+    rgb = hex_to_rgb(value)
+    return rgb_to_lab(rgb) if rgb else None
@@ -0,0 +1,151 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_THREADS = 4
+DERIVATIVE_WIDTHS = (320, 640, 1280)
+DERIVATIVE_FORMATS = {
+    # key: (Pillow format, extension, save kwargs)
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def derivative_name(source_name: str, width: int, ext: str) -> str:
+    """
+    "progress/cat.jpg" -> "progress/cat.jpg.w320.webp", next to the original.
+    The whole source name is kept so cat.jpg and cat.png don't share files.
+    """
+    return f"{source_name}.w{width}.{ext}"
+
+
+def _load_oriented(fieldfile):
+    fieldfile.open("rb")
+    try:
+        img = Image.open(fieldfile)
+        img.load()
+    finally:
+        fieldfile.close()
+    # Apply the EXIF rotation to the pixels; the re-encoded output below
+    # carries no EXIF (or GPS) data at all.
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "L"):
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        rgba = img.convert("RGBA")
+        background.paste(rgba, mask=rgba.split()[-1])
+        img = background
+    elif img.mode == "L":
+        img = img.convert("RGB")
+    return img
+
+
+def generate_derivatives(fieldfile) -> dict:
+    """
+    Render every width/format pair for an uploaded image and store it beside
+    the original. A file already at a derivative's name is never reused or
+    overwritten (it may belong to an earlier upload); storage picks a free
+    name instead, so each call returns files owned by this image alone.
+
+    Returns {"source": <original name>, "widths": {"320": {"webp": name, "jpeg": name}, ...}}
+    or {} when the file can't be decoded.
+    """
+    if not fieldfile:
+        return {}
+    storage = fieldfile.storage
+    try:
+        img = _load_oriented(fieldfile)
+    except (OSError, Image.DecompressionBombError, ValueError) as exc:
+        logger.warning("Could not read %s for derivatives: %s", fieldfile.name, exc)
+        return {}
+
+    # Never upscale: widths above the original collapse onto the original size.
+    widths = sorted({min(w, img.width) for w in DERIVATIVE_WIDTHS})
+    out = {}
+    for width in widths:
+        height = max(1, round(img.height * width / img.width))
+        resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+        sizes = {}
+        for key, (fmt, ext, options) in DERIVATIVE_FORMATS.items():
+            buf = BytesIO()
+            resized.save(buf, fmt, **options)
+            sizes[key] = storage.save(derivative_name(fieldfile.name, width, ext), ContentFile(buf.getvalue()))
+        out[str(width)] = sizes
+    return {"source": fieldfile.name, "widths": out}
+
+
+def _store(fieldfile):
+    fieldfile.save(fieldfile.name, fieldfile.file, save=False)
+
+
+def store_uploads(instances, field_name: str, threads: int = UPLOAD_THREADS) -> None:
+    """
+    Write each instance's not-yet-stored `field_name` upload to storage,
+    several at a time, the way FieldFile.pre_save would one by one. A
+    request carrying many photos then waits for the slowest write rather
+    than their sum, and the following save()/bulk_create() only inserts rows.
+    """
+    pending = [getattr(obj, field_name) for obj in instances]
+    pending = [f for f in pending if f and not f._committed]
+    if len(pending) < 2:
+        for fieldfile in pending:
+            _store(fieldfile)
+        return
+    with ThreadPoolExecutor(max_workers=min(threads, len(pending))) as pool:
+        list(pool.map(_store, pending))
+
+
+def derivatives_current(variants, fieldfile) -> bool:
+    return bool(fieldfile) and bool(variants) and variants.get("source") == fieldfile.name
+
+
+def ensure_derivatives(instance, field_name: str, variants_field: str) -> bool:
+    """
+    Generate derivatives for `instance.<field_name>` unless the stored
+    variants already describe the current file. Returns True when saved.
+    """
+    fieldfile = getattr(instance, field_name)
+    variants = getattr(instance, variants_field) or {}
+    if not fieldfile:
+        if variants:
+            delete_derivatives(variants, fieldfile.storage)
+            setattr(instance, variants_field, {})
+            instance.save(update_fields=[variants_field])
+            return True
+        return False
+    if derivatives_current(variants, fieldfile):
+        return False
+    if variants:
+        delete_derivatives(variants, fieldfile.storage)
+    setattr(instance, variants_field, generate_derivatives(fieldfile))
+    instance.save(update_fields=[variants_field])
+    return True
+
+
+def delete_derivatives(variants, storage):
+    for sizes in (variants or {}).get("widths", {}).values():
+        for name in sizes.values():
+            storage.delete(name)
+
+
+def srcset(variants, fieldfile, build_url) -> dict:
+    """
+    {"webp": "<url> 320w, <url> 640w", "jpeg": "..."} for <picture>/<img srcset>.
+    Stale variants (the image was replaced) yield {}.
+    """
+    if not derivatives_current(variants, fieldfile):
+        return {}
+    storage = fieldfile.storage
+    result = {}
+    for key in DERIVATIVE_FORMATS:
+        parts = []
+        for width, sizes in sorted(variants["widths"].items(), key=lambda kv: int(kv[0])):
+            if key in sizes:
+                parts.append(f"{build_url(storage.url(sizes[key]))} {width}w")
+        if parts:
+            result[key] = ", ".join(parts)
+    return result
@@ -0,0 +1,159 @@
+import json
+import statistics
+import subprocess
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.models import Project, Yarn
+
+# (name, path) — {project} and {yarn} are filled in with one of the user's ids.
+ENDPOINTS = [
+    ("projects-list", "/api/projects/"),
+    ("projects-list-sparse", "/api/projects/?fields=id,name,tags&expand=tags"),
+    ("projects-list-full", "/api/projects/?expand=tags,yarns,progress_updates"),
+    ("project-detail", "/api/projects/{project}/"),
+    ("yarns-list", "/api/yarns/"),
+    ("yarns-stock", "/api/yarns/?fields=id,brand,remaining_skeins,project_count"),
+    ("yarns-similar", "/api/yarns/similar/?yarn={yarn}&k=10"),
+    ("tags-list", "/api/tags/?fields=id,name,project_count"),
+    ("project-yarns-list", "/api/project-yarns/"),
+    ("progress-list", "/api/progress/"),
+    ("progress-by-project", "/api/progress/?project={project}"),
+    ("activity", "/api/stats/activity/"),
+    ("search", "/api/search/?q=sweater"),
+    ("backup", "/api/backup/?compress=0"),
+]
+
+
+def percentile(samples, pct):
+    if len(samples) == 1:
+        return samples[0]
+    return statistics.quantiles(samples, n=100, method="inclusive")[pct - 1]
+
+
+def git_revision():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def body_size(response):
+    if response.streaming:
+        return sum(len(chunk) for chunk in response.streaming_content)
+    return len(response.content)
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the main API endpoints in-process for one user and print p50/p95/p99 "
+        "latency, query counts and payload sizes as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Username to act as (default: the one with most projects).")
+        parser.add_argument("--iterations", type=int, default=30)
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--only", help="Comma-separated endpoint names.")
+        parser.add_argument("--response-cache", action="store_true",
+                            help="Leave the response cache on (by default every request does the full work).")
+        parser.add_argument("--output", help="Also write the JSON report here.")
+        parser.add_argument("--compare", help="Earlier report to print p50/p95 and query deltas against.")
+
+    def handle(self, *args, user=None, iterations, warmup, only, response_cache, output, compare, **options):
+        User = get_user_model()
+        if user:
+            target = User.objects.filter(username=user).first()
+            if target is None:
+                raise CommandError(f"No user {user!r}.")
+        else:
+            target = User.objects.annotate(n=Count("projects")).order_by("-n").first()
+            if target is None:
+                raise CommandError("No users; run `manage.py seed_load` first.")
+
+        ids = {
+            "project": Project.objects.filter(user=target).values_list("pk", flat=True).first(),
+            "yarn": Yarn.objects.filter(user=target).values_list("pk", flat=True).first(),
+        }
+        endpoints = ENDPOINTS
+        if only:
+            wanted = {name.strip() for name in only.split(",")}
+            endpoints = [e for e in endpoints if e[0] in wanted]
+
+        client = APIClient(SERVER_NAME="localhost")
+        client.force_authenticate(target)
+        overrides = {"METRICS_ENABLED": False}
+        if not response_cache:
+            overrides["RESPONSE_CACHE_TIMEOUT"] = 0
+
+        results = {}
+        with override_settings(**overrides):
+            for name, template in endpoints:
+                if ("{project}" in template and not ids["project"]) or ("{yarn}" in template and not ids["yarn"]):
+                    continue
+                results[name] = self.measure(client, template.format(**ids), iterations, warmup)
+
+        report = {
+            "revision": git_revision(),
+            "database": connection.vendor,
+            "user": target.get_username(),
+            "counts": {
+                "projects": Project.objects.filter(user=target).count(),
+                "yarns": Yarn.objects.filter(user=target).count(),
+            },
+            "iterations": iterations,
+            "endpoints": results,
+        }
+        text = json.dumps(report, indent=2)
+        self.stdout.write(text)
+        if output:
+            with open(output, "w") as fh:
+                fh.write(text + "\n")
+        if compare:
+            self.compare(report, compare)
+
+    def measure(self, client, path, iterations, warmup):
+        for _ in range(warmup):
+            body_size(client.get(path))
+        times, queries, sizes, statuses = [], [], [], set()
+        for _ in range(iterations):
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = client.get(path)
+                size = body_size(response)
+                elapsed = (time.perf_counter() - start) * 1000
+            times.append(elapsed)
+            queries.append(len(captured))
+            sizes.append(size)
+            statuses.add(response.status_code)
+        return {
+            "path": path,
+            "status": sorted(statuses),
+            "p50_ms": round(percentile(times, 50), 2),
+            "p95_ms": round(percentile(times, 95), 2),
+            "p99_ms": round(percentile(times, 99), 2),
+            "queries": max(queries),
+            "bytes": max(sizes),
+        }
+
+    def compare(self, report, path):
+        with open(path) as fh:
+            before = json.load(fh)["endpoints"]
+        self.stderr.write(f"\n{'endpoint':<24} {'p50 ms':>18} {'p95 ms':>18} {'queries':>10}")
+        for name, now in report["endpoints"].items():
+            old = before.get(name)
+            if old is None:
+                continue
+            self.stderr.write(
+                f"{name:<24} {old['p50_ms']:>8} -> {now['p50_ms']:<7} {old['p95_ms']:>8} -> {now['p95_ms']:<7}"
+                f" {old['queries']:>4} -> {now['queries']:<4}"
+            )
@@ -0,0 +1,104 @@
+import statistics
+import time
+
+import bleach
+from django.core.management.base import BaseCommand, CommandError
+
+from api import sanitize
+
+ROUND = (
+    "<p><strong>Rnd {n}:</strong> ch 1, *sc in next {k} st, inc* around, "
+    "sl st to join <em>({total})</em>. See <a href=\"https://example.com/stitches/{n}\">this "
+    "tutorial</a> or <a href=\"mailto:help@example.com\" rel=\"author\">ask</a>.</p>\n"
+)
+SECTION = (
+    "<h2>Part {n}</h2>\n<ul><li>Yarn: DK, colour A</li><li>Hook: 4 mm</li></ul>\n"
+    "<blockquote>Tip: place a stitch marker<script>alert({n})</script> in the first st.</blockquote>\n"
+    "<pre><code class=\"chart\">x x x v x x x v</code></pre>\n"
+    "<img src=\"https://example.com/{n}.jpg\"><span style=\"color:red\" onclick=\"x()\">note</span>\n"
+)
+
+
+def make_pattern(size):
+    """
+    Pattern-like HTML of roughly `size` bytes: headings, rounds with links,
+    lists, code, and some markup the sanitizer has to strip.
+    """
+    parts, n = [], 1
+    length = 0
+    while length < size:
+        piece = SECTION.format(n=n) if n % 10 == 1 else ROUND.format(n=n, k=n % 7 + 1, total=6 * n)
+        parts.append(piece)
+        length += len(piece)
+        n += 1
+    return "".join(parts)
+
+
+def two_pass(html, _cleaner=bleach.Cleaner(
+    tags=sanitize.ALLOWED_TAGS,
+    attributes=sanitize.ALLOWED_ATTRS,
+    protocols=sanitize.ALLOWED_PROTOCOLS,
+    strip=True,
+)):
+    """
+    The previous implementation: bleach, then a BeautifulSoup pass for links.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(_cleaner.clean(html), "html.parser")
+    for a in soup.find_all("a", href=True):
+        a["target"] = "_blank"
+        rel_parts = set(a.get("rel", []))
+        rel_parts.update(["noopener", "nofollow"])
+        a["rel"] = list(rel_parts)
+    return str(soup)
+
+
+def timed(fn, html, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(html)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = "Benchmark pattern_text sanitization over realistic pattern sizes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", default="2,10,50,200",
+            help="Comma-separated pattern sizes in KB.",
+        )
+        parser.add_argument("--repeat", type=int, default=15)
+        parser.add_argument(
+            "--check", action="store_true",
+            help="Fail unless the single pass beats the two-pass baseline and memo hits are 10x faster.",
+        )
+
+    def handle(self, *args, sizes, repeat, check, **options):
+        try:
+            from bs4 import BeautifulSoup  # noqa: F401
+            baseline = two_pass
+        except ImportError:
+            baseline = None
+
+        self.stdout.write(f"{'size':>8} {'two-pass ms':>12} {'one-pass ms':>12} {'memo hit ms':>12}")
+        failures = []
+        for kb in (int(s) for s in sizes.split(",") if s.strip()):
+            html = make_pattern(kb * 1024)
+            old = timed(baseline, html, repeat) if baseline else None
+            new = timed(sanitize.clean_uncached, html, repeat)
+            sanitize.clear_cache()
+            sanitize.clean_pattern(html)
+            hit = timed(sanitize.clean_pattern, html, repeat)
+            old_col = f"{old:12.2f}" if old is not None else f"{'n/a':>12}"
+            self.stdout.write(f"{kb:>6}KB {old_col} {new:12.2f} {hit:12.3f}")
+            if old is not None and new > old:
+                failures.append(f"{kb}KB: one pass ({new:.2f} ms) slower than two passes ({old:.2f} ms)")
+            if hit * 10 > new:
+                failures.append(f"{kb}KB: memo hit ({hit:.3f} ms) not 10x faster than a clean")
+
+        if check and failures:
+            raise CommandError("\n".join(failures))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api import images
+from api.models import Project, ProgressImage
+
+
+class Command(BaseCommand):
+    help = "Create missing resized WebP/JPEG renditions for project and progress images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=200)
+
+    def handle(self, *args, chunk_size, **options):
+        targets = [
+            (Project.objects.exclude(main_image="").exclude(main_image__isnull=True),
+             "main_image", "main_image_variants"),
+            (ProgressImage.objects.exclude(image=""), "image", "variants"),
+        ]
+        for qs, field_name, variants_field in targets:
+            done = 0
+            for obj in qs.order_by("pk").iterator(chunk_size=chunk_size):
+                if images.ensure_derivatives(obj, field_name, variants_field):
+                    done += 1
+            self.stdout.write(f"{qs.model.__name__}: {done} updated")
@@ -0,0 +1,32 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from stitchtracker_backend import backup
+
+
+class Command(BaseCommand):
+    help = "Restore a backup file (from /api/backup/) into a user's account."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--user", required=True, help="Username to import into.")
+        parser.add_argument("--on-conflict", choices=backup.CONFLICT_STRATEGIES, default="skip")
+        parser.add_argument("--batch-size", type=int, default=backup.IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, path, user, on_conflict, batch_size, **options):
+        User = get_user_model()
+        try:
+            target = User.objects.get(username=user)
+        except User.DoesNotExist:
+            raise CommandError(f"No user {user!r}.")
+
+        importer = backup.BackupImporter(target, on_conflict=on_conflict, batch_size=batch_size)
+        try:
+            with open(path, "rb") as fh, transaction.atomic():
+                stats = importer.run(backup.iter_records(backup.iter_lines(fh)))
+        except backup.BackupError as exc:
+            raise CommandError(str(exc))
+
+        for kind, counts in stats.items():
+            self.stdout.write(f"{kind}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
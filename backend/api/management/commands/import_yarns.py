@@ -0,0 +1,34 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DataError, transaction
+
+from api import yarn_import
+
+
+class Command(BaseCommand):
+    help = "Import yarns from a CSV or JSON file into a user's stash."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--user", required=True, help="Username to import into.")
+        parser.add_argument("--on-conflict", choices=yarn_import.CONFLICT_STRATEGIES, default="skip")
+        parser.add_argument("--batch-size", type=int, default=yarn_import.IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, path, user, on_conflict, batch_size, **options):
+        User = get_user_model()
+        try:
+            target = User.objects.get(username=user)
+        except User.DoesNotExist:
+            raise CommandError(f"No user {user!r}.")
+
+        importer = yarn_import.YarnImporter(target, on_conflict=on_conflict, batch_size=batch_size)
+        try:
+            with open(path, "rb") as fh, transaction.atomic():
+                report = importer.run(yarn_import.iter_rows(fh))
+        except (yarn_import.YarnImportError, DataError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report["errors"]:
+            fields = "; ".join(f"{k}: {' '.join(v)}" for k, v in error["errors"].items())
+            self.stderr.write(f"row {error['row']}: {fields}")
+        self.stdout.write(", ".join(f"{k}={v}" for k, v in report["results"].items()))
@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the ProjectDailyStats rollup table from progress entries."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild this username's rollups.")
+        parser.add_argument("--project", type=int, action="append", dest="projects",
+                            help="Only rebuild this project id (repeatable).")
+
+    def handle(self, *args, user=None, projects=None, **options):
+        owner = None
+        if user:
+            try:
+                owner = get_user_model().objects.get(username=user)
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {user!r}.")
+        written = rollups.rebuild(user=owner, project_ids=projects)
+        self.stdout.write(f"{written} rollup rows written")
@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api import search
+
+
+class Command(BaseCommand):
+    help = "Regenerate the full-text search documents for projects, progress and yarns."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only reindex this username.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, user=None, batch_size, **options):
+        owner = None
+        if user:
+            try:
+                owner = get_user_model().objects.get(username=user)
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {user!r}.")
+        indexed = search.reindex(user=owner, batch_size=batch_size)
+        self.stdout.write(f"{indexed} documents indexed")
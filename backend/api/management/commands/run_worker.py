@@ -0,0 +1,57 @@
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api import tasks
+
+
+class Command(BaseCommand):
+    help = "Run background tasks from the api Task table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "2")),
+                            help="Number of worker threads in this process.")
+        parser.add_argument("--poll-interval", type=float, default=float(os.getenv("WORKER_POLL_INTERVAL", "1.0")),
+                            help="Seconds to sleep when the queue is empty.")
+        parser.add_argument("--visibility-timeout", type=int, default=tasks.DEFAULT_TIMEOUT,
+                            help="Seconds a claimed task stays hidden from other workers "
+                                 "(for tasks that don't set their own).")
+        parser.add_argument("--keep-days", type=float,
+                            default=float(os.getenv("WORKER_KEEP_DAYS", tasks.KEEP_DAYS)),
+                            help="Delete finished tasks this many days old (0 keeps them forever).")
+        parser.add_argument("--burst", action="store_true",
+                            help="Exit once the queue is empty instead of polling.")
+
+    def handle(self, *args, concurrency, poll_interval, visibility_timeout, keep_days, burst, **options):
+        stop = threading.Event()
+
+        def shutdown(signum, frame):
+            self.stdout.write("Stopping after current tasks...")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        def loop(n):
+            try:
+                # The first thread also purges old finished tasks.
+                tasks.work(
+                    f"{prefix}:{n}", stop, timeout=visibility_timeout, poll_interval=poll_interval,
+                    keep_days=keep_days if n == 0 else 0, burst=burst,
+                )
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=loop, args=(n,), daemon=True) for n in range(max(concurrency, 1))]
+        self.stdout.write(f"Worker {prefix} started with {len(threads)} thread(s)")
+        for t in threads:
+            t.start()
+        for t in threads:
+            while t.is_alive():
+                t.join(timeout=0.5)
@@ -0,0 +1,167 @@
+import io
+import itertools
+import random
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from api import rollups, sanitize, search, versioning
+from api.management.commands.bench_sanitize import make_pattern
+from api.models import Project, ProjectProgress, ProjectYarn, ProgressImage, Tag, Yarn
+
+BRANDS = ["Drops", "Malabrigo", "Cascade", "Lion Brand", "Rowan", "Hobbii", "Scheepjes", "Knit Picks"]
+WEIGHTS = [("Fingering", "50g / 210 yds"), ("Sport", "50g / 150 yds"), ("DK", "100g / 230 yds"),
+           ("Worsted", "100g / 200 yds"), ("Aran", "100g / 180 yds"), ("Bulky", "100g / 120 yds")]
+MATERIALS = ["Wool", "Merino", "Cotton", "Acrylic", "Alpaca blend", "Linen"]
+COLOUR_NAMES = ["Sky", "Moss", "Rust", "Plum", "Ochre", "Slate", "Rose", "Teal", "Cream", "Ink"]
+ITEMS = ["Sweater", "Hat", "Socks", "Shawl", "Blanket", "Amigurumi", "Cardigan", "Mittens", "Cowl", "Tote"]
+ADJECTIVES = ["Cozy", "Striped", "Cabled", "Granny", "Lace", "Chunky", "Seamless", "Textured", "Brioche"]
+TAGS = ["gift", "wip", "stash-buster", "quick", "baby", "winter", "summer", "test-knit", "frogged",
+        "colourwork", "top-down", "for-me", "charity", "cables", "lace", "holiday"]
+
+
+def heavy_tailed(rng, mean, cap):
+    """
+    A count whose mean is about `mean` with a long tail, like real accounts:
+    most are small, a few are huge.
+    """
+    return max(1, min(cap, int(rng.lognormvariate(0, 0.9) * mean / 1.5)))
+
+
+def swatch_jpeg(rng, size=64):
+    colour = tuple(rng.randrange(256) for _ in range(3))
+    buf = io.BytesIO()
+    Image.new("RGB", (size, size), colour).save(buf, "JPEG", quality=80)
+    return buf.getvalue()
+
+
+def sample_patterns():
+    return [sanitize.clean_pattern(make_pattern(kb * 1024)) for kb in (1, 4, 16)]
+
+
+def seed_user(user, rng, opts, patterns):
+    """
+    Give `user` tags, yarns, projects, tag links, project yarns, progress
+    entries and photos sized by opts["projects"], opts["yarns"],
+    opts["progress"] and opts["image_ratio"], then rebuild the derived
+    tables. Returns the row counts.
+    """
+    today = timezone.localdate()
+    tags = Tag.objects.bulk_create([
+        Tag(user=user, name=name) for name in rng.sample(TAGS, rng.randint(3, len(TAGS)))
+    ])
+
+    yarns = {}
+    for i in range(heavy_tailed(rng, opts["yarns"], 2000)):
+        weight, amount = rng.choice(WEIGHTS)
+        yarn = Yarn(
+            user=user, brand=rng.choice(BRANDS), weight=weight, amount_per_skein=amount,
+            material=rng.choice(MATERIALS), colour="#%06x" % rng.randrange(1 << 24),
+            colour_name=f"{rng.choice(COLOUR_NAMES)} {i}",
+            quantity_owned_skeins=rng.choice([None, 1, 2, 3, 5, 8, 12]),
+        )
+        yarn.refresh_derived_fields()
+        yarns[(yarn.brand, yarn.weight, yarn.colour, yarn.material, yarn.amount_per_skein)] = yarn
+    yarns = Yarn.objects.bulk_create(list(yarns.values()), batch_size=1000)
+
+    projects = []
+    for i in range(heavy_tailed(rng, opts["projects"], 1000)):
+        started = today - timedelta(days=rng.randrange(730))
+        projects.append(Project(
+            user=user, name=f"{rng.choice(ADJECTIVES)} {rng.choice(ITEMS)} #{i + 1}",
+            type=rng.choice(["knit", "crochet"]), start_date=started,
+            expected_end_date=started + timedelta(days=rng.randrange(7, 180)) if rng.random() < 0.6 else None,
+            needle_or_hook_size=rng.choice(["3 mm", "4 mm", "4.5 mm", "5 mm", "6 mm", ""]),
+            pattern_text=rng.choice(patterns) if rng.random() < 0.4 else "",
+            notes=rng.choice(["", "Going well.", "Needs blocking.", "Second sleeve syndrome."]),
+        ))
+    projects = Project.objects.bulk_create(projects, batch_size=1000)
+
+    ProjectTag = Project.tags.through
+    links = [
+        ProjectTag(project_id=p.pk, tag_id=t.pk)
+        for p in projects for t in rng.sample(tags, min(len(tags), rng.randint(0, 4)))
+    ]
+    ProjectTag.objects.bulk_create(links, batch_size=1000)
+    usages = [
+        ProjectYarn(
+            project=p, yarn=y,
+            quantity_used_skeins=rng.choice([None, 1, 2, 3]),
+            quantity_used_grams=rng.choice([None, None, 25, 50, 120]),
+        )
+        for p in projects for y in rng.sample(yarns, min(len(yarns), rng.randint(1, 4)))
+    ]
+    ProjectYarn.objects.bulk_create(usages, batch_size=1000)
+
+    progress = []
+    for p in projects:
+        span = max(1, (today - p.start_date).days)
+        for _ in range(heavy_tailed(rng, opts["progress"], 500)):
+            day = p.start_date + timedelta(days=rng.randrange(span))
+            when = datetime.combine(day, time(rng.randrange(7, 23), rng.randrange(60)))
+            progress.append(ProjectProgress(
+                project=p, date=timezone.make_aware(when),
+                rows_completed=rng.randint(1, 40), stitches_completed=rng.randint(10, 600),
+                notes=rng.choice(["", "", "Finished the ribbing.", "Picked up stitches.", "Frogged two rows."]),
+            ))
+    progress = ProjectProgress.objects.bulk_create(progress, batch_size=1000)
+
+    images = [
+        ProgressImage(progress=entry, image=ContentFile(swatch_jpeg(rng), name=f"seed-{entry.pk}.jpg"))
+        for entry in progress if rng.random() < opts["image_ratio"]
+    ]
+    ProgressImage.objects.bulk_create(images, batch_size=500)
+
+    rollups.rebuild(user=user)
+    search.reindex(user=user)
+    versioning.bump(user.pk)
+    return {
+        "projects": len(projects), "yarns": len(yarns), "tags": len(tags), "links": len(links),
+        "progress": len(progress), "images": len(images),
+    }
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic users and data for load testing and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=5)
+        parser.add_argument("--projects", type=int, default=25, help="Mean projects per user.")
+        parser.add_argument("--yarns", type=int, default=60, help="Mean yarns per user.")
+        parser.add_argument("--progress", type=int, default=20, help="Mean progress entries per project.")
+        parser.add_argument("--image-ratio", type=float, default=0.1,
+                            help="Share of progress entries that get a photo.")
+        parser.add_argument("--prefix", default="load", help="Usernames are <prefix>1, <prefix>2, ...")
+        parser.add_argument("--password", default="load-test-password")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--clear", action="store_true", help="Delete earlier <prefix>* users first.")
+
+    def handle(self, *args, **opts):
+        User = get_user_model()
+        rng = random.Random(opts["seed"])
+        prefix = opts["prefix"]
+        if opts["clear"]:
+            deleted, _ = User.objects.filter(username__regex=rf"^{prefix}\d+$").delete()
+            self.stdout.write(f"cleared {deleted} rows")
+
+        taken = set(User.objects.filter(username__startswith=prefix).values_list("username", flat=True))
+        names = (f"{prefix}{n}" for n in itertools.count(1) if f"{prefix}{n}" not in taken)
+        password = make_password(opts["password"])
+        patterns = sample_patterns()
+        totals = dict.fromkeys(["projects", "yarns", "tags", "links", "progress", "images"], 0)
+
+        for username in itertools.islice(names, opts["users"]):
+            with transaction.atomic():
+                # bulk_create skips the signal that promotes the first user to admin
+                user = User.objects.bulk_create([User(username=username, password=password)])[0]
+                counts = seed_user(user, rng, opts, patterns)
+            for key, value in counts.items():
+                totals[key] += value
+            self.stdout.write(f"{user.username}: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+        self.stdout.write("total: " + ", ".join(f"{k}={v}" for k, v in totals.items()))
@@ -0,0 +1,370 @@
+"""
+Per-route request metrics in Prometheus text format.
+
+RequestMetricsMiddleware times every request and counts its SQL queries and
+query time (through connection.execute_wrapper), then adds them to
+histograms in this process, labelled by route (the URL name, e.g.
+"project-list") and method. Response sizes are recorded for non-streaming
+responses.
+
+Database connections are counted too: connects Django makes itself
+(connection_created, for unpooled aliases) and, for aliases using the
+psycopg pool (DB_POOL in prod settings), the pool's own stats, so the
+connection setup cost per request can be compared between the two.
+
+Under gunicorn each worker has its own histograms, so every worker writes
+its cumulative numbers to its MetricsSnapshot row at most every
+METRICS_FLUSH_INTERVAL seconds, and /api/admin/metrics sums all rows. A
+scrape can lag the other workers by up to one flush interval. Pool gauges
+(size, idle, waiting) only come from rows written recently, so dead workers
+drop out.
+
+Rows not written for METRICS_RETENTION seconds belong to exited workers:
+prune() folds their counts into a single "retired" row and deletes them.
+The table stays at one row per live worker plus one, and totals never go
+backwards.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import ExitStack
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import MetricsSnapshot
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREFIX = "stitchtracker_http"
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HISTOGRAMS = {
+    "request_duration_seconds": ("Wall time to produce the response.", SECONDS),
+    "sql_queries": ("SQL queries run per request.", (0, 1, 2, 5, 10, 20, 50, 100, 200)),
+    "sql_duration_seconds": ("Time spent in SQL per request.", SECONDS),
+    "response_size_bytes": (
+        "Body size of non-streaming responses.",
+        (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+    ),
+}
+
+DB_PREFIX = "stitchtracker_db"
+# psycopg_pool get_stats() key -> (metric suffix, type, help, scale)
+POOL_STATS = {
+    "pool_size": ("pool_size", "gauge", "Connections held by the pool, busy or idle.", 1),
+    "pool_available": ("pool_idle", "gauge", "Idle connections in the pool.", 1),
+    "pool_max": ("pool_max_size", "gauge", "Configured maximum pool size.", 1),
+    "requests_waiting": ("pool_waiting", "gauge", "Checkouts waiting for a free connection.", 1),
+    "requests_num": ("pool_checkouts_total", "counter", "Connections handed out by the pool.", 1),
+    "requests_queued": ("pool_queued_total", "counter", "Checkouts that had to wait.", 1),
+    "requests_wait_ms": ("pool_wait_seconds_total", "counter", "Time spent waiting for a connection.", 0.001),
+    "requests_errors": ("pool_checkout_errors_total", "counter", "Checkouts that timed out or failed.", 1),
+    "connections_lost": ("pool_lost_total", "counter", "Pooled connections found broken and replaced.", 1),
+    "connections_ms": ("pool_connect_seconds_total", "counter", "Time the pool spent opening connections.", 0.001),
+}
+LIVE_FACTOR = 3  # a row older than this many flush intervals is a dead worker's
+RETIRED = "retired"  # MetricsSnapshot.worker of the row holding pruned workers' totals
+PRUNE_INTERVAL = 5 * 60
+_POOL_COUNTERS = ("connections_num", *(k for k, v in POOL_STATS.items() if v[1] == "counter"))
+
+_lock = threading.Lock()
+_state = {
+    "pid": None, "worker": None, "hist": {}, "requests": {}, "connects": {},
+    "flushed": 0.0, "pruned": None,
+}
+
+
+def enabled():
+    return getattr(settings, "METRICS_ENABLED", True)
+
+
+def flush_interval():
+    return getattr(settings, "METRICS_FLUSH_INTERVAL", 10)
+
+
+def retention():
+    return getattr(settings, "METRICS_RETENTION", 3600)
+
+
+def _current():
+    """
+    This process's state, reset after a fork so a worker never reports
+    numbers inherited from its parent.
+    """
+    pid = os.getpid()
+    if _state["pid"] != pid:
+        _state.update(
+            pid=pid,
+            worker=f"{socket.gethostname()}:{pid}:{int(time.time())}",
+            hist={}, requests={}, connects={}, flushed=time.monotonic(), pruned=None,
+        )
+    return _state
+
+
+def _observe(hist, name, labels, value):
+    buckets = HISTOGRAMS[name][1]
+    series = hist.get(f"{name}|{labels}")
+    if series is None:
+        # per-bucket counts (not cumulative), then sum and count
+        series = hist[f"{name}|{labels}"] = [0] * len(buckets) + [0, 0]
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            series[i] += 1
+            break
+    series[-2] += value
+    series[-1] += 1
+
+
+def record(route, method, status, seconds, queries, sql_seconds, size=None):
+    labels = f"{route}|{method}"
+    with _lock:
+        state = _current()
+        hist = state["hist"]
+        _observe(hist, "request_duration_seconds", labels, seconds)
+        _observe(hist, "sql_queries", labels, queries)
+        _observe(hist, "sql_duration_seconds", labels, sql_seconds)
+        if size is not None:
+            _observe(hist, "response_size_bytes", labels, size)
+        key = f"{labels}|{status}"
+        state["requests"][key] = state["requests"].get(key, 0) + 1
+
+
+def pooled(connection):
+    return bool(connection.settings_dict.get("OPTIONS", {}).get("pool"))
+
+
+def connection_opened(connection):
+    """
+    Count a new unpooled connection (pooled ones are counted by the pool,
+    and connection_created fires for every checkout from it).
+    """
+    if pooled(connection):
+        return
+    with _lock:
+        connects = _current()["connects"]
+        connects[connection.alias] = connects.get(connection.alias, 0) + 1
+
+
+def pool_stats():
+    """
+    {alias: get_stats()} for every database alias using the psycopg pool.
+    """
+    stats = {}
+    for alias in connections:
+        connection = connections[alias]
+        if pooled(connection) and connection.pool is not None:
+            stats[alias] = connection.pool.get_stats()
+    return stats
+
+
+def flush():
+    """
+    Write this process's totals to its MetricsSnapshot row.
+    """
+    pools = pool_stats()
+    with _lock:
+        state = _current()
+        state["flushed"] = time.monotonic()
+        worker = state["worker"]
+        data = {
+            "hist": {k: list(v) for k, v in state["hist"].items()},
+            "requests": dict(state["requests"]),
+            "connects": dict(state["connects"]),
+            "pools": pools,
+        }
+    if not MetricsSnapshot.objects.filter(worker=worker).update(data=data):
+        MetricsSnapshot.objects.create(worker=worker, data=data)
+
+    with _lock:
+        pruned = state["pruned"]
+        due = pruned is None or time.monotonic() - pruned >= PRUNE_INTERVAL
+        if due:
+            state["pruned"] = time.monotonic()
+    if due and retention() > 0:
+        prune()
+
+
+def _fold(total, data):
+    """
+    Add snapshot `data`'s counters into `total`. Pool gauges are left out:
+    they describe a live process.
+    """
+    for section in ("requests", "connects"):
+        counts = total.setdefault(section, {})
+        for key, count in data.get(section, {}).items():
+            counts[key] = counts.get(key, 0) + count
+    hist = total.setdefault("hist", {})
+    for key, series in data.get("hist", {}).items():
+        current = hist.setdefault(key, [0] * len(series))
+        if len(current) == len(series):
+            hist[key] = [a + b for a, b in zip(current, series)]
+    pools = total.setdefault("pools", {})
+    for alias, stats in data.get("pools", {}).items():
+        kept = pools.setdefault(alias, {})
+        for key in _POOL_COUNTERS:
+            kept[key] = kept.get(key, 0) + stats.get(key, 0)
+    return total
+
+
+def prune():
+    """
+    Fold the snapshots not written for retention() seconds into the RETIRED
+    row and delete them. Returns the number of rows removed.
+    """
+    cutoff = timezone.now() - timedelta(seconds=retention())
+    stale = MetricsSnapshot.objects.filter(updated_at__lt=cutoff).exclude(worker=RETIRED)
+    with transaction.atomic():
+        folded, removed = {}, 0
+        for pk, data in stale.values_list("pk", "data"):
+            # Only the process whose DELETE removed the row counts it.
+            if MetricsSnapshot.objects.filter(pk=pk).delete()[0]:
+                _fold(folded, data)
+                removed += 1
+        if removed:
+            retired, _ = MetricsSnapshot.objects.select_for_update().get_or_create(worker=RETIRED)
+            retired.data = _fold(retired.data or {}, folded)
+            retired.save()
+    return removed
+
+
+def maybe_flush():
+    with _lock:
+        due = time.monotonic() - _current()["flushed"] >= flush_interval()
+    if not due:
+        return
+    try:
+        flush()
+    except Exception:
+        logger.exception("Could not store request metrics")
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(route, method, **extra):
+    pairs = [("route", route), ("method", method), *extra.items()]
+    return ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """
+    Every worker's snapshot, summed, as Prometheus exposition text.
+    """
+    hist, requests, connects, pools = {}, {}, {}, {}
+    live_since = timezone.now() - timedelta(seconds=LIVE_FACTOR * max(flush_interval(), 10))
+    for data, updated_at in MetricsSnapshot.objects.values_list("data", "updated_at"):
+        for alias, count in data.get("connects", {}).items():
+            connects[alias] = connects.get(alias, 0) + count
+        for alias, stats in data.get("pools", {}).items():
+            total = pools.setdefault(alias, {})
+            # pooled connects go into the same connects_total as unpooled ones
+            connects[alias] = connects.get(alias, 0) + stats.get("connections_num", 0)
+            for key, (_, kind, _, _) in POOL_STATS.items():
+                if kind == "counter" or updated_at >= live_since:
+                    total[key] = total.get(key, 0) + stats.get(key, 0)
+        for key, series in data.get("hist", {}).items():
+            total = hist.setdefault(key, [0] * len(series))
+            if len(total) != len(series):
+                continue  # buckets changed since this row was written
+            for i, value in enumerate(series):
+                total[i] += value
+        for key, count in data.get("requests", {}).items():
+            requests[key] = requests.get(key, 0) + count
+
+    lines = [
+        f"# HELP {PREFIX}_requests_total Requests served, by route, method and status.",
+        f"# TYPE {PREFIX}_requests_total counter",
+    ]
+    for key in sorted(requests):
+        route, method, status = key.rsplit("|", 2)
+        lines.append(f"{PREFIX}_requests_total{{{_labels(route, method, status=status)}}} {requests[key]}")
+
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        metric = f"{PREFIX}_{name}"
+        lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+        for key in sorted(k for k in hist if k.startswith(f"{name}|")):
+            route, method = key[len(name) + 1:].rsplit("|", 1)
+            series = hist[key]
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f"{metric}_bucket{{{_labels(route, method, le=bound)}}} {cumulative}")
+            lines.append(f"{metric}_bucket{{{_labels(route, method, le='+Inf')}}} {series[-1]}")
+            lines.append(f"{metric}_sum{{{_labels(route, method)}}} {_number(series[-2])}")
+            lines.append(f"{metric}_count{{{_labels(route, method)}}} {series[-1]}")
+
+    lines += [
+        f"# HELP {DB_PREFIX}_connects_total Database connections opened, pooled or not.",
+        f"# TYPE {DB_PREFIX}_connects_total counter",
+    ]
+    for alias in sorted(connects):
+        lines.append(f'{DB_PREFIX}_connects_total{{alias="{_escape(alias)}"}} {connects[alias]}')
+    if pools:
+        for key, (suffix, kind, help_text, scale) in POOL_STATS.items():
+            metric = f"{DB_PREFIX}_{suffix}"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            for alias in sorted(pools):
+                value = pools[alias].get(key, 0) * scale
+                lines.append(f'{metric}{{alias="{_escape(alias)}"}} {_number(value)}')
+    return "\n".join(lines) + "\n"
+
+
+class _SqlTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def route_for(request):
+    match = getattr(request, "resolver_match", None)
+    return (match.view_name if match else None) or "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """
+    Records each request into api.metrics. Goes first in MIDDLEWARE so the
+    timing covers the rest of the stack.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not enabled():
+            return self.get_response(request)
+        timer = _SqlTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(timer))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        size = None
+        if not response.streaming:
+            size = len(response.content)
+        record(
+            route_for(request), request.method, response.status_code,
+            elapsed, timer.count, timer.seconds, size,
+        )
+        maybe_flush()
+        return response
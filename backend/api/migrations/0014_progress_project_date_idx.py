@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_data_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectprogress',
+            index=models.Index(fields=['project', 'date'], name='progress_project_date_idx'),
+        ),
+    ]
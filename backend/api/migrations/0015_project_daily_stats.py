@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-17 16:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill(apps, schema_editor):
+    ProjectProgress = apps.get_model("api", "ProjectProgress")
+    ProjectDailyStats = apps.get_model("api", "ProjectDailyStats")
+    totals = (
+        ProjectProgress.objects
+        .annotate(day=TruncDate("date", tzinfo=timezone.get_default_timezone()))
+        .values("project_id", "project__user_id", "day")
+        .annotate(rows=Sum("rows_completed"), stitches=Sum("stitches_completed"), entries=Count("id"))
+        .order_by()
+    )
+    ProjectDailyStats.objects.bulk_create(
+        [
+            ProjectDailyStats(
+                user_id=t["project__user_id"], project_id=t["project_id"], day=t["day"],
+                rows=t["rows"], stitches=t["stitches"], entries=t["entries"],
+            )
+            for t in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_progress_project_date_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('rows', models.BigIntegerField(default=0)),
+                ('stitches', models.BigIntegerField(default=0)),
+                ('entries', models.IntegerField(default=0)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='api.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'day'], name='daily_stats_user_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('project', 'day'), name='uniq_project_daily_stats')],
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
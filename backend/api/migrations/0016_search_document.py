@@ -0,0 +1,159 @@
+# Generated by Django 5.2.5 on 2026-10-17 16:19
+
+import html
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import OperationalError, migrations, models
+from django.utils.html import strip_tags
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE api_searchdocument ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(body, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX api_searchdocument_vector_gin ON api_searchdocument USING GIN (search_vector)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS api_searchdocument_vector_gin",
+    "ALTER TABLE api_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+# External-content FTS5 table mirroring title/body; the triggers keep it in
+# step with every INSERT/UPDATE/DELETE on api_searchdocument.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE api_searchdocument_fts USING fts5(
+        title, body, content='api_searchdocument', content_rowid='id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER api_searchdocument_fts_ai AFTER INSERT ON api_searchdocument BEGIN
+        INSERT INTO api_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER api_searchdocument_fts_ad AFTER DELETE ON api_searchdocument BEGIN
+        INSERT INTO api_searchdocument_fts(api_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER api_searchdocument_fts_au AFTER UPDATE ON api_searchdocument BEGIN
+        INSERT INTO api_searchdocument_fts(api_searchdocument_fts, rowid, title, body)
+        VALUES ('delete', old.id, old.title, old.body);
+        INSERT INTO api_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body);
+    END
+    """,
+]
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS api_searchdocument_fts_ai",
+    "DROP TRIGGER IF EXISTS api_searchdocument_fts_ad",
+    "DROP TRIGGER IF EXISTS api_searchdocument_fts_au",
+    "DROP TABLE IF EXISTS api_searchdocument_fts",
+]
+
+
+def _run(schema_editor, statements):
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _run(schema_editor, POSTGRES_FORWARD)
+    elif vendor == "sqlite":
+        try:
+            _run(schema_editor, SQLITE_FORWARD[:1])
+        except OperationalError:
+            # SQLite built without FTS5: api.search falls back to icontains.
+            return
+        _run(schema_editor, SQLITE_FORWARD[1:])
+
+
+def drop_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        _run(schema_editor, POSTGRES_REVERSE)
+    elif vendor == "sqlite":
+        _run(schema_editor, SQLITE_REVERSE)
+
+
+def _plain_text(value):
+    return html.unescape(strip_tags(value or "")).strip()
+
+
+# Frozen copy of api.search.document_for as of this migration, so later
+# changes to the live indexing code can't change what this backfill writes.
+def document_for(kind, obj):
+    if kind == "project":
+        return {
+            "user_id": obj.user_id, "parent_id": None, "title": obj.name,
+            "body": "\n".join(filter(None, [obj.notes, _plain_text(obj.pattern_text)])),
+        }
+    if kind == "progress":
+        return {
+            "user_id": obj.project.user_id, "parent_id": obj.project_id,
+            "title": obj.project.name, "body": obj.notes or "",
+        }
+    return {
+        "user_id": obj.user_id, "parent_id": None,
+        "title": " ".join(filter(None, [obj.brand, obj.colour_name])),
+        "body": " ".join(filter(None, [obj.weight, obj.material])),
+    }
+
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    SearchDocument = apps.get_model("api", "SearchDocument")
+    sources = [
+        ("project", apps.get_model("api", "Project").objects.all()),
+        ("progress", apps.get_model("api", "ProjectProgress").objects.select_related("project")),
+        ("yarn", apps.get_model("api", "Yarn").objects.all()),
+    ]
+    for kind, qs in sources:
+        # At most BACKFILL_BATCH_SIZE documents are held at once.
+        batch = []
+        for obj in qs.order_by("pk").iterator(chunk_size=BACKFILL_BATCH_SIZE):
+            batch.append(SearchDocument(kind=kind, object_id=obj.pk, **document_for(kind, obj)))
+            if len(batch) >= BACKFILL_BATCH_SIZE:
+                SearchDocument.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            SearchDocument.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_project_daily_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('project', 'Project'), ('progress', 'Progress'), ('yarn', 'Yarn')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('parent_id', models.BigIntegerField(blank=True, help_text='Project of a progress entry', null=True)),
+                ('title', models.CharField(max_length=300)),
+                ('body', models.TextField(blank=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'parent_id'], name='search_doc_parent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='uniq_search_document')],
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
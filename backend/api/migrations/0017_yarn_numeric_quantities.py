@@ -0,0 +1,140 @@
+# Generated by Django 5.2.5 on 2026-10-17 16:21
+
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+# Frozen copy of api.yarn_units as of this migration, so later changes to
+# the live parser can't change what this backfill writes.
+GRAMS_PER_OUNCE = Decimal("28.3495")
+METERS_PER_YARD = Decimal("0.9144")
+_CENT = Decimal("0.01")
+MAX_AMOUNT = Decimal("999999.99")
+_AMOUNT = re.compile(
+    r"(?P<num>\d+(?:,\d{3}(?!\d))*(?:[.,]\d+)?)\s*"
+    r"(?P<unit>grams?|gr|g|ounces?|oz|yards?|yds?|metres?|meters?|mtrs?|m)\b",
+    re.IGNORECASE,
+)
+_THOUSANDS = re.compile(r",(?=\d{3}(?!\d))")
+_CYC_NUMBERS = {
+    "0": "lace", "1": "fingering", "2": "sport", "3": "dk",
+    "4": "worsted", "5": "bulky", "6": "super_bulky", "7": "jumbo",
+}
+_WEIGHT_NAMES = [
+    (r"super\s*bulky|super\s*chunky", "super_bulky"),
+    (r"light\s*worsted|double\s*knit", "dk"),
+    (r"light\s*fingering", "fingering"),
+    (r"roving", "super_bulky"),
+    (r"jumbo", "jumbo"),
+    (r"\bdk\b", "dk"),
+    (r"fingering|sock|baby", "fingering"),
+    (r"lace|cobweb|thread", "lace"),
+    (r"sport", "sport"),
+    (r"worsted|afghan", "worsted"),
+    (r"aran", "aran"),
+    (r"bulky|chunky|craft|rug", "bulky"),
+    (r"\b1[24]\s*ply\b", "bulky"),
+    (r"\b10\s*ply\b", "aran"),
+    (r"\b8\s*ply\b", "dk"),
+    (r"\b5\s*ply\b", "sport"),
+    (r"\b[34]\s*ply\b", "fingering"),
+    (r"\b[12]\s*ply\b", "lace"),
+]
+DERIVED_FIELDS = ("grams_per_skein", "yards_per_skein", "meters_per_skein", "weight_category")
+
+
+def _fit(value):
+    if value >= MAX_AMOUNT + _CENT / 2:
+        return None
+    return value.quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def parse_amount(text):
+    grams = yards = meters = None
+    for match in _AMOUNT.finditer(text or ""):
+        number = _fit(Decimal(_THOUSANDS.sub("", match["num"]).replace(",", ".")))
+        unit = match["unit"].lower()
+        if number is None:
+            continue
+        if unit.startswith("g") and grams is None:
+            grams = number
+        elif unit.startswith("o") and grams is None:
+            grams = _fit(number * GRAMS_PER_OUNCE)
+        elif unit.startswith("y") and yards is None:
+            yards = number
+        elif unit.startswith("m") and meters is None:
+            meters = number
+    if yards is None and meters is not None:
+        yards = _fit(meters / METERS_PER_YARD)
+    elif meters is None and yards is not None:
+        meters = _fit(yards * METERS_PER_YARD)
+    return grams, yards, meters
+
+
+def weight_category(text):
+    text = (text or "").strip().lower()
+    if not text:
+        return ""
+    for pattern, key in _WEIGHT_NAMES:
+        if re.search(pattern, text):
+            return key
+    cyc = re.search(r"(?:^|[#(\s])([0-7])(?:$|[)\s])", text)
+    return _CYC_NUMBERS[cyc.group(1)] if cyc else ""
+
+
+def derived_fields(weight, amount_per_skein):
+    grams, yards, meters = parse_amount(amount_per_skein)
+    return {
+        "grams_per_skein": grams,
+        "yards_per_skein": yards,
+        "meters_per_skein": meters,
+        "weight_category": weight_category(weight),
+    }
+
+
+def backfill(apps, schema_editor):
+    Yarn = apps.get_model("api", "Yarn")
+    last_pk = 0
+    while True:
+        batch = list(Yarn.objects.filter(pk__gt=last_pk).order_by("pk")[:BATCH_SIZE])
+        if not batch:
+            break
+        for yarn in batch:
+            for name, value in derived_fields(yarn.weight, yarn.amount_per_skein).items():
+                setattr(yarn, name, value)
+        Yarn.objects.bulk_update(batch, DERIVED_FIELDS)
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0016_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='yarn',
+            name='grams_per_skein',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='yarn',
+            name='meters_per_skein',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, max_digits=8, null=True),
+        ),
+        migrations.AddField(
+            model_name='yarn',
+            name='weight_category',
+            field=models.CharField(blank=True, choices=[('lace', 'Lace'), ('fingering', 'Fingering'), ('sport', 'Sport'), ('dk', 'DK'), ('worsted', 'Worsted'), ('aran', 'Aran'), ('bulky', 'Bulky'), ('super_bulky', 'Super bulky'), ('jumbo', 'Jumbo')], db_index=True, editable=False, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='yarn',
+            name='yards_per_skein',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, editable=False, max_digits=8, null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5 on 2026-10-17 16:23
+
+from django.db import migrations, models
+
+BATCH_SIZE = 500
+
+
+# Frozen copy of api.colours.hex_to_lab as of this migration, so later
+# changes to the live conversion can't change what this backfill writes.
+def _f(t):
+    return t ** (1 / 3) if t > (6 / 29) ** 3 else t / (3 * (6 / 29) ** 2) + 4 / 29
+
+
+def hex_to_lab(value):
+    value = (value or "").strip().lstrip("#")
+    if len(value) == 3:
+        value = "".join(ch * 2 for ch in value)
+    if len(value) != 6:
+        return None
+    try:
+        rgb = [int(value[i:i + 2], 16) / 255.0 for i in (0, 2, 4)]
+    except ValueError:
+        return None
+    r, g, b = (c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4 for c in rgb)
+    x = (0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047
+    y = 0.2126729 * r + 0.7151522 * g + 0.0721750 * b
+    z = (0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883
+    fx, fy, fz = _f(x), _f(y), _f(z)
+    return (116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz))
+
+
+def backfill(apps, schema_editor):
+    Yarn = apps.get_model("api", "Yarn")
+    last_pk = 0
+    while True:
+        batch = list(Yarn.objects.filter(pk__gt=last_pk).order_by("pk")[:BATCH_SIZE])
+        if not batch:
+            break
+        for yarn in batch:
+            yarn.lab_l, yarn.lab_a, yarn.lab_b = hex_to_lab(yarn.colour) or (None, None, None)
+        Yarn.objects.bulk_update(batch, ["lab_l", "lab_a", "lab_b"])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_yarn_numeric_quantities'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='yarn',
+            name='lab_a',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='yarn',
+            name='lab_b',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='yarn',
+            name='lab_l',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
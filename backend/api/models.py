@@ -3,6 +3,9 @@ from django.core.validators import RegexValidator
 from django.db import models
 from django.utils import timezone
 
+from .colours import hex_to_lab
+from .yarn_units import DERIVED_FIELDS, WEIGHT_CATEGORIES, derived_fields
+
 class Tag(models.Model):
     user = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -11,6 +14,8 @@ class Tag(models.Model):
         null=False,
     )
     name = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ["name"]
@@ -67,6 +72,26 @@ class Yarn(models.Model):
         help_text="How many skeins of this yarn you own (optional)",
     )
 
+    # Parsed from weight / amount_per_skein on save (see api.yarn_units).
+    grams_per_skein = models.DecimalField(
+        max_digits=8, decimal_places=2, null=True, blank=True, editable=False, db_index=True
+    )
+    yards_per_skein = models.DecimalField(
+        max_digits=8, decimal_places=2, null=True, blank=True, editable=False, db_index=True
+    )
+    meters_per_skein = models.DecimalField(
+        max_digits=8, decimal_places=2, null=True, blank=True, editable=False, db_index=True
+    )
+    weight_category = models.CharField(
+        max_length=16, choices=WEIGHT_CATEGORIES, blank=True, editable=False, db_index=True
+    )
+    # CIELAB coordinates of `colour`, for similarity search (see api.colour_index).
+    lab_l = models.FloatField(null=True, blank=True, editable=False)
+    lab_a = models.FloatField(null=True, blank=True, editable=False)
+    lab_b = models.FloatField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
     class Meta:
         constraints = [
             models.UniqueConstraint(
@@ -85,6 +110,27 @@ class Yarn(models.Model):
     def __str__(self):
         return f"{self.brand} - {self.colour} ({self.weight})"
 
+    def refresh_derived_fields(self):
+        """
+        Re-parse the numeric/canonical columns from the label text. Bulk
+        writes, which skip save(), call this on each instance themselves.
+        """
+        for name, value in derived_fields(self.weight, self.amount_per_skein).items():
+            setattr(self, name, value)
+        self.lab_l, self.lab_a, self.lab_b = hex_to_lab(self.colour) or (None, None, None)
+
+    def save(self, *args, **kwargs):
+        self.refresh_derived_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if {"weight", "amount_per_skein"} & update_fields:
+                update_fields |= set(DERIVED_FIELDS)
+            if "colour" in update_fields:
+                update_fields |= {"lab_l", "lab_a", "lab_b"}
+            kwargs["update_fields"] = update_fields
+        super().save(*args, **kwargs)
+
 
 class Project(models.Model):
     user = models.ForeignKey(
@@ -111,6 +157,14 @@ class Project(models.Model):
     pattern_text = models.TextField(blank=True)
     notes = models.TextField(blank=True)
     main_image = models.ImageField(upload_to="projects/main/", null=True, blank=True)
+    main_image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Resized WebP/JPEG renditions of main_image (see api.images)",
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -131,11 +185,72 @@ class ProjectProgress(models.Model):
     rows_completed = models.PositiveIntegerField()
     stitches_completed = models.PositiveIntegerField()
     notes = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["project", "date"], name="progress_project_date_idx"),
+        ]
 
     def __str__(self):
         return f"{self.project.name} - {self.rows_completed} rows on {self.date.date()}"
 
 
+class ProjectDailyStats(models.Model):
+    """
+    Per-project, per-day sums of ProjectProgress, bucketed in TIME_ZONE.
+    Maintained incrementally by api.rollups; `manage.py rebuild_rollups`
+    recomputes it from scratch.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="daily_stats")
+    day = models.DateField()
+    rows = models.BigIntegerField(default=0)
+    stitches = models.BigIntegerField(default=0)
+    entries = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["project", "day"], name="uniq_project_daily_stats"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "day"], name="daily_stats_user_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.project_id} {self.day}: {self.entries} entries"
+
+
+class SearchDocument(models.Model):
+    """
+    Flattened searchable text of one project, progress entry or yarn,
+    kept in sync by api.search. The migration adds the actual index: a
+    generated tsvector column with a GIN index on Postgres, an FTS5 table
+    fed by triggers on SQLite.
+    """
+    PROJECT, PROGRESS, YARN = "project", "progress", "yarn"
+    KIND_CHOICES = [(PROJECT, "Project"), (PROGRESS, "Progress"), (YARN, "Yarn")]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    parent_id = models.BigIntegerField(null=True, blank=True, help_text="Project of a progress entry")
+    title = models.CharField(max_length=300)
+    body = models.TextField(blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "object_id"], name="uniq_search_document"),
+        ]
+        indexes = [
+            models.Index(fields=["kind", "parent_id"], name="search_doc_parent_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id}: {self.title}"
+
+
 class ProgressImage(models.Model):
     progress = models.ForeignKey(
         ProjectProgress, related_name="images", on_delete=models.CASCADE
@@ -143,7 +258,13 @@ class ProgressImage(models.Model):
     #image = models.ImageField(upload_to="projects/progress/")
     image = models.ImageField(upload_to="progress/")
     caption = models.CharField(max_length=200, blank=True)
-    created = models.DateTimeField(auto_now_add=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text="Resized WebP/JPEG renditions of image (see api.images)",
+    )
 
     def __str__(self):
         return f"Image for {self.progress_id}"
@@ -162,6 +283,8 @@ class ProjectYarn(models.Model):
     quantity_used_grams = models.DecimalField(
         max_digits=6, decimal_places=2, null=True, blank=True
     )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         constraints = [
@@ -173,3 +296,98 @@ class ProjectYarn(models.Model):
     def __str__(self):
         used = self.quantity_used_grams or self.quantity_used_skeins or "?"
         return f"{self.project.name} used {used} of {self.yarn}"
+
+
+class Tombstone(models.Model):
+    """
+    Marks a deleted row so incremental backups can replay the delete.
+    Rows removed by cascade aren't recorded separately: the tombstone of
+    the object that was deleted implies its children went with it.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
+    )
+    kind = models.CharField(max_length=32)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "deleted_at"], name="tombstone_user_deleted_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.object_id} deleted {self.deleted_at:%Y-%m-%d}"
+
+
+class DataVersion(models.Model):
+    """
+    Per-user change counter, bumped on every write to the user's api data
+    (see api.versioning). Cheap to read, so views can answer conditional
+    GETs without touching the real tables.
+    """
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="data_version",
+    )
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"user {self.user_id} v{self.version}"
+
+
+class Task(models.Model):
+    """
+    A unit of background work, run by `manage.py run_worker`. See api.tasks.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (DONE, "Done"),
+        (FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=200, help_text="Dotted path of the task function")
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_at"], name="task_status_run_at_idx"),
+            models.Index(fields=["status", "locked_until"], name="task_status_locked_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.status}]"
+
+
+class MetricsSnapshot(models.Model):
+    """
+    One server process's cumulative request metrics, written periodically by
+    api.metrics so the metrics endpoint can sum every worker's numbers.
+    """
+    worker = models.CharField(max_length=100, unique=True, help_text="host:pid:start time")
+    data = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.worker
@@ -0,0 +1,121 @@
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination that filters on the *whole* ordering tuple instead of
+    only its first column, so every page is a plain indexed range query.
+
+    The ordering defaults to the view queryset's own `order_by(...)` with the
+    primary key appended as a tie-breaker, which makes every position unique
+    and keeps the cursor offset at zero no matter how deep the client pages
+    (e.g. many yarns sharing one brand).
+    """
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    ordering = "-id"
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, "keyset_ordering", None)
+        if ordering is None:
+            ordering = tuple(queryset.query.order_by) or (self.ordering,)
+        ordering = tuple(ordering)
+        names = {o.lstrip("-") for o in ordering}
+        if not names & {"id", "pk"}:
+            last_desc = ordering[-1].startswith("-")
+            ordering += ("-id" if last_desc else "id",)
+        assert not any("__" in o for o in ordering), (
+            "Keyset pagination orders on local columns only."
+        )
+        return ordering
+
+    def _get_position_from_instance(self, instance, ordering):
+        values = []
+        for order in ordering:
+            name = order.lstrip("-")
+            attr = instance[name] if isinstance(instance, dict) else getattr(instance, name)
+            values.append(str(attr))
+        return json.dumps(values, separators=(",", ":"))
+
+    def _decode_position(self, position):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _keyset_filter(self, values, reverse):
+        """
+        Rows strictly after `values` in (possibly reversed) ordering, written
+        out lexicographically: a > x OR (a = x AND b > y) OR ...
+        """
+        condition = None
+        equal = Q()
+        for order, value in zip(self.ordering, values):
+            name = order.lstrip("-")
+            lookup = "lt" if reverse != order.startswith("-") else "gt"
+            clause = equal & Q(**{f"{name}__{lookup}": value})
+            condition = clause if condition is None else condition | clause
+            equal &= Q(**{name: value})
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            (offset, reverse, current_position) = (0, False, None)
+        else:
+            (offset, reverse, current_position) = self.cursor
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            values = self._decode_position(current_position)
+            queryset = queryset.filter(self._keyset_filter(values, reverse))
+
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = list(results[:self.page_size])
+
+        if len(results) > len(self.page):
+            has_following_position = True
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            has_following_position = False
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = (current_position is not None) or (offset > 0)
+            self.has_previous = has_following_position
+            if self.has_next:
+                self.next_position = current_position
+            if self.has_previous:
+                self.previous_position = following_position
+        else:
+            self.has_next = has_following_position
+            self.has_previous = (current_position is not None) or (offset > 0)
+            if self.has_next:
+                self.next_position = following_position
+            if self.has_previous:
+                self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
@@ -0,0 +1,77 @@
+"""
+Cache for serialized GET responses of the owned viewsets.
+
+Entries are keyed by user, their current DataVersion, the absolute URL
+(path + query params) and the Accept header. Any write to the user's data
+bumps the version through the post_save/post_delete/m2m_changed handlers in
+api.signals, so stale entries are never read again and simply age out. Since
+the version lives in the database, this stays correct with per-process
+backends (locmem, file) as well as shared ones (Redis).
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+
+STATS_KEYS = ("hits", "misses", "stores")
+_PREFIX = "respcache"
+
+
+def _cache():
+    return caches[getattr(settings, "RESPONSE_CACHE_ALIAS", "default")]
+
+
+def timeout():
+    return getattr(settings, "RESPONSE_CACHE_TIMEOUT", 300)
+
+
+def enabled():
+    return timeout() > 0
+
+
+def key_for(request, version):
+    raw = "|".join([
+        request.build_absolute_uri(),
+        request.META.get("HTTP_ACCEPT", ""),
+    ])
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    return f"{_PREFIX}:{request.user.pk}:{version}:{digest}"
+
+
+def get(key):
+    entry = _cache().get(key)
+    _count("hits" if entry is not None else "misses")
+    return entry
+
+
+def put(key, data, status_code):
+    _cache().set(key, (data, status_code), timeout())
+    _count("stores")
+
+
+def _count(name):
+    cache = _cache()
+    key = f"{_PREFIX}:stats:{name}"
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Missing (or evicted); add() loses no increments to a racing worker.
+        if not cache.add(key, 1, timeout=None):
+            try:
+                cache.incr(key)
+            except ValueError:
+                pass
+
+
+def stats():
+    values = _cache().get_many([f"{_PREFIX}:stats:{n}" for n in STATS_KEYS])
+    out = {n: values.get(f"{_PREFIX}:stats:{n}", 0) for n in STATS_KEYS}
+    lookups = out["hits"] + out["misses"]
+    out["hit_ratio"] = round(out["hits"] / lookups, 4) if lookups else None
+    out["backend"] = settings.CACHES[getattr(settings, "RESPONSE_CACHE_ALIAS", "default")]["BACKEND"]
+    out["timeout"] = timeout()
+    return out
+
+
+def reset_stats():
+    _cache().delete_many([f"{_PREFIX}:stats:{n}" for n in STATS_KEYS])
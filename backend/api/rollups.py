@@ -0,0 +1,115 @@
+"""
+ProjectDailyStats maintenance.
+
+Saving or deleting a ProjectProgress applies its rows/stitches/entry count
+as a delta to the (project, day) rollup row with a single UPDATE ... SET
+x = x + n, so concurrent writers never lose increments. Days are bucketed in
+the default TIME_ZONE; after changing it, run `manage.py rebuild_rollups`.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import ProjectDailyStats, ProjectProgress
+
+
+def day_for(value):
+    return timezone.localdate(value, timezone.get_default_timezone())
+
+
+def snapshot(progress):
+    """
+    The rollup-relevant state of a progress entry: (project_id, day, rows, stitches).
+    """
+    return (progress.project_id, day_for(progress.date), progress.rows_completed, progress.stitches_completed)
+
+
+def apply(user_id, state, sign=1, entries=1):
+    """
+    Add (sign=1) or remove (sign=-1) one entry's totals, or the summed
+    totals of `entries` entries on the same project and day.
+    """
+    project_id, day, rows, stitches = state
+    deltas = {
+        "rows": F("rows") + sign * rows,
+        "stitches": F("stitches") + sign * stitches,
+        "entries": F("entries") + sign * entries,
+    }
+    row = ProjectDailyStats.objects.filter(project_id=project_id, day=day)
+    if row.update(**deltas):
+        if sign < 0:
+            row.filter(entries__lte=0).delete()
+        return
+    if sign < 0:
+        # Nothing to subtract from (e.g. never rolled up); rebuild repairs it.
+        return
+    try:
+        with transaction.atomic():
+            ProjectDailyStats.objects.create(
+                user_id=user_id, project_id=project_id, day=day,
+                rows=rows, stitches=stitches, entries=entries,
+            )
+    except IntegrityError:
+        row.update(**deltas)
+
+
+def apply_many(user_id, states):
+    """
+    Add many new entries, with one UPDATE (or INSERT) per project and day.
+    """
+    totals = {}
+    for project_id, day, rows, stitches in states:
+        t = totals.setdefault((project_id, day), [0, 0, 0])
+        t[0] += rows
+        t[1] += stitches
+        t[2] += 1
+    for (project_id, day), (rows, stitches, entries) in totals.items():
+        apply(user_id, (project_id, day, rows, stitches), entries=entries)
+
+
+def move(user_id, old, new):
+    """
+    Re-apply an edited entry: old state out, new state in.
+    """
+    if old == new:
+        return
+    if old is not None:
+        apply(user_id, old, sign=-1)
+    apply(user_id, new)
+
+
+def rebuild(user=None, project_ids=None):
+    """
+    Recompute rollups from ProjectProgress, for everything or for one user's
+    / some projects' rows only. Returns the number of rollup rows written.
+    """
+    progress = ProjectProgress.objects.all()
+    stats = ProjectDailyStats.objects.all()
+    if user is not None:
+        progress = progress.filter(project__user=user)
+        stats = stats.filter(user=user)
+    if project_ids is not None:
+        progress = progress.filter(project_id__in=project_ids)
+        stats = stats.filter(project_id__in=project_ids)
+
+    totals = (
+        progress
+        .annotate(day=TruncDate("date", tzinfo=timezone.get_default_timezone()))
+        .values("project_id", "project__user_id", "day")
+        .annotate(rows=Sum("rows_completed"), stitches=Sum("stitches_completed"), entries=Count("id"))
+        .order_by()
+    )
+    with transaction.atomic():
+        stats.delete()
+        objs = ProjectDailyStats.objects.bulk_create(
+            (
+                ProjectDailyStats(
+                    user_id=t["project__user_id"], project_id=t["project_id"], day=t["day"],
+                    rows=t["rows"], stitches=t["stitches"], entries=t["entries"],
+                )
+                for t in totals.iterator()
+            ),
+            batch_size=1000,
+        )
+    return len(objs)
@@ -0,0 +1,229 @@
+"""
+Full-text search over projects, progress notes and yarns.
+
+Each searchable object has one SearchDocument row (title + body text),
+updated from signals in api.signals. Matching and ranking run in the
+database:
+
+  * Postgres: `search_vector`, a generated tsvector column (title weighted A,
+    body B) with a GIN index; websearch_to_tsquery + ts_rank_cd + ts_headline.
+  * SQLite: the `api_searchdocument_fts` FTS5 table, synced by triggers;
+    bm25() + snippet().
+  * anything else: icontains over the documents, unranked.
+
+Highlights come back as HTML-escaped text with <mark> around the hits.
+"""
+import html
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape, strip_tags
+
+from .models import Project, ProjectProgress, SearchDocument, Yarn
+
+SEARCH_CONFIG = "english"
+FTS_TABLE = "api_searchdocument_fts"
+MAX_RESULTS = 100
+
+# Highlight delimiters that can't occur in user text; swapped for <mark>
+# after escaping.
+_START, _STOP = "\ue000", "\ue001"
+
+# Model -> (kind, fields whose change requires reindexing)
+INDEXED = {
+    Project: (SearchDocument.PROJECT, {"name", "notes", "pattern_text"}),
+    ProjectProgress: (SearchDocument.PROGRESS, {"notes", "project"}),
+    Yarn: (SearchDocument.YARN, {"brand", "colour_name", "weight", "material"}),
+}
+
+
+def plain_text(value):
+    """
+    Sanitized rich text -> plain words.
+    """
+    return html.unescape(strip_tags(value or "")).strip()
+
+
+def document_for(kind, obj):
+    """
+    Field values of the SearchDocument describing `obj`.
+    """
+    if kind == SearchDocument.PROJECT:
+        return {
+            "user_id": obj.user_id, "parent_id": None, "title": obj.name,
+            "body": "\n".join(filter(None, [obj.notes, plain_text(obj.pattern_text)])),
+        }
+    if kind == SearchDocument.PROGRESS:
+        return {
+            "user_id": obj.project.user_id, "parent_id": obj.project_id,
+            "title": obj.project.name, "body": obj.notes or "",
+        }
+    return {
+        "user_id": obj.user_id, "parent_id": None,
+        "title": " ".join(filter(None, [obj.brand, obj.colour_name])),
+        "body": " ".join(filter(None, [obj.weight, obj.material])),
+    }
+
+
+def index(obj, update_fields=None):
+    kind, fields = INDEXED[type(obj)]
+    if update_fields is not None and not fields & set(update_fields):
+        return
+    values = document_for(kind, obj)
+    SearchDocument.objects.update_or_create(kind=kind, object_id=obj.pk, defaults=values)
+    if kind == SearchDocument.PROJECT:
+        # Progress documents carry their project's name as the title.
+        SearchDocument.objects.filter(kind=SearchDocument.PROGRESS, parent_id=obj.pk).exclude(
+            title=obj.name
+        ).update(title=obj.name)
+
+
+def index_many(objs, batch_size=1000):
+    """
+    index() for rows written in bulk, which skip signals. Only for yarns and
+    progress: a project's progress titles aren't refreshed here.
+    """
+    objs = list(objs)
+    if not objs:
+        return 0
+    kind, _ = INDEXED[type(objs[0])]
+    SearchDocument.objects.filter(kind=kind, object_id__in=[obj.pk for obj in objs]).delete()
+    docs = [SearchDocument(kind=kind, object_id=obj.pk, **document_for(kind, obj)) for obj in objs]
+    return len(SearchDocument.objects.bulk_create(docs, batch_size=batch_size))
+
+
+def remove(obj):
+    kind, _ = INDEXED[type(obj)]
+    docs = Q(kind=kind, object_id=obj.pk)
+    if kind == SearchDocument.PROJECT:
+        docs |= Q(kind=SearchDocument.PROGRESS, parent_id=obj.pk)
+    SearchDocument.objects.filter(docs).delete()
+
+
+def reindex(user=None, batch_size=1000):
+    """
+    Rebuild the documents of one user (or everyone). Returns the count.
+    """
+    sources = [
+        (SearchDocument.PROJECT, Project.objects.all(), "user"),
+        (SearchDocument.PROGRESS, ProjectProgress.objects.select_related("project"), "project__user"),
+        (SearchDocument.YARN, Yarn.objects.all(), "user"),
+    ]
+    docs = SearchDocument.objects.all()
+    if user is not None:
+        docs = docs.filter(user=user)
+    docs.delete()
+    total = 0
+    for kind, qs, owner in sources:
+        if user is not None:
+            qs = qs.filter(**{owner: user})
+        batch = []
+        for obj in qs.order_by("pk").iterator(chunk_size=batch_size):
+            batch.append(SearchDocument(kind=kind, object_id=obj.pk, **document_for(kind, obj)))
+            if len(batch) >= batch_size:
+                total += len(SearchDocument.objects.bulk_create(batch))
+                batch = []
+        total += len(SearchDocument.objects.bulk_create(batch))
+    return total
+
+
+def _fts5_available():
+    with connection.cursor() as cursor:
+        return FTS_TABLE in connection.introspection.table_names(cursor)
+
+
+def _highlight(text):
+    return escape(text or "").replace(_START, "<mark>").replace(_STOP, "</mark>")
+
+
+def _fts5_query(q):
+    """
+    User input -> safe FTS5 MATCH expression: every word quoted (so operators
+    and punctuation are literal), the last one as a prefix for type-ahead.
+    """
+    words = re.findall(r"\w+", q)
+    if not words:
+        return None
+    terms = ['"%s"' % w for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(user, q, kinds=None, limit=20):
+    """
+    [{"kind", "id", "project", "title", "snippet", "rank"}], best match first.
+    """
+    limit = max(1, min(limit, MAX_RESULTS))
+    kinds = list(kinds or [k for k, _ in SearchDocument.KIND_CHOICES])
+    if connection.vendor == "postgresql":
+        rows = _search_postgres(user.pk, q, kinds, limit)
+    elif connection.vendor == "sqlite" and _fts5_available():
+        rows = _search_sqlite(user.pk, q, kinds, limit)
+    else:
+        rows = _search_fallback(user.pk, q, kinds, limit)
+    return [
+        {
+            "kind": kind, "id": object_id, "project": parent_id,
+            "title": _highlight(title), "snippet": _highlight(snippet), "rank": round(rank, 4),
+        }
+        for kind, object_id, parent_id, title, snippet, rank in rows
+    ]
+
+
+def _search_postgres(user_id, q, kinds, limit):
+    headline_opts = f"StartSel={_START},StopSel={_STOP},MaxWords=30,MinWords=10,MaxFragments=2"
+    sql = f"""
+        SELECT kind, object_id, parent_id,
+               ts_headline(%s, title, query, %s),
+               ts_headline(%s, body, query, %s),
+               rank
+        FROM (
+            SELECT d.kind, d.object_id, d.parent_id, d.title, d.body, query,
+                   ts_rank_cd(d.search_vector, query) AS rank
+            FROM api_searchdocument d, websearch_to_tsquery(%s, %s) query
+            WHERE d.search_vector @@ query AND d.user_id = %s AND d.kind = ANY(%s)
+            ORDER BY rank DESC, d.id
+            LIMIT %s
+        ) hits
+        ORDER BY rank DESC
+    """
+    params = [
+        SEARCH_CONFIG, "HighlightAll=true," + headline_opts, SEARCH_CONFIG, headline_opts,
+        SEARCH_CONFIG, q, user_id, kinds, limit,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _search_sqlite(user_id, q, kinds, limit):
+    match = _fts5_query(q)
+    if match is None:
+        return []
+    placeholders = ", ".join(["%s"] * len(kinds))
+    sql = f"""
+        SELECT d.kind, d.object_id, d.parent_id,
+               highlight({FTS_TABLE}, 0, %s, %s),
+               snippet({FTS_TABLE}, 1, %s, %s, '…', 24),
+               -bm25({FTS_TABLE}, 10.0, 1.0) AS rank
+        FROM {FTS_TABLE} JOIN api_searchdocument d ON d.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH %s AND d.user_id = %s AND d.kind IN ({placeholders})
+        ORDER BY rank DESC, d.id
+        LIMIT %s
+    """
+    params = [_START, _STOP, _START, _STOP, match, user_id, *kinds, limit]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _search_fallback(user_id, q, kinds, limit):
+    words = re.findall(r"\w+", q)
+    if not words:
+        return []
+    cond = Q()
+    for w in words:
+        cond &= Q(title__icontains=w) | Q(body__icontains=w)
+    docs = SearchDocument.objects.filter(cond, user_id=user_id, kind__in=kinds).order_by("id")[:limit]
+    return [(d.kind, d.object_id, d.parent_id, d.title, d.body[:200], 0.0) for d in docs]
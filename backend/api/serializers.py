@@ -2,9 +2,8 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-import bleach
-from bs4 import BeautifulSoup
 
+from . import images, sanitize, tagging
 from .models import (
     Project, Tag, Yarn, ProjectYarn, ProjectProgress, ProgressImage
 )
@@ -87,36 +86,103 @@ class ChangePasswordSerializer(serializers.Serializer):
         return attrs
 
 
-BASE_TAGS = set(bleach.sanitizer.ALLOWED_TAGS)
-ALLOWED_TAGS = BASE_TAGS.union({
-    "p", "span", "pre", "code", "blockquote", "h2", "h3", "ul", "ol", "li", "strong", "em", "a"
-})
-BASE_ATTRS = dict(bleach.sanitizer.ALLOWED_ATTRIBUTES)
-ALLOWED_ATTRS = {
-    **BASE_ATTRS,
-    "a": ["href", "title", "target", "rel"],
-    "code": ["class"],
-}
-ALLOWED_PROTOCOLS = bleach.sanitizer.ALLOWED_PROTOCOLS.union({"http", "https", "mailto"})
-
-def _enforce_link_attrs(html: str) -> str:
-    soup = BeautifulSoup(html, "html.parser")
-    for a in soup.find_all("a", href=True):
-        a["target"] = "_blank"
-        rel_parts = set(a.get("rel", []))
-        rel_parts.update(["noopener", "nofollow"])
-        a["rel"] = list(rel_parts)
-    return str(soup)
-
-cleaner = bleach.Cleaner(
-    tags=ALLOWED_TAGS,
-    attributes=ALLOWED_ATTRS,
-    protocols=ALLOWED_PROTOCOLS,
-    strip=True,
-)
+def parse_field_tree(raw) -> dict:
+    """
+    "id,name,progress_updates.date" -> {"id": {}, "name": {}, "progress_updates": {"date": {}}}
+    """
+    tree = {}
+    for path in (raw or "").split(","):
+        node = tree
+        for part in path.strip().split("."):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def _nested_serializer(field):
+    if isinstance(field, serializers.ListSerializer):
+        field = field.child
+    return field if isinstance(field, serializers.Serializer) else None
+
+
+def select_fields(serializer, fields_tree, expand_tree) -> dict:
+    """
+    Work out which fields `serializer` renders for the given `?fields=` and
+    `?expand=` trees. Returns {name: child_selection} where child_selection is
+    a dict for nested serializers and None for plain fields.
+
+    With neither parameter everything is rendered. `expand` alone keeps every
+    plain field and only the listed Meta.expandable_fields relations.
+    """
+    declared = serializer.fields
+    expandable = set(getattr(serializer.Meta, "expandable_fields", ()))
+    if fields_tree:
+        keep = [n for n in declared if n in fields_tree or n in expand_tree]
+    elif expand_tree:
+        keep = [n for n in declared if n not in expandable or n in expand_tree]
+    else:
+        keep = list(declared)
+
+    selection = {}
+    for name in keep:
+        child = _nested_serializer(declared[name])
+        if child is None:
+            selection[name] = None
+        else:
+            selection[name] = select_fields(
+                child, fields_tree.get(name, {}), expand_tree.get(name, {})
+            )
+    return selection
+
+
+def request_selection(serializer_class, request) -> dict:
+    """
+    The field selection `serializer_class` will render for `request`; views
+    use it to avoid prefetching relations nobody asked for.
+    """
+    fields_tree, expand_tree = SparseFieldsMixin.trees_from_request(request)
+    return select_fields(serializer_class(), fields_tree, expand_tree)
+
+
+class SparseFieldsMixin:
+    """
+    Honour `?fields=a,b,rel.c` and `?expand=rel` on safe requests.
+    Only the outermost serializer reads the query string; nested serializers
+    are pruned from there.
+    """
+
+    @staticmethod
+    def trees_from_request(request):
+        if request is None or request.method not in ("GET", "HEAD", "OPTIONS"):
+            return {}, {}
+        params = request.query_params
+        return parse_field_tree(params.get("fields")), parse_field_tree(params.get("expand"))
+
+    def _is_outermost(self):
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def _prune(self, selection):
+        for name in list(self.fields):
+            if name not in selection:
+                self.fields.pop(name)
+                continue
+            child = _nested_serializer(self.fields[name])
+            if child is not None and isinstance(child, SparseFieldsMixin):
+                child._prune(selection[name])
+
+    def to_representation(self, instance):
+        if self._is_outermost() and not getattr(self, "_sparse_applied", False):
+            self._sparse_applied = True
+            fields_tree, expand_tree = self.trees_from_request(self.context.get("request"))
+            if fields_tree or expand_tree:
+                self._prune(select_fields(self, fields_tree, expand_tree))
+        return super().to_representation(instance)
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     project_count = serializers.IntegerField(read_only=True)
 
@@ -125,8 +191,12 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ["id", "user", "name", "project_count"]
 
 
-class YarnSerializer(serializers.ModelSerializer):
+class YarnSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
+    # Stock annotations from YarnViewSet; omitted where the queryset lacks them.
+    used_skeins = serializers.DecimalField(max_digits=9, decimal_places=2, read_only=True)
+    remaining_skeins = serializers.DecimalField(max_digits=9, decimal_places=2, read_only=True)
+    project_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Yarn
@@ -141,24 +211,35 @@ class YarnSerializer(serializers.ModelSerializer):
             "amount_per_skein",
             "product_link",
             "quantity_owned_skeins",
+            "grams_per_skein",
+            "yards_per_skein",
+            "meters_per_skein",
+            "weight_category",
+            "used_skeins",
+            "remaining_skeins",
+            "project_count",
         ]
+        read_only_fields = ["grams_per_skein", "yards_per_skein", "meters_per_skein", "weight_category"]
 
 
-class ProjectYarnSerializer(serializers.ModelSerializer):
+class ProjectYarnSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     yarn = YarnSerializer()
 
     class Meta:
         model = ProjectYarn
         fields = ["id", "yarn", "quantity_used_skeins"]
+        expandable_fields = ["yarn"]
 
 
-class ProjectYarnLinkSerializer(serializers.ModelSerializer):
+class ProjectYarnLinkSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     project = serializers.PrimaryKeyRelatedField(queryset=Project.objects.all())
     yarn = serializers.PrimaryKeyRelatedField(queryset=Yarn.objects.all())
+    # Skeins, or grams converted via the yarn's grams_per_skein (annotated on reads).
+    skeins_equivalent = serializers.DecimalField(max_digits=9, decimal_places=2, read_only=True)
 
     class Meta:
         model = ProjectYarn
-        fields = ["id", "project", "yarn", "quantity_used_skeins"]
+        fields = ["id", "project", "yarn", "quantity_used_skeins", "quantity_used_grams", "skeins_equivalent"]
 
     def validate(self, attrs):
         u = self.context["request"].user
@@ -171,12 +252,22 @@ class ProjectYarnLinkSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class ProgressImageSerializer(serializers.ModelSerializer):
+def _srcset_for(serializer, variants, fieldfile):
+    request = serializer.context.get("request")
+    build_url = request.build_absolute_uri if request else (lambda url: url)
+    return images.srcset(variants, fieldfile, build_url)
+
+
+class ProgressImageSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     image = serializers.ImageField(use_url=True) 
+    image_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ProgressImage
-        fields = ["id", "image", "caption", "created"]
+        fields = ["id", "image", "image_srcset", "caption", "created"]
+
+    def get_image_srcset(self, obj):
+        return _srcset_for(self, obj.variants, obj.image)
 
     def to_representation(self, instance):
         data = super().to_representation(instance)
@@ -185,18 +276,34 @@ class ProgressImageSerializer(serializers.ModelSerializer):
             data["image"] = request.build_absolute_uri(instance.image.url)
         return data
 
-class ProjectProgressSerializer(serializers.ModelSerializer):
+class ProjectProgressSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     project = serializers.PrimaryKeyRelatedField(queryset=Project.objects.all(), required=True)
     images = ProgressImageSerializer(many=True, read_only=True)
 
     class Meta:
         model = ProjectProgress
         fields = ["id", "project", "date", "rows_completed", "stitches_completed", "notes", "images"]
+        expandable_fields = ["images"]
 
 
-class ProjectSerializer(serializers.ModelSerializer):
+class ProgressBatchEntrySerializer(serializers.ModelSerializer):
+    """
+    One entry of a /progress/batch/ upload. `project` is a bare id (checked
+    for ownership once for the whole batch); `images` names the multipart
+    file fields holding the entry's photos.
+    """
+    project = serializers.IntegerField()
+    images = serializers.ListField(child=serializers.CharField(), required=False, default=list)
+
+    class Meta:
+        model = ProjectProgress
+        fields = ["project", "date", "rows_completed", "stitches_completed", "notes", "images"]
+
+
+class ProjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(read_only=True)
     main_image = serializers.ImageField(required=False, allow_null=True)
+    main_image_srcset = serializers.SerializerMethodField()
     tags = TagSerializer(many=True, read_only=True)
 
     tag_names = serializers.ListField(
@@ -216,16 +323,19 @@ class ProjectSerializer(serializers.ModelSerializer):
             "needle_or_hook_size",
             "yarns",
             "pattern_link", "pattern_text", "notes",
-            "main_image",
+            "main_image", "main_image_srcset",
             "progress_updates",
         ]
+        expandable_fields = ["tags", "yarns", "progress_updates"]
+
+    def get_main_image_srcset(self, obj):
+        return _srcset_for(self, obj.main_image_variants, obj.main_image)
 
     def validate(self, attrs):
         html = attrs.get("pattern_text")
-        if html is not None:
-            cleaned = cleaner.clean(html)
-            cleaned = _enforce_link_attrs(cleaned)
-            attrs["pattern_text"] = cleaned
+        # The stored text is already clean; only new text needs sanitizing.
+        if html is not None and (self.instance is None or html != self.instance.pattern_text):
+            attrs["pattern_text"] = sanitize.clean_pattern(html)
         return super().validate(attrs)
 
     def validate_tag_names(self, names):
@@ -245,24 +355,24 @@ class ProjectSerializer(serializers.ModelSerializer):
         return cleaned
 
     def _apply_tag_names(self, project: Project, names):
-        if not names:
-            return
+        """
+        Make `names` the project's tag list. tags.set() diffs against the
+        current links, so unchanged tags aren't removed and re-added.
+        """
         user = self.context["request"].user
-        for n in names:
-            tag, _ = Tag.objects.get_or_create(user=user, name=n)
-            project.tags.add(tag)
+        project.tags.set(tagging.ensure_tags(user, names))
 
     def create(self, validated_data):
         tag_names = validated_data.pop("tag_names", [])
         project = super().create(validated_data) 
-        self._apply_tag_names(project, tag_names)
+        if tag_names:
+            self._apply_tag_names(project, tag_names)
         return project
 
     def update(self, instance, validated_data):
         tag_names = validated_data.pop("tag_names", None)
         project = super().update(instance, validated_data)
         if tag_names is not None:
-            project.tags.clear()
             self._apply_tag_names(project, tag_names)
         return project
 
@@ -0,0 +1,127 @@
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import colour_index, metrics, rollups, search, versioning
+from .models import Project, Tag, Yarn, ProjectYarn, ProjectProgress, ProgressImage, Tombstone
+
+# Record type used in backups -> how to find the owning user.
+TRACKED = {
+    Tag: ("tag", lambda obj: obj.user_id),
+    Yarn: ("yarn", lambda obj: obj.user_id),
+    Project: ("project", lambda obj: obj.user_id),
+    ProjectYarn: ("project_yarn", lambda obj: obj.project.user_id),
+    ProjectProgress: ("progress", lambda obj: obj.project.user_id),
+    ProgressImage: ("progress_image", lambda obj: obj.progress.project.user_id),
+}
+
+
+def _is_origin(sender, origin):
+    if isinstance(origin, QuerySet):
+        return origin.model is sender
+    return isinstance(origin, sender)
+
+
+def _owner_id(sender, instance):
+    try:
+        return TRACKED[sender][1](instance)
+    except (Project.DoesNotExist, ProjectProgress.DoesNotExist):
+        return None
+
+
+def record_tombstone(sender, instance, origin=None, **kwargs):
+    # Only the object (or queryset) delete() was called on gets a tombstone;
+    # cascaded children are implied by their parent's.
+    if not _is_origin(sender, origin):
+        return
+    user_id = _owner_id(sender, instance)
+    if user_id is None:
+        return
+    Tombstone.objects.create(user_id=user_id, kind=TRACKED[sender][0], object_id=instance.pk)
+    versioning.bump(user_id)
+
+
+def bump_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        versioning.bump(_owner_id(sender, instance))
+
+
+for _model in TRACKED:
+    post_delete.connect(record_tombstone, sender=_model, dispatch_uid=f"tombstone-{_model.__name__}")
+    post_save.connect(bump_on_save, sender=_model, dispatch_uid=f"data-version-{_model.__name__}")
+
+
+@receiver(m2m_changed, sender=Project.tags.through)
+def touch_projects_on_tag_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Tag links have no timestamp of their own; bump the project's instead so
+    incremental backups pick up its new tag list.
+    """
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if not reverse:
+        project_ids = [instance.pk]
+    elif pk_set:
+        project_ids = list(pk_set)
+    else:
+        return
+    Project.objects.filter(pk__in=project_ids).update(updated_at=timezone.now())
+    versioning.bump(instance.user_id)
+
+
+@receiver(pre_save, sender=ProjectProgress)
+def remember_progress_state(sender, instance, raw=False, **kwargs):
+    instance._rollup_old = None
+    if raw or instance._state.adding:
+        return
+    old = sender.objects.filter(pk=instance.pk).values_list(
+        "project_id", "date", "rows_completed", "stitches_completed"
+    ).first()
+    if old is not None:
+        instance._rollup_old = (old[0], rollups.day_for(old[1]), old[2], old[3])
+
+
+@receiver(post_save, sender=ProjectProgress)
+def roll_up_progress_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    user_id = _owner_id(sender, instance)
+    if user_id is not None:
+        rollups.move(user_id, getattr(instance, "_rollup_old", None), rollups.snapshot(instance))
+
+
+@receiver(post_delete, sender=ProjectProgress)
+def roll_up_progress_delete(sender, instance, origin=None, **kwargs):
+    # Deleting the project (or user) cascades to its rollup rows already.
+    if _is_origin(sender, origin):
+        rollups.apply(None, rollups.snapshot(instance), sign=-1)
+
+
+def index_for_search(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw:
+        search.index(instance, update_fields=update_fields)
+
+
+def unindex_for_search(sender, instance, origin=None, **kwargs):
+    # A deleted project removes its progress documents too; a deleted user's
+    # documents go with the user row.
+    if _is_origin(sender, origin):
+        search.remove(instance)
+
+
+for _model in search.INDEXED:
+    post_save.connect(index_for_search, sender=_model, dispatch_uid=f"search-index-{_model.__name__}")
+    post_delete.connect(unindex_for_search, sender=_model, dispatch_uid=f"search-unindex-{_model.__name__}")
+
+
+@receiver(post_save, sender=Yarn)
+@receiver(post_delete, sender=Yarn)
+def drop_colour_matrix(sender, instance, **kwargs):
+    colour_index.invalidate(instance.user_id)
+
+
+@receiver(connection_created)
+def count_db_connect(sender, connection, **kwargs):
+    metrics.connection_opened(connection)
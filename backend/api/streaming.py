@@ -0,0 +1,89 @@
+"""
+Streaming responses that suit both serving modes.
+
+Under gunicorn's sync workers (SERVER_MODE=wsgi) a StreamingHttpResponse
+holds its worker until the last byte has reached the client. Under uvicorn
+workers (SERVER_MODE=asgi) the event loop does the sending, but Django only
+streams *async* iterators there: a sync one is read into a list first, so a
+large backup would sit in memory whole.
+
+stream_response() therefore gives ASGI an async iterator fed by a dedicated
+thread. The thread runs the sync generator, database queries included, on
+its own connection, at most READ_AHEAD chunks ahead of the client, and
+waits while a slow client catches up. Nothing else waits on it, and it
+stops as soon as the client goes away.
+"""
+import asyncio
+import concurrent.futures
+import threading
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.http import StreamingHttpResponse
+
+READ_AHEAD = 8
+
+_DONE = object()
+
+
+def is_asgi(request):
+    return isinstance(getattr(request, "_request", request), ASGIRequest)
+
+
+async def from_thread(iterable, read_ahead=READ_AHEAD):
+    """
+    Yield the items of a sync iterable, produced in a thread of its own.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(read_ahead)
+    stopped = threading.Event()
+
+    def put(item):
+        try:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+        except RuntimeError:  # loop closed
+            return False
+        while not stopped.is_set():
+            try:
+                future.result(timeout=1)
+                return True
+            except concurrent.futures.TimeoutError:
+                continue
+        future.cancel()
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(_DONE)
+        except Exception as exc:
+            put(exc)
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+            connections.close_all()
+
+    threading.Thread(target=produce, name="stream-producer", daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stopped.set()
+
+
+def stream_response(request, chunks, **kwargs):
+    """
+    StreamingHttpResponse over `chunks` (a sync iterable), made async under
+    ASGI as described above.
+    """
+    if is_asgi(request):
+        chunks = from_thread(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
@@ -0,0 +1,104 @@
+"""
+Set-based tag operations.
+
+Each function runs a fixed number of statements against Tag and the
+Project.tags through-table, however many projects or tags it touches.
+Writes to the through-table here bypass m2m_changed, so they do what
+api.signals.touch_projects_on_tag_change would: bump the affected
+projects' updated_at (for incremental backups) and the user's data version.
+"""
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from . import versioning
+from .models import Project, Tag
+
+ProjectTag = Project.tags.through
+
+
+def ensure_tags(user, names):
+    """
+    The user's tags called `names`, creating any that are missing.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return []
+    existing = {t.name: t for t in Tag.objects.filter(user=user, name__in=names)}
+    missing = [Tag(user=user, name=n) for n in names if n not in existing]
+    if missing:
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        existing = {t.name: t for t in Tag.objects.filter(user=user, name__in=names)}
+    return [existing[n] for n in names if n in existing]
+
+
+def _touch(user, project_ids):
+    if project_ids:
+        Project.objects.filter(pk__in=project_ids).update(updated_at=timezone.now())
+    versioning.bump(user.pk)
+
+
+@transaction.atomic
+def add(user, project_ids, tag_ids):
+    """
+    Tag every project with every tag. Returns the number of new links.
+    """
+    project_ids, tag_ids = set(project_ids), set(tag_ids)
+    existing = set(
+        ProjectTag.objects.filter(project_id__in=project_ids, tag_id__in=tag_ids)
+        .values_list("project_id", "tag_id")
+    )
+    links = [
+        ProjectTag(project_id=p, tag_id=t)
+        for p in project_ids for t in tag_ids if (p, t) not in existing
+    ]
+    ProjectTag.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+    _touch(user, {link.project_id for link in links})
+    return len(links)
+
+
+@transaction.atomic
+def remove(user, project_ids, tag_ids):
+    """
+    Untag every project. Returns the number of links removed.
+    """
+    links = ProjectTag.objects.filter(project_id__in=set(project_ids), tag_id__in=set(tag_ids))
+    touched = set(links.values_list("project_id", flat=True))
+    removed, _ = links.delete()
+    _touch(user, touched)
+    return removed
+
+
+@transaction.atomic
+def merge(user, source, target):
+    """
+    Move `source`'s projects onto `target` and delete `source`. Returns the
+    number of projects that gained `target`.
+    """
+    touched = set(ProjectTag.objects.filter(tag=source).values_list("project_id", flat=True))
+    tagged = set(
+        ProjectTag.objects.filter(tag=target, project_id__in=touched).values_list("project_id", flat=True)
+    )
+    ProjectTag.objects.bulk_create(
+        [ProjectTag(project_id=p, tag_id=target.pk) for p in touched - tagged],
+        batch_size=1000, ignore_conflicts=True,
+    )
+    source.delete()  # takes its links with it
+    _touch(user, touched)
+    return len(touched - tagged)
+
+
+@transaction.atomic
+def rename(user, names):
+    """
+    Rename many tags with one UPDATE; `names` maps tag id -> new name.
+    Returns the number of tags renamed.
+    """
+    if not names:
+        return 0
+    renamed = Tag.objects.filter(user=user, pk__in=names).update(
+        name=Case(*[When(pk=pk, then=Value(name)) for pk, name in names.items()]),
+        updated_at=timezone.now(),
+    )
+    versioning.bump(user.pk)
+    return renamed
@@ -0,0 +1,252 @@
+"""
+A small database-backed task queue.
+
+    from api import tasks
+
+    @tasks.task(max_attempts=3)
+    def resize(pk): ...
+
+    tasks.enqueue(resize, pk)      # inserted once the current transaction commits
+
+`manage.py run_worker` claims due tasks with a conditional UPDATE, so any
+number of worker processes/threads can share the table on Postgres or SQLite
+without a broker. A claim holds a task for `timeout` seconds (its visibility
+timeout); if the worker dies, the task becomes claimable again afterwards.
+Failures are retried with exponential backoff until `max_attempts`.
+
+Finished tasks (done or failed) are kept for KEEP_DAYS so failures can be
+inspected; the worker then deletes them with purge_finished().
+"""
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 300
+BACKOFF_BASE = 10
+BACKOFF_MAX = 60 * 60
+KEEP_DAYS = 7
+PURGE_INTERVAL = 60 * 60
+PURGE_BATCH_SIZE = 1000
+ERROR_BACKOFF_MAX = 60
+
+_registry = {}
+
+
+def task(fn=None, *, max_attempts=5, timeout=DEFAULT_TIMEOUT):
+    """
+    Register `fn` as a task. Arguments must be JSON-serializable.
+    """
+    def register(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        func.task_name = name
+        func.task_options = {"max_attempts": max_attempts, "timeout": timeout}
+        _registry[name] = func
+        return func
+
+    return register(fn) if fn is not None else register
+
+
+def resolve(name):
+    func = _registry.get(name)
+    if func is None:
+        func = import_string(name)
+        if getattr(func, "task_name", None) != name:
+            raise LookupError(f"{name} is not a registered task")
+    return func
+
+
+def enqueue(func, *args, run_at=None, **kwargs):
+    """
+    Queue `func(*args, **kwargs)` to run in a worker once the surrounding
+    transaction commits (immediately when there is none).
+    """
+    name = func if isinstance(func, str) else func.task_name
+    options = resolve(name).task_options
+
+    def _insert():
+        Task.objects.create(
+            name=name,
+            args=list(args),
+            kwargs=kwargs,
+            max_attempts=options["max_attempts"],
+            run_at=run_at or timezone.now(),
+        )
+
+    transaction.on_commit(_insert)
+
+
+def enqueue_many(func, calls, run_at=None):
+    """
+    enqueue() `func` once per argument tuple in `calls`, inserting all the
+    tasks with a single bulk_create on commit.
+    """
+    name = func if isinstance(func, str) else func.task_name
+    options = resolve(name).task_options
+    calls = [list(args) for args in calls]
+    if not calls:
+        return
+
+    def _insert():
+        when = run_at or timezone.now()
+        Task.objects.bulk_create([
+            Task(name=name, args=args, kwargs={}, max_attempts=options["max_attempts"], run_at=when)
+            for args in calls
+        ])
+
+    transaction.on_commit(_insert)
+
+
+def _timeout_for(name, default):
+    try:
+        return resolve(name).task_options["timeout"]
+    except (ImportError, LookupError):
+        return default
+
+
+def claim(worker_id, timeout=DEFAULT_TIMEOUT, limit=10):
+    """
+    Claim one due task for `worker_id`, or return None. `timeout` is the
+    visibility timeout for tasks that don't declare their own.
+
+    Candidates are queued tasks whose run_at has passed, plus running tasks
+    whose visibility timeout expired. The UPDATE only matches if nobody else
+    changed the row since we read it, which makes the claim race-free.
+    """
+    now = timezone.now()
+    due = (
+        Task.objects.filter(
+            Q(status=Task.QUEUED, run_at__lte=now)
+            | Q(status=Task.RUNNING, locked_until__lt=now)
+        )
+        .order_by("run_at", "id")
+        .values_list("id", "name", "status", "attempts", "max_attempts")[:limit]
+    )
+    for pk, name, status, attempts, max_attempts in due:
+        if status == Task.RUNNING and attempts >= max_attempts:
+            # Its last worker vanished mid-run and no retries are left.
+            Task.objects.filter(pk=pk, status=status, attempts=attempts).update(
+                status=Task.FAILED, locked_until=None, finished=now,
+                last_error="Visibility timeout expired on the final attempt.",
+            )
+            continue
+        claimed = Task.objects.filter(pk=pk, status=status, attempts=attempts).update(
+            status=Task.RUNNING,
+            attempts=F("attempts") + 1,
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=_timeout_for(name, timeout)),
+        )
+        if claimed:
+            return Task.objects.get(pk=pk)
+    return None
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * (2 ** max(attempts - 1, 0)), BACKOFF_MAX)
+
+
+def execute(t):
+    """
+    Run a claimed task and record the outcome.
+    """
+    try:
+        resolve(t.name)(*t.args, **t.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Task %s (%s) failed, attempt %s/%s", t.pk, t.name, t.attempts, t.max_attempts)
+        if t.attempts >= t.max_attempts:
+            fields = {"status": Task.FAILED, "finished": timezone.now()}
+        else:
+            fields = {
+                "status": Task.QUEUED,
+                "run_at": timezone.now() + timedelta(seconds=backoff(t.attempts)),
+            }
+        Task.objects.filter(pk=t.pk, locked_by=t.locked_by).update(
+            locked_until=None, last_error=error, **fields
+        )
+        return False
+
+    Task.objects.filter(pk=t.pk, locked_by=t.locked_by).update(
+        status=Task.DONE, locked_until=None, finished=timezone.now(), last_error=""
+    )
+    return True
+
+
+def run_once(worker_id, timeout=DEFAULT_TIMEOUT):
+    """
+    Claim and run a single task. Returns False when nothing was due.
+    """
+    close_old_connections()
+    t = claim(worker_id, timeout=timeout)
+    if t is None:
+        return False
+    execute(t)
+    return True
+
+
+def purge_finished(keep_days=KEEP_DAYS, batch_size=PURGE_BATCH_SIZE):
+    """
+    Delete done and failed tasks that finished more than `keep_days` ago,
+    `batch_size` rows per DELETE. Returns the number deleted.
+    """
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    expired = Task.objects.filter(status__in=(Task.DONE, Task.FAILED), finished__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(expired.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Task.objects.filter(pk__in=ids).delete()[0]
+
+
+def work(worker_id, stop, timeout=DEFAULT_TIMEOUT, poll_interval=1.0, keep_days=0, burst=False):
+    """
+    Run tasks until `stop` (a threading.Event) is set, or the queue is empty
+    when `burst`. With `keep_days`, old finished tasks are purged hourly.
+
+    A database error (lost connection, failover, locked SQLite file) is
+    logged and retried after a growing pause instead of ending the loop.
+    """
+    next_purge = time.monotonic() if keep_days > 0 else None
+    failures = 0
+    while not stop.is_set():
+        try:
+            if next_purge is not None and time.monotonic() >= next_purge:
+                # Scheduled first, so a failing purge waits an hour rather than blocking tasks.
+                next_purge = time.monotonic() + PURGE_INTERVAL
+                purge_finished(keep_days)
+            ran = run_once(worker_id, timeout=timeout)
+        except Exception:
+            failures += 1
+            delay = min(poll_interval * 2 ** (failures - 1), ERROR_BACKOFF_MAX)
+            logger.exception("Worker %s failed to poll the queue; retrying in %.1fs", worker_id, delay)
+            close_old_connections()
+            stop.wait(delay)
+            continue
+        failures = 0
+        if not ran:
+            if burst:
+                break
+            stop.wait(poll_interval)
+
+
+# ---- task definitions ----
+
+@task(max_attempts=3, timeout=120)
+def generate_image_derivatives(model_label, pk, field_name, variants_field):
+    from django.apps import apps
+    from . import images
+
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is not None:
+        images.ensure_derivatives(instance, field_name, variants_field)
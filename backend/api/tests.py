@@ -1 +1,1473 @@
-from django.test import TestCase
+import datetime
+import difflib
+import gzip
+import json
+import random
+import re
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO
+from unittest import mock, skipUnless
+from urllib.parse import quote
+
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DataError, OperationalError, connection
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver, resolve
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date
+import numpy as np
+from PIL import Image
+from rest_framework.test import APIClient
+
+from stitchtracker_backend import backup
+
+from . import (
+    colour_index, colours, images, metrics, rollups, sanitize, search, tasks, versioning, yarn_import,
+)
+from .management.commands.seed_load import sample_patterns, seed_user
+from .yarn_units import derived_fields
+from .models import (
+    MetricsSnapshot, Project, ProjectDailyStats, ProjectProgress, ProjectYarn, ProgressImage, SearchDocument, Tag,
+    Task, Yarn,
+)
+
+User = get_user_model()
+
+
+def make_project(user, name, **fields):
+    fields.setdefault("type", "knit")
+    fields.setdefault("start_date", datetime.date(2026, 1, 5))
+    return Project.objects.create(user=user, name=name, **fields)
+
+
+def save_jpeg(name):
+    buf = BytesIO()
+    Image.new("RGB", (8, 8), (200, 40, 40)).save(buf, "JPEG")
+    return default_storage.save(name, ContentFile(buf.getvalue()))
+
+
+def add_progress(project, entries, images_each=0):
+    for n in range(entries):
+        progress = ProjectProgress.objects.create(
+            project=project, rows_completed=n + 1, stitches_completed=10 * (n + 1)
+        )
+        for i in range(images_each):
+            ProgressImage.objects.create(progress=progress, image=f"progress/{progress.pk}-{i}.jpg")
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class ProjectWriteQueryTests(TestCase):
+    """
+    The project returned by a write nests every progress entry and its
+    images; they must be loaded in bulk, not once per entry.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        cls.small = make_project(cls.user, "Small")
+        add_progress(cls.small, 1, images_each=1)
+        cls.large = make_project(cls.user, "Large")
+        add_progress(cls.large, 8, images_each=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_patch(self, project):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.patch(
+                f"/api/projects/{project.pk}/", {"notes": "blocked"}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.data
+
+    def test_update_response_queries_do_not_grow_with_progress(self):
+        small, _ = self.count_patch(self.small)
+        large, data = self.count_patch(self.large)
+        self.assertEqual(small, large)
+        self.assertEqual(len(data["progress_updates"]), 8)
+        self.assertEqual(sum(len(p["images"]) for p in data["progress_updates"]), 16)
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        # Yarns list by (brand, colour): most rows tie on both columns.
+        for n in range(7):
+            Yarn.objects.create(
+                user=cls.user, brand="Drops", colour="#aabbcc", weight="DK",
+                amount_per_skein="50g", material=f"Blend {n}",
+            )
+        Yarn.objects.create(
+            user=cls.user, brand="Cascade", colour="#112233", weight="DK", amount_per_skein="100g"
+        )
+        Yarn.objects.create(
+            user=cls.user, brand="Drops", colour="#000000", weight="DK", amount_per_skein="50g"
+        )
+        cls.expected = list(
+            Yarn.objects.filter(user=cls.user).order_by("brand", "colour", "id").values_list("id", flat=True)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([row["id"] for row in response.data["results"]])
+            url = response.data[link]
+        return pages
+
+    def test_next_links_visit_every_row_once_across_ties(self):
+        pages = self.walk("/api/yarns/?page_size=3", "next")
+        self.assertEqual([len(page) for page in pages], [3, 3, 3])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_previous_links_walk_back_over_the_same_pages(self):
+        url = "/api/yarns/?page_size=2"
+        while True:
+            response = self.client.get(url)
+            if not response.data["next"]:
+                break
+            url = response.data["next"]
+        self.assertEqual([row["id"] for row in response.data["results"]], self.expected[-1:])
+        back = self.walk(response.data["previous"], "previous")
+        self.assertEqual(sum(reversed(back), []), self.expected[:-1])
+        self.assertEqual(back[0], self.expected[-3:-1])
+
+    def test_first_page_has_no_previous_link(self):
+        response = self.client.get("/api/yarns/?page_size=4")
+        self.assertIsNone(response.data["previous"])
+        self.assertIsNotNone(response.data["next"])
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class SparseFieldsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        cls.project = make_project(cls.user, "Socks", notes="toe up")
+        cls.project.tags.add(Tag.objects.create(user=cls.user, name="gift"))
+        yarn = Yarn.objects.create(user=cls.user, brand="Drops", colour="#aabbcc", weight="DK")
+        ProjectYarn.objects.create(project=cls.project, yarn=yarn, quantity_used_skeins=2)
+        add_progress(cls.project, 2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, query):
+        response = self.client.get(f"/api/projects/{self.project.pk}/?{query}")
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_fields_prunes_output(self):
+        self.assertEqual(self.get("fields=id,name"), {"id": self.project.pk, "name": "Socks"})
+
+    def test_nested_fields(self):
+        data = self.get("fields=id,progress_updates.rows_completed")
+        self.assertEqual(set(data), {"id", "progress_updates"})
+        self.assertEqual(
+            sorted(p["rows_completed"] for p in data["progress_updates"]), [1, 2]
+        )
+        self.assertTrue(all(set(p) == {"rows_completed"} for p in data["progress_updates"]))
+
+    def test_expand_keeps_plain_fields_and_only_listed_relations(self):
+        data = self.get("expand=tags")
+        self.assertEqual([t["name"] for t in data["tags"]], ["gift"])
+        self.assertNotIn("yarns", data)
+        self.assertNotIn("progress_updates", data)
+        self.assertEqual(data["notes"], "toe up")
+
+        data = self.get("fields=id&expand=yarns.yarn")
+        self.assertEqual(set(data), {"id", "yarns"})
+        self.assertEqual(data["yarns"][0]["yarn"]["brand"], "Drops")
+
+    def test_unknown_fields_are_ignored(self):
+        self.assertEqual(self.get("fields=id,bogus,tags.bogus"), {"id": self.project.pk, "tags": [{}]})
+        data = self.get("expand=bogus")
+        self.assertEqual(data["notes"], "toe up")
+        self.assertFalse({"tags", "yarns", "progress_updates"} & set(data))
+
+    def test_writes_return_every_field(self):
+        response = self.client.patch(
+            f"/api/projects/{self.project.pk}/?fields=id", {"notes": "cuff down"}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["notes"], "cuff down")
+        self.assertIn("progress_updates", response.data)
+
+
+class TaskRetentionTests(TestCase):
+    def make_task(self, status, finished_days_ago=None):
+        finished = None
+        if finished_days_ago is not None:
+            finished = timezone.now() - timedelta(days=finished_days_ago)
+        return Task.objects.create(name="api.tasks.generate_image_derivatives", status=status, finished=finished)
+
+    def test_purge_finished_deletes_only_old_finished_tasks(self):
+        self.make_task(Task.DONE, 10)
+        self.make_task(Task.FAILED, 10)
+        recent_done = self.make_task(Task.DONE, 1)
+        queued = self.make_task(Task.QUEUED)
+        running = self.make_task(Task.RUNNING)
+
+        self.assertEqual(tasks.purge_finished(keep_days=7, batch_size=1), 2)
+        remaining = set(Task.objects.values_list("id", flat=True))
+        self.assertEqual(remaining, {recent_done.pk, queued.pk, running.pk})
+
+
+class TaskWorkerTests(TestCase):
+    def test_loop_survives_database_errors(self):
+        stop = threading.Event()
+        outcomes = [OperationalError("server closed the connection"), True, OperationalError("again"), True, False]
+        with mock.patch.object(tasks, "run_once", side_effect=outcomes) as run_once, \
+                mock.patch.object(tasks, "purge_finished", side_effect=OperationalError("locked")) as purge, \
+                self.assertLogs("api.tasks", "ERROR") as logs:
+            tasks.work("test-worker", stop, poll_interval=0, keep_days=7, burst=True)
+        self.assertEqual(run_once.call_count, 5)
+        self.assertEqual(purge.call_count, 1)  # next tried an hour later
+        self.assertEqual(len(logs.records), 3)
+
+    def test_loop_runs_queued_tasks_until_stopped(self):
+        stop = threading.Event()
+
+        def run_once(worker_id, timeout):
+            if run_once.calls == 2:
+                stop.set()
+            run_once.calls += 1
+            return True
+        run_once.calls = 0
+
+        with mock.patch.object(tasks, "run_once", run_once):
+            tasks.work("test-worker", stop, poll_interval=0)
+        self.assertEqual(run_once.calls, 3)
+
+
+class MediaRootMixin:
+    """
+    Point MEDIA_ROOT at a scratch directory for the whole TestCase.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_root = tempfile.mkdtemp()
+        cls._media_override = override_settings(MEDIA_ROOT=cls._media_root)
+        cls._media_override.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._media_override.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class ImageDerivativeTests(MediaRootMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+
+    def project_with_image(self, name, fmt="JPEG"):
+        buf = BytesIO()
+        Image.new("RGB", (400, 300), (40, 120, 200)).save(buf, fmt)
+        return make_project(self.user, name, main_image=default_storage.save(name, ContentFile(buf.getvalue())))
+
+    def files(self, project):
+        return [name for sizes in project.main_image_variants["widths"].values() for name in sizes.values()]
+
+    def ensure(self, project):
+        return images.ensure_derivatives(project, "main_image", "main_image_variants")
+
+    def test_generates_every_width_and_format_without_upscaling(self):
+        project = self.project_with_image("projects/main/shawl.jpg")
+        self.assertTrue(self.ensure(project))
+        self.assertFalse(self.ensure(project))  # already current
+        variants = project.main_image_variants
+        self.assertEqual(variants["source"], "projects/main/shawl.jpg")
+        self.assertEqual(sorted(variants["widths"], key=int), ["320", "400"])
+        self.assertEqual(variants["widths"]["320"]["webp"], "projects/main/shawl.jpg.w320.webp")
+        for name in self.files(project):
+            with default_storage.open(name) as fh:
+                self.assertIn(Image.open(fh).width, (320, 400))
+
+    def test_sources_sharing_a_stem_get_their_own_files(self):
+        jpg = self.project_with_image("projects/main/cat.jpg")
+        png = self.project_with_image("projects/main/cat.png", fmt="PNG")
+        self.ensure(jpg)
+        self.ensure(png)
+        self.assertFalse(set(self.files(jpg)) & set(self.files(png)))
+
+        png.main_image = None
+        png.save()
+        self.ensure(png)
+        self.assertEqual(png.main_image_variants, {})
+        for name in self.files(jpg):
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_existing_file_at_a_derivative_name_is_not_reused(self):
+        project = self.project_with_image("projects/main/hat.jpg")
+        stale = default_storage.save(images.derivative_name("projects/main/hat.jpg", 320, "webp"), ContentFile(b"old"))
+        self.ensure(project)
+        self.assertNotIn(stale, self.files(project))
+        with default_storage.open(stale) as fh:
+            self.assertEqual(fh.read(), b"old")
+
+    def test_replacing_the_image_deletes_old_derivatives(self):
+        project = self.project_with_image("projects/main/mitts.jpg")
+        self.ensure(project)
+        old = self.files(project)
+        project.main_image = self.project_with_image("projects/main/mitts-2.jpg").main_image.name
+        project.save()
+        self.ensure(project)
+        self.assertEqual(project.main_image_variants["source"], "projects/main/mitts-2.jpg")
+        for name in old:
+            self.assertFalse(default_storage.exists(name), name)
+        for name in self.files(project):
+            self.assertTrue(default_storage.exists(name), name)
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class BackupRestoreTests(MediaRootMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user("owner", password="pw")
+        cls.other = User.objects.create_user("other", password="pw")
+        tag = Tag.objects.create(user=cls.owner, name="gift")
+        yarn = Yarn.objects.create(
+            user=cls.owner, brand="Drops", weight="DK", colour="#336699", amount_per_skein="50g / 105m"
+        )
+        cls.project = make_project(cls.owner, "Cardigan", main_image=save_jpeg("projects/main/cardigan.jpg"))
+        cls.project.tags.add(tag)
+        ProjectYarn.objects.create(project=cls.project, yarn=yarn, quantity_used_skeins=3)
+        progress = ProjectProgress.objects.create(project=cls.project, rows_completed=12, stitches_completed=960)
+        cls.photo = ProgressImage.objects.create(progress=progress, image=save_jpeg("progress/sleeve.jpg"))
+
+    def restore(self, user, body, on_conflict="skip"):
+        client = APIClient()
+        client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                f"/api/restore/?on_conflict={on_conflict}", body, content_type="application/x-ndjson"
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.data["results"]
+
+    def export(self, user):
+        return "".join(backup.iter_ndjson(user)).encode()
+
+    def account(self, user):
+        return {
+            "tags": sorted(Tag.objects.filter(user=user).values_list("name", flat=True)),
+            "yarns": sorted(Yarn.objects.filter(user=user).values_list("brand", "colour", "yards_per_skein")),
+            "projects": sorted(Project.objects.filter(user=user).values_list("name", "tags__name")),
+            "project_yarns": sorted(
+                ProjectYarn.objects.filter(project__user=user).values_list("project__name", "yarn__brand")
+            ),
+            "progress": sorted(
+                ProjectProgress.objects.filter(project__user=user).values_list("rows_completed", "stitches_completed")
+            ),
+        }
+
+    def test_round_trip_into_another_account(self):
+        results = self.restore(self.other, self.export(self.owner))
+        self.assertEqual(self.account(self.other), self.account(self.owner))
+        # Media names in a backup aren't trusted: files `other` doesn't own are dropped.
+        restored = Project.objects.get(user=self.other)
+        self.assertFalse(restored.main_image)
+        self.assertFalse(ProgressImage.objects.filter(progress__project=restored).exists())
+        self.assertEqual(results["project"]["files_dropped"], 1)
+        self.assertEqual(results["progress_image"]["files_dropped"], 1)
+
+    def test_reimport_is_a_no_op(self):
+        body = self.export(self.owner)
+        self.restore(self.other, body)
+        before = self.account(self.other)
+        results = self.restore(self.other, body)
+        self.assertEqual(self.account(self.other), before)
+        self.assertEqual(results["project"], {"created": 0, "matched": 1, "renamed": 0, "skipped": 0, "files_dropped": 0})
+        self.assertEqual(results["progress"]["created"], 0)
+        self.assertEqual(results["progress_image"]["created"], 0)
+
+    def test_own_files_are_kept_and_variants_regenerated(self):
+        self.restore(self.owner, self.export(self.owner), on_conflict="rename")
+        copy = Project.objects.get(user=self.owner, name="Cardigan (2)")
+        self.assertEqual(copy.main_image.name, self.project.main_image.name)
+        self.assertEqual(copy.main_image_variants, {})
+        image = ProgressImage.objects.get(progress__project=copy)
+        self.assertEqual(image.image.name, self.photo.image.name)
+        self.assertEqual(image.variants, {})
+        queued = sorted(tuple(t.args[:2]) for t in Task.objects.filter(name=tasks.generate_image_derivatives.task_name))
+        self.assertEqual(queued, [("api.ProgressImage", image.pk), ("api.Project", copy.pk)])
+
+    def test_crafted_backup_cannot_touch_another_users_files(self):
+        images.ensure_derivatives(self.photo, "image", "variants")
+        victim_files = [self.photo.image.name] + [
+            name for sizes in self.photo.variants["widths"].values() for name in sizes.values()
+        ]
+        record = lambda kind, data: json.dumps({"type": kind, "data": data})
+        body = "\n".join([
+            json.dumps({"type": "meta", "format": backup.FORMAT_NAME, "version": backup.FORMAT_VERSION}),
+            record("project", {
+                "id": 1, "name": "Bait", "type": "knit", "start_date": "2026-01-05",
+                "main_image": self.project.main_image.name,
+                "main_image_variants": {"source": "projects/main/other.jpg", "widths": {"320": {"webp": victim_files[1]}}},
+            }),
+            record("progress", {"id": 1, "project_id": 1, "rows_completed": 1, "stitches_completed": 1}),
+            record("progress_image", {
+                "id": 1, "progress_id": 1, "image": victim_files[0],
+                "variants": {"source": "x.jpg", "widths": {"320": {"jpeg": victim_files[2]}}},
+            }),
+            json.dumps({"type": "end", "counts": {}}),
+        ]).encode()
+
+        self.restore(self.other, body)
+        while tasks.run_once("test-worker"):
+            pass
+
+        bait = Project.objects.get(user=self.other, name="Bait")
+        # As the next edit of the project would.
+        images.ensure_derivatives(bait, "main_image", "main_image_variants")
+        for name in victim_files + [self.project.main_image.name]:
+            self.assertTrue(default_storage.exists(name), name)
+        self.assertFalse(bait.main_image)
+        self.assertEqual(bait.main_image_variants, {})
+        self.assertFalse(ProgressImage.objects.filter(progress__project=bait).exists())
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class BackupExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        Tag.objects.create(user=cls.user, name="gift")
+        for n in range(3):
+            add_progress(make_project(cls.user, f"Sock {n}"), 2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, query=""):
+        response = self.client.get(f"/api/backup/{query}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b"".join(response.streaming_content)
+
+    def test_default_export_is_gzipped_ndjson(self):
+        response, body = self.download()
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertRegex(
+            response["Content-Disposition"], r'^attachment; filename="stitchtracker-backup-\d{8}-\d{6}\.ndjson\.gz"$'
+        )
+        self.assertEqual(response["X-Backup-Format-Version"], str(backup.FORMAT_VERSION))
+        records = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+        self.assertEqual(records[0]["type"], "meta")
+        self.assertEqual(records[0]["format"], backup.FORMAT_NAME)
+        self.assertNotIn("delta", records[0])
+        self.assertEqual(records[-1], {"type": "end", "counts": {
+            "tag": 1, "yarn": 0, "project": 3, "project_tag": 0, "project_yarn": 0, "progress": 6, "progress_image": 0,
+        }})
+        self.assertEqual(
+            sorted(r["data"]["name"] for r in records if r["type"] == "project"), ["Sock 0", "Sock 1", "Sock 2"]
+        )
+
+    def test_uncompressed_layouts(self):
+        response, body = self.download("?compress=0")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([records[0]["type"], records[-1]["type"]], ["meta", "end"])
+        self.assertEqual(len(records), 1 + 1 + 3 + 6 + 1)
+
+        response, body = self.download("?layout=json&compress=0")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertIn('.json"', response["Content-Disposition"])
+        document = json.loads(body)
+        self.assertEqual(len(document["progress"]), 6)
+        self.assertEqual(document["tag"][0]["name"], "gift")
+
+    def test_since_exports_changes_and_tombstones(self):
+        other = User.objects.create_user("other", password="pw")
+        hat, scarf = make_project(self.user, "Hat"), make_project(self.user, "Scarf")
+        yarn = Yarn.objects.create(user=self.user, brand="Drops", colour="#aabbcc", weight="DK")
+        theirs = make_project(other, "Theirs")
+        _, body = self.download("?compress=0")
+        since = json.loads(body.splitlines()[0])["exported_at"]
+
+        created = self.client.post("/api/projects/", {
+            "name": "Mitts", "type": "knit", "start_date": "2026-02-01",
+        }, format="json").data["id"]
+        self.client.patch(f"/api/projects/{hat.pk}/", {"tag_names": ["gift"]}, format="json")
+        self.assertEqual(self.client.delete(f"/api/projects/{scarf.pk}/").status_code, 204)
+        self.assertEqual(self.client.delete(f"/api/yarns/{yarn.pk}/").status_code, 204)
+        theirs.delete()
+
+        response, body = self.download(f"?compress=0&since={quote(since)}")
+        self.assertRegex(response["Content-Disposition"], r'filename="stitchtracker-delta-')
+        records = [json.loads(line) for line in body.decode().splitlines()]
+        meta = records[0]
+        self.assertTrue(meta["delta"])
+        self.assertEqual(meta["since"], since)
+        self.assertEqual(meta["sections"][-1], "tombstone")
+        by_type = {}
+        for record in records[1:-1]:
+            by_type.setdefault(record["type"], []).append(record["data"])
+
+        self.assertEqual(sorted(p["name"] for p in by_type["project"]), ["Hat", "Mitts"])
+        self.assertIn(created, [p["id"] for p in by_type["project"]])
+        gift = Tag.objects.get(user=self.user, name="gift").pk
+        self.assertEqual(by_type["project_tag"], [{"project_id": hat.pk, "tag_id": gift}])
+        self.assertNotIn("yarn", by_type)
+        self.assertNotIn("progress", by_type)  # setUpTestData rows are older than `since`
+        self.assertEqual(
+            sorted((t["kind"], t["object_id"]) for t in by_type["tombstone"]),
+            [("project", scarf.pk), ("yarn", yarn.pk)],
+        )
+        self.assertEqual(records[-1]["counts"]["tombstone"], 2)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get("/api/backup/?layout=xml").status_code, 400)
+        self.assertEqual(self.client.get("/api/backup/?since=yesterday").status_code, 400)
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        cls.other = User.objects.create_user("other", password="pw")
+        cls.project = make_project(cls.user, "Socks")
+        make_project(cls.other, "Hat")
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_matching_etag_gets_304_after_one_query(self):
+        client = self.client_for(self.user)
+        first = client.get("/api/projects/")
+        self.assertEqual(first.status_code, 200)
+        with self.assertNumQueries(1):
+            again = client.get("/api/projects/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["ETag"], first["ETag"])
+
+    def test_etag_differs_per_url(self):
+        client = self.client_for(self.user)
+        listing = client.get("/api/projects/")
+        detail = client.get(f"/api/projects/{self.project.pk}/", HTTP_IF_NONE_MATCH=listing["ETag"])
+        self.assertEqual(detail.status_code, 200)
+        self.assertNotEqual(detail["ETag"], listing["ETag"])
+
+    def test_own_write_invalidates_etag(self):
+        client = self.client_for(self.user)
+        etag = client.get("/api/projects/")["ETag"]
+        client.patch(f"/api/projects/{self.project.pk}/", {"name": "Knee socks"}, format="json")
+        response = client.get("/api/projects/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.data["results"][0]["name"], "Knee socks")
+
+    def test_if_modified_since(self):
+        client = self.client_for(self.user)
+        last_modified = client.get("/api/projects/")["Last-Modified"]
+        with self.assertNumQueries(1):
+            again = client.get("/api/projects/", HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again["Last-Modified"], last_modified)
+
+        earlier = http_date(parse_http_date(last_modified) - 1)
+        self.assertEqual(client.get("/api/projects/", HTTP_IF_MODIFIED_SINCE=earlier).status_code, 200)
+
+    def test_other_users_write_keeps_etag(self):
+        client = self.client_for(self.user)
+        etag = client.get("/api/projects/")["ETag"]
+        make_project(self.other, "Scarf")
+        self.assertEqual(client.get("/api/projects/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=300)
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        cls.project = make_project(cls.user, "Socks")
+
+    def setUp(self):
+        caches["default"].clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_repeat_get_is_served_from_cache(self):
+        self.assertEqual(self.client.get("/api/projects/")["X-Cache"], "MISS")
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/projects/")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(response.data["results"][0]["name"], "Socks")
+
+    def test_write_skips_stale_entry(self):
+        self.client.get("/api/projects/")
+        self.client.patch(f"/api/projects/{self.project.pk}/", {"name": "Knee socks"}, format="json")
+        response = self.client.get("/api/projects/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.data["results"][0]["name"], "Knee socks")
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class DailyRollupTests(TestCase):
+    """
+    ProjectDailyStats must always equal aggregating ProjectProgress live,
+    whichever write path changed the entries.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        cls.socks = make_project(cls.user, "Socks")
+        cls.hat = make_project(cls.user, "Hat")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def at(self, day, hour):
+        tz = timezone.get_default_timezone()
+        return datetime.datetime(2026, 3, day, hour, 30, tzinfo=tz).isoformat()
+
+    def log(self, project, day, hour, rows, stitches):
+        response = self.client.post("/api/progress/", {
+            "project": project.pk, "date": self.at(day, hour),
+            "rows_completed": rows, "stitches_completed": stitches,
+        }, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data["id"]
+
+    def live(self):
+        tz = timezone.get_default_timezone()
+        days = (
+            ProjectProgress.objects.filter(project__user=self.user)
+            .annotate(day=TruncDate("date", tzinfo=tz))
+            .values("project_id", "day")
+            .annotate(rows=Sum("rows_completed"), stitches=Sum("stitches_completed"), entries=Count("id"))
+        )
+        return {(d["project_id"], d["day"]): (d["rows"], d["stitches"], d["entries"]) for d in days}
+
+    def rolled_up(self):
+        return {
+            (d.project_id, d.day): (d.rows, d.stitches, d.entries)
+            for d in ProjectDailyStats.objects.filter(user=self.user)
+        }
+
+    def test_rollup_matches_live_aggregation_through_every_write_path(self):
+        first = self.log(self.socks, 2, 9, 10, 600)
+        self.log(self.socks, 2, 23, 4, 240)  # late evening: still the 2nd locally
+        late = self.log(self.hat, 3, 0, 7, 420)
+        response = self.client.post("/api/progress/batch/", {"entries": [
+            {"project": self.socks.pk, "date": self.at(3, 12), "rows_completed": 5, "stitches_completed": 300},
+            {"project": self.socks.pk, "date": self.at(3, 18), "rows_completed": 6, "stitches_completed": 360},
+            {"project": self.hat.pk, "date": self.at(4, 8), "rows_completed": 2, "stitches_completed": 120},
+        ]}, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(self.rolled_up(), self.live())
+
+        for pk, change in ((first, {"rows_completed": 12}), (late, {"date": self.at(5, 10)})):
+            response = self.client.patch(f"/api/progress/{pk}/", change, format="json")
+            self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(self.rolled_up(), self.live())
+
+        self.assertEqual(self.client.delete(f"/api/progress/{first}/").status_code, 204)
+        self.assertEqual(self.client.delete(f"/api/projects/{self.hat.pk}/").status_code, 204)
+        self.assertEqual(self.rolled_up(), self.live())
+
+        rollups.rebuild(user=self.user)
+        self.assertEqual(self.rolled_up(), self.live())
+
+    def test_activity_endpoint_reads_the_rollup(self):
+        self.log(self.socks, 2, 9, 10, 600)
+        self.log(self.hat, 2, 15, 3, 180)
+        response = self.client.get("/api/stats/activity/?start=2026-03-01&end=2026-03-31")
+        self.assertEqual(response.data["days"], [
+            {"date": datetime.date(2026, 3, 2), "rows": 13, "stitches": 780, "entries": 2},
+        ])
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        cls.other = User.objects.create_user("other", password="pw")
+        make_project(cls.other, "Merino socks")
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, q, **params):
+        response = self.client.get("/api/search/", {"q": q, **params})
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data["results"]
+
+    def fts_rowids(self, match):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT rowid FROM {search.FTS_TABLE} WHERE {search.FTS_TABLE} MATCH %s", [match])
+            return sorted(row[0] for row in cursor.fetchall())
+
+    def test_results_follow_create_update_and_delete(self):
+        response = self.client.post("/api/projects/", {
+            "name": "Merino socks", "type": "knit", "start_date": "2026-02-01",
+            "pattern_text": "<p>Knit the <strong>heel flap</strong> &amp; turn</p>",
+        }, format="json")
+        pk = response.data["id"]
+        self.client.post("/api/progress/", {
+            "project": pk, "rows_completed": 4, "stitches_completed": 240, "notes": "picked up gusset stitches",
+        }, format="json")
+
+        [hit] = self.search("merino", kind="project")
+        self.assertEqual((hit["kind"], hit["id"], hit["project"]), ("project", pk, None))
+        self.assertEqual(hit["title"], "<mark>Merino</mark> socks")
+        self.assertIn("<mark>heel</mark>", self.search("heel")[0]["snippet"])
+        [hit] = self.search("gusset")
+        self.assertEqual((hit["kind"], hit["project"], hit["title"]), ("progress", pk, "Merino socks"))
+        self.assertEqual(len(self.search("meri", kind="project")), 1)  # the last word matches as a prefix
+
+        self.client.patch(f"/api/projects/{pk}/", {"name": "Alpaca socks"}, format="json")
+        self.assertEqual(self.search("merino"), [])
+        self.assertEqual(
+            sorted((r["kind"], r["title"]) for r in self.search("alpaca")),
+            [("progress", "<mark>Alpaca</mark> socks"), ("project", "<mark>Alpaca</mark> socks")],
+        )
+
+        self.assertEqual(self.client.delete(f"/api/projects/{pk}/").status_code, 204)
+        self.assertEqual(self.search("alpaca"), [])
+        self.assertEqual(self.search("gusset"), [])
+
+    @skipUnless(connection.vendor == "sqlite", "FTS5 triggers are SQLite only")
+    def test_fts_triggers_mirror_the_documents(self):
+        project = make_project(self.user, "Cabled hat")
+        doc = SearchDocument.objects.get(kind="project", object_id=project.pk)
+        self.assertEqual(self.fts_rowids("cabled"), [doc.pk])
+        project.name = "Ribbed hat"
+        project.save()
+        self.assertEqual(self.fts_rowids("cabled"), [])
+        self.assertEqual(self.fts_rowids("ribbed"), [doc.pk])
+        project.delete()
+        self.assertEqual(self.fts_rowids("ribbed"), [])
+
+    def test_title_hits_rank_first_and_text_is_escaped(self):
+        for name in ("Mitts", "Cowl", "Shawl", "Blanket", "Vest", "Beret"):
+            make_project(self.user, name)  # bm25 needs "cable" to be rare to rank it
+        make_project(self.user, "Scarf", notes="cable <panel> & seed stitch")
+        make_project(self.user, "Cable hat")
+        Yarn.objects.create(user=self.user, brand="Cable Co", colour="#112233", weight="DK")
+        results = self.search("cable", kind="project")
+        self.assertEqual([r["title"] for r in results], ["<mark>Cable</mark> hat", "Scarf"])
+        self.assertGreater(results[0]["rank"], results[1]["rank"])
+        self.assertEqual(results[1]["snippet"], "<mark>cable</mark> &lt;panel&gt; &amp; seed stitch")
+        self.assertEqual(len(self.search("cable", limit=1)), 1)
+
+    def test_migration_backfill_in_batches(self):
+        migration = import_module("api.migrations.0016_search_document")
+        for name in ("Socks", "Hat", "Scarf"):
+            add_progress(make_project(self.user, name), 2)
+        Yarn.objects.create(user=self.user, brand="Drops", colour="#112233", weight="DK")
+        expected = sorted(SearchDocument.objects.values_list("kind", "object_id", "title"))
+        SearchDocument.objects.all().delete()
+        with mock.patch.object(migration, "BACKFILL_BATCH_SIZE", 2):
+            migration.backfill(django_apps, None)
+        self.assertEqual(sorted(SearchDocument.objects.values_list("kind", "object_id", "title")), expected)
+        self.assertEqual(len(self.search("scarf", kind="progress")), 2)
+
+    def test_validation(self):
+        self.assertEqual(self.client.get("/api/search/").status_code, 400)
+        self.assertEqual(self.client.get("/api/search/", {"q": "x", "kind": "tag"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/search/", {"q": "x", "limit": "many"}).status_code, 400)
+        self.assertEqual(self.search("***"), [])
+
+
+class YarnUnitTests(SimpleTestCase):
+    def test_weight_names(self):
+        cases = {
+            "Light worsted / DK (8 ply)": "dk",
+            "Super chunky": "super_bulky",
+            "Chunky": "bulky",
+            "Aran": "aran",
+            "Sock": "fingering",
+            "(4) Medium": "worsted",
+            "#0 Lace": "lace",
+            "Mystery": "",
+            "": "",
+        }
+        for label, expected in cases.items():
+            with self.subTest(label=label):
+                self.assertEqual(derived_fields(label, "")["weight_category"], expected)
+
+    def test_ply_counts_match_whole_numbers(self):
+        cases = {
+            "2 ply": "lace",
+            "2ply": "lace",
+            "3 ply": "fingering",
+            "4 ply": "fingering",
+            "5 ply": "sport",
+            "8 ply": "dk",
+            "10 ply": "aran",
+            "12 ply": "bulky",
+            "14 ply": "bulky",
+            "Worsted (10 ply)": "worsted",
+        }
+        for label, expected in cases.items():
+            with self.subTest(label=label):
+                self.assertEqual(derived_fields(label, "")["weight_category"], expected)
+
+    def amounts(self, text):
+        fields = derived_fields("", text)
+        return fields["grams_per_skein"], fields["yards_per_skein"], fields["meters_per_skein"]
+
+    def test_grams_and_yards(self):
+        self.assertEqual(
+            self.amounts("100g / 218 yds"), (Decimal("100.00"), Decimal("218.00"), Decimal("199.34"))
+        )
+
+    def test_ounces_and_meters(self):
+        self.assertEqual(
+            self.amounts("3.5 oz (400 m)"), (Decimal("99.22"), Decimal("437.45"), Decimal("400.00"))
+        )
+
+    def test_explicit_meters_and_yards_are_both_kept(self):
+        self.assertEqual(
+            self.amounts("50 grams, 175 yards / 160 metres"),
+            (Decimal("50.00"), Decimal("175.00"), Decimal("160.00")),
+        )
+
+    def test_comma_before_three_digits_groups_thousands(self):
+        self.assertEqual(self.amounts("1,094 yds"), (None, Decimal("1094.00"), Decimal("1000.35")))
+        self.assertEqual(self.amounts("1,094yds")[1], Decimal("1094.00"))
+        self.assertEqual(self.amounts("2,000.5 m")[2], Decimal("2000.50"))
+
+    def test_other_commas_are_decimal_points(self):
+        self.assertEqual(self.amounts("1,5 oz")[0], Decimal("42.52"))
+        self.assertEqual(self.amounts("137,5 m")[2], Decimal("137.50"))
+        self.assertEqual(self.amounts("1,0945 m")[2], Decimal("1.09"))
+
+    def test_unparseable_amounts(self):
+        self.assertEqual(self.amounts("one skein"), (None, None, None))
+        self.assertEqual(self.amounts(""), (None, None, None))
+
+    def test_amounts_too_large_for_the_columns_are_dropped(self):
+        self.assertEqual(self.amounts("1000000 m"), (None, None, None))
+        self.assertEqual(self.amounts("999999 m"), (None, None, Decimal("999999.00")))  # yards would overflow
+        self.assertEqual(self.amounts("999999.99 yds"), (None, Decimal("999999.99"), Decimal("914399.99")))
+        self.assertEqual(self.amounts("999999.995 g"), (None, None, None))
+        self.assertEqual(self.amounts("40000 oz"), (None, None, None))
+        self.assertEqual(self.amounts("9" * 40 + " g / 50 g"), (Decimal("50.00"), None, None))
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class YarnAmountOverflowTests(TestCase):
+    def test_oversized_label_saves_with_empty_quantities(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("knitter", password="pw"))
+        response = client.post("/api/yarns/", {
+            "brand": "Drops", "colour": "#aabbcc", "weight": "DK", "material": "Wool", "amount_per_skein": "1000000 m",
+        }, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        yarn = client.get(f"/api/yarns/{response.data['id']}/").data
+        self.assertEqual(
+            [yarn["grams_per_skein"], yarn["yards_per_skein"], yarn["meters_per_skein"]], [None, None, None]
+        )
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class YarnImportTests(TestCase):
+    HEADER = "brand,weight,colour,material,amount_per_skein,colour_name,quantity_owned_skeins"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        cls.existing = Yarn.objects.create(
+            user=cls.user, brand="Drops", weight="DK", colour="#aabbcc", material="Wool",
+            amount_per_skein="50g / 105m", colour_name="Sky", quantity_owned_skeins=2,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def csv(self, *rows):
+        return "\n".join([self.HEADER, *rows]) + "\n"
+
+    def post(self, body, on_conflict="skip", expected=200, content_type="text/csv"):
+        response = self.client.post(
+            f"/api/yarns/import/?on_conflict={on_conflict}", body, content_type=content_type
+        )
+        self.assertEqual(response.status_code, expected, response.data)
+        return response.data
+
+    def names(self):
+        return dict(Yarn.objects.filter(user=self.user).values_list("colour", "colour_name"))
+
+    ROWS = [
+        "Drops,DK,#aabbcc,Wool,50g / 105m,Ocean,3",  # the existing yarn, changed
+        "Drops,DK,#112233,Wool,50g / 105m,Night,1",  # new
+        "Drops,DK,#112233,Wool,50g / 105m,Midnight,1",  # the new yarn again
+        "Drops,DK,#aabbcc,Wool,50g / 105m,Lagoon,3",  # the existing yarn again
+        "Drops,DK,#445566,Wool,50g / 105m,Dusk,lots",  # invalid
+    ]
+
+    def test_skip_keeps_existing_and_repeated_rows(self):
+        report = self.post(self.csv(*self.ROWS))
+        self.assertEqual(report["results"], {"created": 1, "updated": 0, "skipped": 3, "invalid": 1})
+        self.assertEqual(report["errors"], [
+            {"row": 5, "errors": {"quantity_owned_skeins": ["“lots” value must be a decimal number."]}},
+        ])
+        self.assertEqual(self.names(), {"#aabbcc": "Sky", "#112233": "Night"})
+
+    def test_update_counts_each_yarn_once(self):
+        for batch_size in (1000, 1):
+            with self.subTest(batch_size=batch_size):
+                Yarn.objects.filter(user=self.user).exclude(pk=self.existing.pk).delete()
+                Yarn.objects.filter(pk=self.existing.pk).update(colour_name="Sky")
+                importer = yarn_import.YarnImporter(self.user, on_conflict="update", batch_size=batch_size)
+                report = importer.run(yarn_import.iter_rows(BytesIO(self.csv(*self.ROWS).encode())))
+                self.assertEqual(report["results"], {"created": 1, "updated": 1, "skipped": 2, "invalid": 1})
+                # Later rows win.
+                self.assertEqual(self.names(), {"#aabbcc": "Lagoon", "#112233": "Midnight"})
+
+        report = self.post(self.csv(self.ROWS[0]), on_conflict="update")
+        self.assertEqual(report["results"], {"created": 0, "updated": 1, "skipped": 0, "invalid": 0})
+        self.assertEqual(self.names()["#aabbcc"], "Ocean")
+        self.assertEqual(search.search(self.user, "ocean", ["yarn"])[0]["id"], self.existing.pk)
+
+    def test_fail_rolls_back_the_whole_file(self):
+        data = self.post(self.csv(*self.ROWS[1:3]), on_conflict="fail", expected=409)
+        self.assertIn("Row 2", data["detail"])
+        self.assertEqual(self.names(), {"#aabbcc": "Sky"})
+        self.post(self.csv(self.ROWS[0]), on_conflict="fail", expected=409)
+
+    def test_json_layouts(self):
+        rows = [{"brand": "Drops", "weight": "DK", "colour": "#010203", "material": "Silk", "amount_per_skein": "25g"}]
+        report = self.post(json.dumps({"yarns": rows}), content_type="application/json")
+        self.assertEqual(report["results"]["created"], 1)
+        report = self.post("\n".join(json.dumps(r) for r in [*rows, "x"]), content_type="application/x-ndjson")
+        self.assertEqual(report["results"], {"created": 0, "updated": 0, "skipped": 1, "invalid": 1})
+        self.assertEqual(report["errors"][0]["row"], 2)
+
+    def test_bad_input(self):
+        self.post("", expected=400)
+        self.post("[{", content_type="application/json", expected=400)
+        self.post(self.csv(self.ROWS[1]), on_conflict="merge", expected=400)
+        with mock.patch.object(Yarn.objects, "bulk_create", side_effect=DataError("value too long")):
+            data = self.post(self.csv(self.ROWS[1]), expected=400)
+        self.assertIn("value too long", data["detail"])
+        self.assertEqual(self.names(), {"#aabbcc": "Sky"})
+
+
+# (reference, sample, ΔE) from Sharma, Wu & Dalal's CIEDE2000 test data.
+CIEDE2000_PAIRS = [
+    ((50.0, 2.6772, -79.7751), (50.0, 0.0, -82.7485), 2.0425),
+    ((50.0, 3.1571, -77.2803), (50.0, 0.0, -82.7485), 2.8615),
+    ((50.0, 0.0, 0.0), (50.0, -1.0, 2.0), 2.3669),
+    ((50.0, 2.49, -0.001), (50.0, -2.49, 0.0009), 7.1792),
+    ((50.0, 2.5, 0.0), (73.0, 25.0, -18.0), 27.1492),
+    ((60.2574, -34.0099, 36.2677), (60.4626, -34.1751, 39.4387), 1.2644),
+    ((2.0776, 0.0795, -1.135), (0.9033, -0.0636, -0.5514), 0.9082),
+]
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class SimilarYarnTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        cls.other = User.objects.create_user("other", password="pw")
+        cls.yarns = {
+            colour: Yarn.objects.create(user=cls.user, brand="Drops", colour=colour, weight="DK", material=colour)
+            for colour in ("#cc2020", "#c83030", "#a04040", "#2040cc", "#20a040")
+        }
+        Yarn.objects.create(user=cls.other, brand="Drops", colour="#cc2121", weight="DK")
+
+    def setUp(self):
+        colour_index.invalidate(self.user.pk)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def similar(self, query, expected=200):
+        response = self.client.get(f"/api/yarns/similar/?{query}")
+        self.assertEqual(response.status_code, expected, response.data)
+        return response.data.get("results")
+
+    def test_delta_e_matches_reference_values(self):
+        for ref, sample, expected in CIEDE2000_PAIRS:
+            with self.subTest(ref=ref, sample=sample):
+                distance = colour_index.delta_e_2000(np.array([sample]), np.array(ref))[0]
+                self.assertAlmostEqual(distance, expected, places=4)
+        # Vectorized: both references against their shared sample in one call.
+        refs = np.array([ref for ref, _, _ in CIEDE2000_PAIRS[:2]])
+        distances = colour_index.delta_e_2000(refs, np.array(CIEDE2000_PAIRS[0][1]))
+        self.assertEqual([round(float(d), 4) for d in distances], [2.0425, 2.8615])
+
+    def test_results_are_ranked_by_delta_e(self):
+        results = self.similar("colour=%23cc2020")
+        self.assertEqual([r["colour"] for r in results], ["#cc2020", "#c83030", "#a04040", "#2040cc", "#20a040"])
+        self.assertEqual(results[0]["delta_e"], 0)
+        ref = np.array(colours.hex_to_lab("#cc2020"))
+        for row in results:
+            expected = colour_index.delta_e_2000(np.array([colours.hex_to_lab(row["colour"])]), ref)[0]
+            self.assertEqual(row["delta_e"], round(float(expected), 2))
+        self.assertEqual(sorted(r["delta_e"] for r in results), [r["delta_e"] for r in results])
+
+        by_yarn = self.similar(f"yarn={self.yarns['#cc2020'].pk}&k=2")
+        self.assertEqual([r["colour"] for r in by_yarn], ["#c83030", "#a04040"])
+
+    def test_k_and_max_delta_e_limit_results(self):
+        self.assertEqual(len(self.similar("colour=%23cc2020&k=3")), 3)
+        self.assertEqual(len(self.similar("colour=%23cc2020&k=0")), 1)  # clamped to at least one
+        close = self.similar("colour=%23cc2020&max_delta_e=10")
+        self.assertTrue(close)
+        self.assertTrue(all(r["delta_e"] <= 10 for r in close))
+        self.assertLess(len(close), len(self.yarns))
+
+    def test_validation(self):
+        self.similar("", expected=400)
+        self.similar("colour=red", expected=400)
+        self.similar("colour=%23cc2020&k=many", expected=400)
+        self.similar("colour=%23cc2020&max_delta_e=far", expected=400)
+        theirs = Yarn.objects.get(user=self.other)
+        self.similar(f"yarn={theirs.pk}", expected=400)
+        self.similar("yarn=abc", expected=400)
+
+    def test_matrix_follows_colour_changes(self):
+        self.assertEqual(self.similar("colour=%2320a040&k=1")[0]["colour"], "#20a040")
+        yarn = self.yarns["#2040cc"]
+        response = self.client.patch(f"/api/yarns/{yarn.pk}/", {"colour": "#21a141"}, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertNotIn(self.user.pk, colour_index._matrices)  # dropped by the save signal
+        self.assertEqual(
+            [r["colour"] for r in self.similar("colour=%2321a141&k=2")], ["#21a141", "#20a040"]
+        )
+
+        # A write from another process skips the signal; the (count, updated_at) stamp catches it.
+        lab = colours.hex_to_lab("#cc2020")
+        Yarn.objects.filter(pk=yarn.pk).update(
+            colour="#cc2020", lab_l=lab[0], lab_a=lab[1], lab_b=lab[2], updated_at=timezone.now()
+        )
+        self.assertIn(self.user.pk, colour_index._matrices)
+        self.assertEqual([r["delta_e"] for r in self.similar("colour=%23cc2020&k=2")], [0, 0])
+
+
+class SanitizeTests(SimpleTestCase):
+    def setUp(self):
+        sanitize.clear_cache()
+
+    def test_links_open_in_a_new_tab_without_opener(self):
+        cases = {
+            '<a href="https://x.org">x</a>':
+                '<a href="https://x.org" target="_blank" rel="noopener nofollow">x</a>',
+            # other rel values are kept, ours aren't repeated, target is overridden
+            '<a href="https://x.org" rel="author noopener" target="_self">x</a>':
+                '<a href="https://x.org" rel="author noopener nofollow" target="_blank">x</a>',
+            '<a name="top">x</a>': "<a>x</a>",
+            '<a href="javascript:alert(1)">x</a>': "<a>x</a>",
+            '<p onclick="x()">hi <script>bad()</script><em>ok</em></p>': "<p>hi bad()<em>ok</em></p>",
+        }
+        for html, expected in cases.items():
+            with self.subTest(html=html):
+                self.assertEqual(sanitize.clean_uncached(html), expected)
+                self.assertEqual(sanitize.clean_uncached(expected), expected)  # idempotent
+
+    def test_memo_hit_returns_the_same_output_without_cleaning(self):
+        html = '<p>Cast on <a href="https://x.org/cast-on">80</a></p><script>x()</script>'
+        cleaned = sanitize.clean_pattern(html)
+        self.assertEqual(cleaned, sanitize.clean_uncached(html))
+        with mock.patch.object(sanitize, "clean_uncached") as clean:
+            self.assertIs(sanitize.clean_pattern(html), cleaned)
+            self.assertIs(sanitize.clean_pattern(cleaned), cleaned)  # cleaned text maps to itself
+        clean.assert_not_called()
+
+    def test_memo_is_bounded(self):
+        with mock.patch.object(sanitize, "CACHE_SIZE", 4):
+            for n in range(5):
+                sanitize.clean_pattern(f"<p>row {n}</p>")
+            self.assertLessEqual(len(sanitize._cache), 4)
+            with mock.patch.object(sanitize, "clean_uncached", wraps=sanitize.clean_uncached) as clean:
+                sanitize.clean_pattern("<p>row 0</p>")
+                sanitize.clean_pattern("<p>row 4</p>")
+        self.assertEqual(clean.call_count, 1)  # row 0 was evicted
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class BulkTagTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("knitter", password="pw")
+        cls.other = User.objects.create_user("other", password="pw")
+        cls.projects = [make_project(cls.user, name) for name in ("Socks", "Hat", "Scarf")]
+        cls.gift = Tag.objects.create(user=cls.user, name="gift")
+        cls.present = Tag.objects.create(user=cls.user, name="present")
+        cls.wool = Tag.objects.create(user=cls.user, name="wool")
+        cls.theirs = Tag.objects.create(user=cls.other, name="theirs")
+        socks, hat, _ = cls.projects
+        socks.tags.add(cls.gift)
+        hat.tags.add(cls.gift, cls.present)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post(self, path, body, expected=200):
+        response = self.client.post(f"/api/tags/{path}", body, format="json")
+        self.assertEqual(response.status_code, expected, response.data)
+        return response.data
+
+    def tags_of(self, project):
+        return sorted(project.tags.values_list("name", flat=True))
+
+    def test_apply_creates_named_tags_and_skips_existing_links(self):
+        ids = [p.pk for p in self.projects]
+        version = versioning.current(self.user.pk)[0]
+        data = self.post("apply/", {"projects": ids, "tags": [self.gift.pk], "tag_names": ["winter"]})
+        self.assertEqual(data["added"], 4)  # gift on Scarf, winter on all three
+        self.assertEqual([self.tags_of(p) for p in self.projects], [
+            ["gift", "winter"], ["gift", "present", "winter"], ["gift", "winter"],
+        ])
+        self.assertGreater(versioning.current(self.user.pk)[0], version)
+        self.assertEqual(self.post("apply/", {"projects": ids, "tag_names": ["winter"]})["added"], 0)
+
+    def test_apply_rejects_other_users_rows(self):
+        self.post("apply/", {"projects": [self.projects[0].pk], "tags": [self.theirs.pk]}, expected=400)
+        self.assertEqual(self.tags_of(self.projects[0]), ["gift"])
+
+    def test_remove(self):
+        data = self.post("remove/", {"projects": [p.pk for p in self.projects], "tag_names": ["gift"]})
+        self.assertEqual(data["removed"], 2)
+        self.assertEqual([self.tags_of(p) for p in self.projects], [[], ["present"], []])
+
+    def test_merge_moves_projects_and_deletes_source(self):
+        data = self.post(f"{self.present.pk}/merge/", {"into": self.gift.pk})
+        self.assertEqual(data["projects_added"], 0)  # Hat already had gift
+        data = self.post(f"{self.gift.pk}/merge/", {"into": self.wool.pk})
+        self.assertEqual(data["projects_added"], 2)
+        self.assertFalse(Tag.objects.filter(pk__in=[self.present.pk, self.gift.pk]).exists())
+        self.assertEqual([self.tags_of(p) for p in self.projects], [["wool"], ["wool"], []])
+
+    def test_merge_into_another_users_tag_is_rejected(self):
+        self.post(f"{self.gift.pk}/merge/", {"into": self.theirs.pk}, expected=400)
+        self.post(f"{self.gift.pk}/merge/", {"into": "x"}, expected=400)
+
+    def test_rename_many(self):
+        data = self.post("rename/", {"names": {str(self.gift.pk): "gifts", str(self.wool.pk): "yarn"}})
+        self.assertEqual(data["renamed"], 2)
+        self.assertEqual(
+            sorted(Tag.objects.filter(user=self.user).values_list("name", flat=True)),
+            ["gifts", "present", "yarn"],
+        )
+
+    def test_rename_rejects_taken_duplicate_and_foreign_names(self):
+        self.post("rename/", {"names": {str(self.gift.pk): "present"}}, expected=400)
+        self.post("rename/", {"names": {str(self.gift.pk): "a", str(self.wool.pk): "a"}}, expected=400)
+        self.post("rename/", {"names": {str(self.theirs.pk): "mine"}}, expected=400)
+        self.assertEqual(Tag.objects.get(pk=self.gift.pk).name, "gift")
+
+
+@override_settings(METRICS_RETENTION=3600)
+class MetricsRetentionTests(TestCase):
+    def snapshot(self, worker, requests, age_seconds, pools=None):
+        data = {
+            "hist": {"sql_queries|yarn-list|GET": [0, 1, 0, 0, 0, 0, 0, 0, 0, 3, requests]},
+            "requests": {"yarn-list|GET|200": requests},
+            "connects": {"default": 1},
+            "pools": pools or {},
+        }
+        MetricsSnapshot.objects.create(worker=worker, data=data)
+        MetricsSnapshot.objects.filter(worker=worker).update(
+            updated_at=timezone.now() - timedelta(seconds=age_seconds)
+        )
+
+    def test_prune_folds_exited_workers_into_one_row(self):
+        pool = {"default": {"pool_size": 4, "requests_num": 10, "connections_num": 2}}
+        self.snapshot("host:1:a", 5, age_seconds=7200, pools=pool)
+        self.snapshot("host:2:b", 7, age_seconds=7200)
+        self.snapshot("host:3:c", 11, age_seconds=5)
+        before = metrics.render()
+
+        self.assertEqual(metrics.prune(), 2)
+        self.assertEqual(
+            sorted(MetricsSnapshot.objects.values_list("worker", flat=True)), ["host:3:c", metrics.RETIRED]
+        )
+        retired = MetricsSnapshot.objects.get(worker=metrics.RETIRED).data
+        self.assertEqual(retired["requests"], {"yarn-list|GET|200": 12})
+        self.assertEqual(retired["pools"], {"default": {
+            key: {"requests_num": 10, "connections_num": 2}.get(key, 0) for key in metrics._POOL_COUNTERS
+        }})
+        self.assertEqual(metrics.render(), before)
+
+        self.snapshot("host:4:d", 1, age_seconds=7200)
+        self.assertEqual(metrics.prune(), 1)
+        retired = MetricsSnapshot.objects.get(worker=metrics.RETIRED).data
+        self.assertEqual(retired["requests"], {"yarn-list|GET|200": 13})
+        self.assertEqual(retired["hist"]["sql_queries|yarn-list|GET"][-1], 13)
+
+
+# ---- query budgets ----
+
+def jpeg(name):
+    buf = BytesIO()
+    Image.new("RGB", (16, 16), (200, 80, 40)).save(buf, "JPEG")
+    return SimpleUploadedFile(name, buf.getvalue(), content_type="image/jpeg")
+
+
+def progress_batch(ids):
+    entries = [
+        {"project": pk, "date": "2025-01-02T10:00:00Z", "rows_completed": 4, "stitches_completed": 60,
+         "images": [f"photo{i}"]}
+        for i, pk in enumerate(ids["projects"][:3])
+    ]
+    return {"entries": json.dumps(entries), **{f"photo{i}": jpeg(f"photo{i}.jpg") for i in range(len(entries))}}
+
+
+def yarn_rows(ids):
+    return [
+        {"brand": "Budget", "weight": "DK", "amount_per_skein": "100g / 230 yds",
+         "colour": f"#0000{i:02x}", "colour_name": f"Shade {i}"}
+        for i in range(20)
+    ]
+
+
+# (name, method, path, budget, body) - {placeholders} are filled in from the
+# user's rows (see QueryBudgetTests.ids); body, when given, builds the
+# request data. Bodies that name every project or tag check that bulk
+# writes stay set-based; the batch and import bodies are a fixed size,
+# since their work is meant to follow the payload. Writes run in order,
+# after the reads, because they change the rows.
+CHECKS = [
+    ("api-root", "get", "/api/", 0, None),
+    ("auth-me", "get", "/api/auth/me/", 0, None),
+    ("projects-list", "get", "/api/projects/?page_size=200", 6, None),
+    ("projects-list-sparse", "get", "/api/projects/?page_size=200&fields=id,name,tags&expand=tags", 3, None),
+    ("projects-list-full", "get", "/api/projects/?page_size=200&expand=tags,yarns,progress_updates", 6, None),
+    ("project-detail", "get", "/api/projects/{project}/", 6, None),
+    ("yarns-list", "get", "/api/yarns/?page_size=200", 2, None),
+    ("yarns-stock", "get", "/api/yarns/?page_size=200&fields=id,brand,remaining_skeins,project_count", 2, None),
+    ("yarn-detail", "get", "/api/yarns/{yarn}/", 2, None),
+    ("yarns-similar", "get", "/api/yarns/similar/?yarn={yarn}&k=10", 3, None),
+    ("tags-list", "get", "/api/tags/?page_size=200", 2, None),
+    ("tag-detail", "get", "/api/tags/{tag}/", 2, None),
+    ("project-yarns-list", "get", "/api/project-yarns/?page_size=200", 2, None),
+    ("project-yarn-detail", "get", "/api/project-yarns/{project_yarn}/", 2, None),
+    ("progress-list", "get", "/api/progress/?page_size=200", 3, None),
+    ("progress-by-project", "get", "/api/progress/?project={project}&page_size=200", 3, None),
+    ("progress-detail", "get", "/api/progress/{progress}/", 3, None),
+    ("activity", "get", "/api/stats/activity/", 1, None),
+    ("search", "get", "/api/search/?q={term}", 2, None),
+    ("backup", "get", "/api/backup/?compress=0", 7, None),
+    ("admin-users-list", "get", "/api/admin/users/", 1, None),
+    ("admin-user-detail", "get", "/api/admin/users/{user}/", 1, None),
+    ("cache-stats", "get", "/api/admin/cache-stats/", 0, None),
+    ("metrics", "get", "/api/admin/metrics", 2, None),
+    ("project-update", "patch", "/api/projects/{project}/", 21,
+     lambda ids: {"notes": "Blocked and done.", "tag_names": ["budget-check"]}),
+    ("tags-apply", "post", "/api/tags/apply/", 8,
+     lambda ids: {"projects": ids["projects"], "tag_names": ["budget-check", "budget-extra"]}),
+    ("tags-remove", "post", "/api/tags/remove/", 6,
+     lambda ids: {"projects": ids["projects"], "tag_names": ["budget-extra"]}),
+    ("tags-rename", "post", "/api/tags/rename/", 4,
+     lambda ids: {"names": {str(pk): f"renamed {i}" for i, pk in enumerate(ids["tags"])}}),
+    ("tag-merge", "post", "/api/tags/{tag}/merge/", 11, lambda ids: {"into": ids["other_tag"]}),
+    ("progress-batch", "post", "/api/progress/batch/", 14, progress_batch),
+    ("yarns-import", "post", "/api/yarns/import/?on_conflict=update", 5, yarn_rows),
+    ("admin-user-set-password", "post", "/api/admin/users/{user}/set-password/", 2,
+     lambda ids: {"new_password": "budget-check-password-9"}),
+]
+
+# Named routes with no check, and why.
+EXEMPT = {
+    "token_obtain_pair": "password hashing; touches one user row",
+    "token_refresh": "no database access",
+    "oidc_authentication_init": "redirects to the identity provider",
+    "oidc_authentication_callback": "needs a live identity provider",
+    "oidc_logout": "session only",
+    "me": "shadowed by auth_me at the same path",
+    "register": "creates one user; nothing to scale",
+    "change-password": "password hashing; touches one user row",
+    "restore-backup": "work grows with the uploaded backup by design",
+    "restore-local": "work grows with the uploaded state by design",
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"IN \(\?(?:, \?)*\)")
+_ROWS = re.compile(r"(\(\?(?:, \?)*\))(?:, \(\?(?:, \?)*\))+")
+# SQLite logs its transaction statements (and TestCase adds savepoints);
+# other backends don't, so they aren't counted.
+_CONTROL = re.compile(r"(BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE SAVEPOINT)\b")
+
+
+def normalize(sql):
+    """
+    `sql` with literals replaced by ? and IN lists and multi-row VALUES
+    collapsed, so the same query over different rows compares equal.
+    """
+    sql = _NUMBER.sub("?", _STRING.sub("?", sql))
+    return _ROWS.sub(r"\1, ...", _IN_LIST.sub("IN (...)", sql))
+
+
+def named_routes(patterns=None):
+    """
+    Names of the project's routes, skipping namespaced includes (the Django
+    admin and DRF's login views) and unnamed ones (media in DEBUG).
+    """
+    names = set()
+    for pattern in get_resolver().url_patterns if patterns is None else patterns:
+        if isinstance(pattern, URLResolver):
+            if not pattern.namespace:
+                names |= named_routes(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def sql_diff(name, small, large):
+    """
+    The two accounts' queries, normalized and diffed; identical query lists
+    are printed once, numbered.
+    """
+    a, b = [normalize(q) for q in small], [normalize(q) for q in large]
+    if a == b:
+        return "\n".join(f"    {i:>3}. {q}" for i, q in enumerate(b, 1))
+    diff = difflib.unified_diff(
+        a, b, fromfile=f"{name} (small, {len(a)} queries)",
+        tofile=f"{name} (large, {len(b)} queries)", lineterm="", n=2,
+    )
+    return "\n".join(f"    {line}" for line in diff)
+
+
+@override_settings(METRICS_ENABLED=False, RESPONSE_CACHE_TIMEOUT=0)
+class QueryBudgetTests(MediaRootMixin, TestCase):
+    """
+    Every route is called as a small and a large account (seeded by
+    seed_load) and must issue the same number of queries for both, within
+    its budget in CHECKS. Failures print both accounts' SQL, diffed.
+    """
+    SMALL = {"projects": 4, "yarns": 6, "progress": 2, "image_ratio": 1.0}
+    LARGE = {"projects": 60, "yarns": 150, "progress": 10, "image_ratio": 1.0}
+
+    @classmethod
+    def setUpTestData(cls):
+        rng, patterns = random.Random(0), sample_patterns()
+        cls.users = {
+            "small": cls.seed_account("budget-small", cls.SMALL, rng, patterns),
+            "large": cls.seed_account("budget-large", cls.LARGE, rng, patterns),
+        }
+
+    @staticmethod
+    def seed_account(username, sizes, rng, patterns):
+        # staff, for the admin routes; bulk_create skips the promote-first-user signal
+        user = User.objects.bulk_create([
+            User(username=username, password=make_password("budget-check"), is_staff=True)
+        ])[0]
+        seed_user(user, rng, sizes, patterns)
+        return user
+
+    @staticmethod
+    def ids(user):
+        """
+        Row ids for the check paths and bodies. Detail checks use the rows
+        with the most related rows, so both accounts take the same branches
+        (e.g. a tag merge that has projects to move).
+        """
+        projects = list(
+            Project.objects.filter(user=user)
+            .annotate(n=Count("progress_updates", distinct=True) + Count("tags", distinct=True))
+            .order_by("-n", "pk").values_list("pk", "name")
+        )
+        tags = list(
+            Tag.objects.filter(user=user).annotate(n=Count("project"))
+            .order_by("-n", "pk").values_list("pk", flat=True)
+        )
+        return {
+            "user": user.pk,
+            "project": projects[0][0],
+            "projects": [pk for pk, _ in projects],
+            "term": projects[0][1].split()[-2],
+            "yarn": Yarn.objects.filter(user=user).order_by("pk").values_list("pk", flat=True).first(),
+            "tag": tags[0],
+            "other_tag": tags[1],
+            "tags": tags,
+            "project_yarn": ProjectYarn.objects.filter(project__user=user).values_list("pk", flat=True).first(),
+            "progress": (
+                ProjectProgress.objects.filter(project__user=user).annotate(n=Count("images"))
+                .order_by("-n", "pk").values_list("pk", flat=True).first()
+            ),
+        }
+
+    @staticmethod
+    def consume(response):
+        if response.streaming:
+            return b"".join(response.streaming_content)
+        return response.content
+
+    def capture(self, client, method, path, body, ids):
+        path = path.format(**ids)
+        kwargs = {}
+        if body is not None:
+            data = body(ids)
+            files = isinstance(data, dict) and any(isinstance(v, SimpleUploadedFile) for v in data.values())
+            kwargs = {"data": data, "format": "multipart" if files else "json"}
+        else:
+            # reads run once first so per-process caches are warm for both accounts
+            self.consume(getattr(client, method)(path))
+        # on_commit callbacks (queued tasks) run inside the capture, as they
+        # would outside the test transaction.
+        with CaptureQueriesContext(connection) as captured, self.captureOnCommitCallbacks(execute=True):
+            response = getattr(client, method)(path, **kwargs)
+            content = self.consume(response)
+        self.assertLess(response.status_code, 400, f"{method.upper()} {path}: {content[:500]!r}")
+        return [q["sql"] for q in captured.captured_queries if not _CONTROL.match(q["sql"])]
+
+    def run_checks(self, checks):
+        clients, ids = {}, {}
+        for label, user in self.users.items():
+            clients[label] = APIClient()
+            clients[label].force_authenticate(user)
+            ids[label] = self.ids(user)
+        for name, method, path, budget, body in checks:
+            with self.subTest(name):
+                small, large = (
+                    self.capture(clients[label], method, path, body, ids[label]) for label in ("small", "large")
+                )
+                sql = sql_diff(name, small, large)
+                self.assertEqual(len(small), len(large), f"query count grows with the rows:\n{sql}")
+                self.assertLessEqual(len(large), budget, f"over budget:\n{sql}")
+
+    def test_reads(self):
+        self.run_checks([check for check in CHECKS if check[1] == "get"])
+
+    def test_writes(self):
+        self.run_checks([check for check in CHECKS if check[1] != "get"])
+
+    def test_every_route_has_a_budget(self):
+        stand_ins = dict.fromkeys(["project", "yarn", "tag", "project_yarn", "progress", "user", "term"], 1)
+        checked = {resolve(path.split("?")[0].format(**stand_ins)).url_name for _, _, path, _, _ in CHECKS}
+        self.assertEqual(sorted(named_routes() - checked - set(EXEMPT)), [])
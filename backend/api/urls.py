@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 
 from .views import (
     ProjectViewSet, TagViewSet, ProjectProgressViewSet, YarnViewSet, ProjectYarnViewSet,
-    ChangePasswordView, RegisterView, AdminUserViewSet, me
+    ChangePasswordView, RegisterView, AdminUserViewSet, ActivityStatsView, SearchView, cache_stats, me,
+    request_metrics,
 )
 
 router = DefaultRouter()
@@ -23,5 +24,10 @@ urlpatterns = [
     path('auth/change-password/', ChangePasswordView.as_view(), name='change-password'),
     path('auth/me/', me, name='me'),  
 
+    path('search/', SearchView.as_view(), name='search'),
+    path('stats/activity/', ActivityStatsView.as_view(), name='stats-activity'),
+
+    path('admin/cache-stats/', cache_stats, name='cache-stats'),
+    path('admin/metrics', request_metrics, name='metrics'),
     path('admin/', include(admin_router.urls)),  ]
 
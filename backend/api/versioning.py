@@ -0,0 +1,54 @@
+"""
+Per-user data version stamps for conditional GETs.
+
+Every write to a user's projects, yarns, tags, project-yarns, progress or
+progress images bumps their DataVersion (via api.signals, or explicitly
+after bulk operations that bypass signals). An ETag derived from it changes
+exactly when something the user can read may have changed.
+"""
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DataVersion
+
+
+def bump(user_id):
+    if user_id is None:
+        return
+    now = timezone.now()
+    updated = DataVersion.objects.filter(user_id=user_id).update(
+        version=F("version") + 1, changed_at=now
+    )
+    if updated:
+        return
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(user_id=user_id, version=1, changed_at=now)
+    except IntegrityError:
+        DataVersion.objects.filter(user_id=user_id).update(
+            version=F("version") + 1, changed_at=now
+        )
+
+
+def current(user_id):
+    """
+    (version, changed_at); (0, None) for a user who never wrote anything.
+    """
+    row = DataVersion.objects.filter(user_id=user_id).values_list("version", "changed_at").first()
+    return row or (0, None)
+
+
+def etag_for(request, version):
+    """
+    Strong ETag for this user's view of this URL at `version`.
+    """
+    key = "|".join([
+        str(request.user.pk),
+        str(version),
+        request.get_full_path(),
+        request.META.get("HTTP_ACCEPT", ""),
+    ])
+    return '"%s"' % hashlib.sha1(key.encode("utf-8")).hexdigest()
@@ -1,5 +1,19 @@
-from django.db import transaction
-from django.db.models import Count, Q
+import csv
+import json
+import zoneinfo
+from calendar import timegm
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, FloatField, Q, Prefetch, Sum, Value, prefetch_related_objects
+from django.db.models.functions import Cast, Coalesce, NullIf, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework import viewsets, permissions, parsers, filters, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -12,11 +26,17 @@ from rest_framework.permissions import IsAdminUser
 from django.contrib.auth import get_user_model
 from rest_framework.decorators import action
 from rest_framework_simplejwt.tokens import RefreshToken
-from .models import Project, Tag, ProjectProgress, Yarn, ProgressImage, ProjectYarn
+from . import (
+    colour_index, colours, images, metrics, response_cache, rollups, search, tagging, tasks, versioning,
+    yarn_import,
+)
+from .models import (
+    Project, Tag, ProjectProgress, ProjectDailyStats, Yarn, ProgressImage, ProjectYarn, SearchDocument
+)
 from .serializers import (
     ProjectSerializer, TagSerializer, ProjectProgressSerializer, YarnSerializer,
-    ProgressImageSerializer, ProjectYarnLinkSerializer, ChangePasswordSerializer,
-    RegisterSerializer, AdminUserSerializer
+    ProgressImageSerializer, ProjectYarnLinkSerializer, ProgressBatchEntrySerializer,
+    ChangePasswordSerializer, RegisterSerializer, AdminUserSerializer, request_selection
 )
 
 User = get_user_model()
@@ -80,6 +100,25 @@ class AdminUserViewSet(viewsets.ModelViewSet):
         user.save()
         return Response({"detail": "Password updated."}, status=200)
 
+@api_view(["GET", "DELETE"])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def cache_stats(request):
+    """
+    Response cache hit/miss counters; DELETE resets them.
+    """
+    if request.method == "DELETE":
+        response_cache.reset_stats()
+    return Response(response_cache.stats())
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated, IsAdminUser])
+def request_metrics(request):
+    """
+    Request metrics of every worker, in Prometheus text format.
+    """
+    metrics.flush()
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 class RegisterView(APIView):
     permission_classes = [AllowAny]
 
@@ -133,7 +172,78 @@ class OwnedQuerysetMixin:
         serializer.save(user=self.request.user)
 
 
-class ProjectViewSet(OwnedQuerysetMixin, viewsets.ModelViewSet):
+class ConditionalGetMixin:
+    """
+    ETag/Last-Modified for list and retrieve, keyed on the user's DataVersion.
+    A matching If-None-Match (or If-Modified-Since) is answered with 304
+    after a single lookup, before the viewset builds querysets or serializes.
+    Otherwise the serialized body comes from api.response_cache when the same
+    version was served before.
+    """
+    def _conditional(self, request, handler, *args, **kwargs):
+        version, changed_at = versioning.current(request.user.pk)
+        etag = versioning.etag_for(request, version)
+        # Whole UTC seconds, as HTTP dates are (and as django's @condition does);
+        # a fractional timestamp is always newer than the client's date.
+        last_modified = timegm(changed_at.utctimetuple()) if changed_at else None
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = self._cached(request, version, handler, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            if changed_at:
+                response["Last-Modified"] = http_date(last_modified)
+            patch_vary_headers(response, ("Authorization", "Cookie"))
+            response["Cache-Control"] = "private, no-cache"
+        return response
+
+    def _cached(self, request, version, handler, *args, **kwargs):
+        if not response_cache.enabled():
+            return handler(request, *args, **kwargs)
+        key = response_cache.key_for(request, version)
+        entry = response_cache.get(key)
+        if entry is not None:
+            data, status_code = entry
+            response = Response(data, status=status_code)
+            response["X-Cache"] = "HIT"
+            return response
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response_cache.put(key, response.data, response.status_code)
+        response["X-Cache"] = "MISS"
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self._conditional(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._conditional(request, super().retrieve, *args, **kwargs)
+
+
+def project_prefetches(selection=None):
+    """
+    Batched loads for what ProjectSerializer nests: one query per relation
+    regardless of how many projects are on the page. `selection` is the
+    serializer's field selection; nested relations it leaves out are skipped.
+    """
+    yarns = (selection or {}).get("yarns")
+    progress = (selection or {}).get("progress_updates")
+
+    yarn_qs = ProjectYarn.objects.order_by("id")
+    if yarns is None or "yarn" in yarns:
+        yarn_qs = yarn_qs.select_related("yarn")
+    progress_qs = ProjectProgress.objects.order_by("-date")
+    if progress is None or "images" in progress:
+        progress_qs = progress_qs.prefetch_related("images")
+
+    return {
+        "tags": Prefetch("tags", queryset=Tag.objects.order_by("name")),
+        "yarns": Prefetch("yarns", queryset=yarn_qs),
+        "progress_updates": Prefetch("progress_updates", queryset=progress_qs),
+    }
+
+
+class ProjectViewSet(ConditionalGetMixin, OwnedQuerysetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Project.objects.all().order_by("-id")
     serializer_class = ProjectSerializer
@@ -141,16 +251,238 @@ class ProjectViewSet(OwnedQuerysetMixin, viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter]
     search_fields = ["name", "notes"]
 
+    # Relations each read action serializes. Writes get nothing up front:
+    # DRF drops the prefetch cache after saving, so _prefetch_saved loads
+    # them once the instance is saved instead.
+    prefetch_plan = {
+        "list": ("tags", "yarns", "progress_updates"),
+        "retrieve": ("tags", "yarns", "progress_updates"),
+    }
+    saved_relations = ("tags", "yarns", "progress_updates")
+
+    def get_prefetch_relations(self, selection):
+        return [r for r in self.prefetch_plan.get(self.action, ()) if r in selection]
+
+    def _prefetch_saved(self, project):
+        """
+        Batch-load what the response nests for a just-saved project, so its
+        progress entries' images aren't fetched one entry at a time.
+        """
+        selection = request_selection(self.get_serializer_class(), self.request)
+        available = project_prefetches(selection)
+        project._prefetched_objects_cache = {}
+        prefetch_related_objects(
+            [project], *(available[r] for r in self.saved_relations if r in selection)
+        )
+
+    def _queue_derivatives(self, project):
+        stale = not images.derivatives_current(project.main_image_variants, project.main_image)
+        if stale and (project.main_image or project.main_image_variants):
+            tasks.enqueue(
+                tasks.generate_image_derivatives,
+                "api.Project", project.pk, "main_image", "main_image_variants",
+            )
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self._queue_derivatives(serializer.instance)
+        self._prefetch_saved(serializer.instance)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self._queue_derivatives(serializer.instance)
 
-class YarnViewSet(OwnedQuerysetMixin, viewsets.ModelViewSet):
+    def update(self, request, *args, **kwargs):
+        # UpdateModelMixin.update, but the saved project's relations are
+        # reloaded in bulk rather than its prefetch cache just being dropped.
+        partial = kwargs.pop("partial", False)
+        serializer = self.get_serializer(self.get_object(), data=request.data, partial=partial)
+        serializer.is_valid(raise_exception=True)
+        self.perform_update(serializer)
+        self._prefetch_saved(serializer.instance)
+        return Response(serializer.data)
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        selection = request_selection(self.get_serializer_class(), self.request)
+        available = project_prefetches(selection)
+        relations = self.get_prefetch_relations(selection)
+        if relations:
+            qs = qs.prefetch_related(*(available[r] for r in relations))
+        return qs
+
+
+def usage_skeins(usage="", yarn="yarn__"):
+    """
+    Skeins a ProjectYarn usage accounts for: quantity_used_skeins, or else
+    quantity_used_grams divided by the yarn's grams_per_skein. `usage` and
+    `yarn` are the lookup paths to the ProjectYarn and its Yarn from the
+    queried model (defaults: querying ProjectYarn).
+    """
+    decimal = DecimalField(max_digits=9, decimal_places=2)
+    # Divide as floats: SQLite would otherwise do integer division on whole numbers.
+    grams = Cast(F(f"{usage}quantity_used_grams"), FloatField())
+    per_skein = NullIf(F(f"{yarn}grams_per_skein"), Value(Decimal("0")))
+    return Coalesce(
+        F(f"{usage}quantity_used_skeins"),
+        Cast(grams / per_skein, decimal),
+        output_field=decimal,
+    )
+
+
+def with_stock(qs):
+    """
+    Annotate yarns with used_skeins (sum over their project usages, grams
+    converted at the yarn's grams_per_skein), remaining_skeins (owned - used;
+    null when owned isn't tracked) and project_count, in one grouped join.
+    """
+    return qs.annotate(
+        used_skeins=Coalesce(
+            Sum(usage_skeins(usage="project_usages__", yarn="")),
+            Value(Decimal("0")),
+            output_field=DecimalField(max_digits=9, decimal_places=2),
+        ),
+        project_count=Count("project_usages"),
+    ).annotate(
+        remaining_skeins=ExpressionWrapper(
+            F("quantity_owned_skeins") - F("used_skeins"),
+            output_field=DecimalField(max_digits=9, decimal_places=2),
+        ),
+    )
+
+
+class YarnViewSet(ConditionalGetMixin, OwnedQuerysetMixin, viewsets.ModelViewSet):
+    """
+    ?stock=available|used_up|over_allocated|untracked filters on
+    remaining_skeins; ?in_use=true|false on whether any project uses the yarn.
+    ?weight_category=dk,worsted and ?<grams|yards|meters>_per_skein__<gte|lte|gt|lt>=
+    filter on the parsed label columns.
+    """
     permission_classes = [IsAuthenticated]
     queryset = Yarn.objects.all().order_by("brand", "colour")
     serializer_class = YarnSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ["brand", "weight", "material", "colour_name"]
 
+    stock_filters = {
+        "available": Q(remaining_skeins__gt=0),
+        "used_up": Q(remaining_skeins=0),
+        "over_allocated": Q(remaining_skeins__lt=0),
+        "untracked": Q(quantity_owned_skeins__isnull=True),
+    }
+    stock_fields = {"used_skeins", "remaining_skeins", "project_count"}
+    range_fields = ("grams_per_skein", "yards_per_skein", "meters_per_skein")
+    range_lookups = ("gte", "lte", "gt", "lt")
+
+    def filter_label_columns(self, qs, params):
+        for field in self.range_fields:
+            for lookup in self.range_lookups:
+                name = f"{field}__{lookup}"
+                raw = params.get(name)
+                if raw in (None, ""):
+                    continue
+                try:
+                    value = Decimal(raw)
+                except ArithmeticError:
+                    raise ValidationError({name: "Must be a number."})
+                qs = qs.filter(**{name: value})
+        categories = [c for c in (params.get("weight_category") or "").split(",") if c]
+        if categories:
+            qs = qs.filter(weight_category__in=categories)
+        return qs
+
+    @action(detail=False, methods=["get"])
+    def similar(self, request):
+        """
+        Yarns closest in colour (CIEDE2000) to ?colour=#AABBCC, or to the
+        colour of ?yarn=<id> (which is left out of the results).
+        ?k= caps the count (default 10), ?max_delta_e= the distance.
+        """
+        params = request.query_params
+        exclude = None
+        if params.get("yarn"):
+            ref = None
+            if params["yarn"].isdigit():
+                ref = Yarn.objects.filter(user=request.user, pk=params["yarn"]).first()
+            if ref is None:
+                raise ValidationError({"yarn": "Not your yarn."})
+            lab, exclude = colours.hex_to_lab(ref.colour), ref.pk
+        else:
+            lab = colours.hex_to_lab(params.get("colour"))
+        if lab is None:
+            raise ValidationError({"colour": "Give a hex colour (e.g. #AABBCC) or a yarn id."})
+        try:
+            k = max(1, min(int(params.get("k") or 10), 100))
+            max_delta_e = float(params["max_delta_e"]) if params.get("max_delta_e") else None
+        except ValueError:
+            raise ValidationError({"k": "k and max_delta_e must be numbers."})
+
+        hits = colour_index.nearest(request.user.pk, lab, k=k, exclude=exclude, max_delta_e=max_delta_e)
+        yarns = Yarn.objects.filter(pk__in=[pk for pk, _ in hits]).in_bulk()
+        results = []
+        for pk, distance in hits:
+            if pk not in yarns:
+                continue
+            data = self.get_serializer(yarns[pk]).data
+            data["delta_e"] = round(distance, 2)
+            results.append(data)
+        return Response({"results": results})
+
+    @action(detail=False, methods=["post"], url_path="import")
+    def import_yarns(self, request):
+        """
+        Add many yarns at once (see api.yarn_import). The body is the CSV or
+        JSON file itself, or a multipart upload in `file`.
+        ?on_conflict=skip (default), update or fail decides what happens to
+        yarns already in the stash. Invalid rows are reported, not imported.
+        """
+        on_conflict = request.query_params.get("on_conflict", "skip")
+        if on_conflict not in yarn_import.CONFLICT_STRATEGIES:
+            raise ValidationError(
+                {"on_conflict": f"Choose from {', '.join(yarn_import.CONFLICT_STRATEGIES)}."}
+            )
+        if request.content_type.startswith("multipart/"):
+            stream = request.FILES.get("file")
+        else:
+            stream = request.stream
+        if stream is None:
+            raise ValidationError({"detail": "Empty body."})
+
+        importer = yarn_import.YarnImporter(request.user, on_conflict=on_conflict)
+        try:
+            with transaction.atomic():
+                report = importer.run(yarn_import.iter_rows(stream))
+        except (yarn_import.YarnImportConflict, IntegrityError) as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        except (yarn_import.YarnImportError, UnicodeDecodeError, csv.Error) as exc:
+            raise ValidationError({"detail": str(exc)})
+        except DataError as exc:
+            # A value the row validation let through but the database rejects.
+            raise ValidationError({"detail": f"A value doesn't fit its column: {exc}"})
+        return Response({"on_conflict": on_conflict, **report})
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        params = self.request.query_params
+        qs = self.filter_label_columns(qs, params)
+        stock = params.get("stock")
+        in_use = params.get("in_use")
+        selected = self.stock_fields & set(request_selection(self.get_serializer_class(), self.request))
+        if self.action not in ("list", "retrieve") or not (selected or stock or in_use):
+            return qs
+        qs = with_stock(qs)
+        if stock:
+            if stock not in self.stock_filters:
+                raise ValidationError({"stock": f"Choose from {', '.join(self.stock_filters)}."})
+            qs = qs.filter(self.stock_filters[stock])
+        if in_use in ("true", "1"):
+            qs = qs.filter(project_count__gt=0)
+        elif in_use in ("false", "0"):
+            qs = qs.filter(project_count=0)
+        return qs
 
-class TagViewSet(OwnedQuerysetMixin, viewsets.ModelViewSet):
+
+class TagViewSet(ConditionalGetMixin, OwnedQuerysetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     queryset = Tag.objects.all().order_by("name")
     serializer_class = TagSerializer
@@ -160,10 +492,110 @@ class TagViewSet(OwnedQuerysetMixin, viewsets.ModelViewSet):
     def get_queryset(self):
         qs = super().get_queryset()
         u = self.request.user
+        if "project_count" not in request_selection(self.get_serializer_class(), self.request):
+            return qs
         return qs.annotate(project_count=Count("project", filter=Q(project__user=u), distinct=True))
 
+    # Bulk operations (see api.tagging): a fixed number of queries each,
+    # however many projects and tags they cover.
+
+    @staticmethod
+    def _id_list(data, name, required=True):
+        raw = data.get(name)
+        if raw in (None, []) and not required:
+            return []
+        if not isinstance(raw, list) or not raw or not all(isinstance(v, int) for v in raw):
+            raise ValidationError({name: "Give a non-empty list of ids."})
+        return raw
+
+    def _owned(self, model, ids, name):
+        found = set(model.objects.filter(user=self.request.user, pk__in=ids).values_list("pk", flat=True))
+        unknown = sorted(set(ids) - found)
+        if unknown:
+            raise ValidationError({name: f"Not yours: {', '.join(map(str, unknown))}."})
+        return found
+
+    def _bulk_targets(self, request, create):
+        """
+        (project ids, tag ids) from {"projects": [...], "tags": [ids], "tag_names": [...]}.
+        """
+        project_ids = self._owned(Project, self._id_list(request.data, "projects"), "projects")
+        tag_ids = self._owned(Tag, self._id_list(request.data, "tags", required=False), "tags")
+        names = request.data.get("tag_names") or []
+        if not isinstance(names, list) or not all(isinstance(n, str) for n in names):
+            raise ValidationError({"tag_names": "Give a list of names."})
+        names = [n.strip() for n in names if n.strip()]
+        if names:
+            if create:
+                tag_ids |= {t.pk for t in tagging.ensure_tags(request.user, names)}
+            else:
+                tag_ids |= set(self.get_queryset().filter(name__in=names).values_list("pk", flat=True))
+        if not tag_ids and not names:
+            raise ValidationError({"tags": "Give tags or tag_names."})
+        return project_ids, tag_ids
+
+    @action(detail=False, methods=["post"], url_path="apply")
+    def bulk_apply(self, request):
+        """
+        Tag many projects at once; tag_names that don't exist are created.
+        """
+        project_ids, tag_ids = self._bulk_targets(request, create=True)
+        added = tagging.add(request.user, project_ids, tag_ids)
+        return Response({"added": added})
+
+    @action(detail=False, methods=["post"], url_path="remove")
+    def bulk_remove(self, request):
+        project_ids, tag_ids = self._bulk_targets(request, create=False)
+        removed = tagging.remove(request.user, project_ids, tag_ids)
+        return Response({"removed": removed})
+
+    @action(detail=True, methods=["post"])
+    def merge(self, request, pk=None):
+        """
+        Fold this tag into {"into": <tag id>}: its projects get that tag
+        instead, and this one is deleted.
+        """
+        source = self.get_object()
+        into = request.data.get("into")
+        target = self.get_queryset().filter(pk=into).first() if isinstance(into, int) else None
+        if target is None or target.pk == source.pk:
+            raise ValidationError({"into": "Give another of your tags."})
+        moved = tagging.merge(request.user, source, target)
+        return Response({"into": target.pk, "projects_added": moved})
+
+    @action(detail=False, methods=["post"], url_path="rename")
+    def bulk_rename(self, request):
+        """
+        {"names": {"<tag id>": "new name", ...}}
+        """
+        raw = request.data.get("names")
+        if not isinstance(raw, dict) or not raw:
+            raise ValidationError({"names": "Map tag ids to new names."})
+        max_length = Tag._meta.get_field("name").max_length
+        names = {}
+        for key, name in raw.items():
+            name = name.strip() if isinstance(name, str) else ""
+            if not str(key).isdigit() or not name or len(name) > max_length:
+                raise ValidationError({"names": f"Invalid entry for {key!r}."})
+            names[int(key)] = name
+        self._owned(Tag, list(names), "names")
+        if len(set(names.values())) != len(names):
+            raise ValidationError({"names": "New names must be distinct."})
+        taken = set(
+            self.get_queryset().filter(name__in=names.values()).exclude(pk__in=names)
+            .values_list("name", flat=True)
+        )
+        if taken:
+            raise ValidationError({"names": f"Already in use: {', '.join(sorted(taken))}."})
+        try:
+            renamed = tagging.rename(request.user, names)
+        except IntegrityError:
+            # e.g. two tags swapping names, which the unique constraint sees mid-update
+            return Response({"detail": "Those renames collide."}, status=status.HTTP_409_CONFLICT)
+        return Response({"renamed": renamed})
+
 
-class ProjectYarnViewSet(viewsets.ModelViewSet):
+class ProjectYarnViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = ProjectYarnLinkSerializer
     queryset = ProjectYarn.objects.select_related("project", "yarn").order_by("-id")
@@ -171,6 +603,8 @@ class ProjectYarnViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         u = self.request.user
         qs = super().get_queryset().filter(project__user=u, yarn__user=u)
+        if self.action in ("list", "retrieve"):
+            qs = qs.annotate(skeins_equivalent=usage_skeins())
         project_id = self.request.query_params.get("project")
         if project_id:
             qs = qs.filter(project_id=project_id)
@@ -185,17 +619,19 @@ class ProjectYarnViewSet(viewsets.ModelViewSet):
         serializer.save()
 
 
-class ProjectProgressViewSet(viewsets.ModelViewSet):
+class ProjectProgressViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = ProjectProgressSerializer
     queryset = ProjectProgress.objects.select_related("project").order_by("-date")
     parser_classes = [parsers.MultiPartParser, parsers.FormParser, parsers.JSONParser]
     filter_backends = [filters.SearchFilter]
-    search_fields = ["title", "notes"]
+    search_fields = ["notes"]
 
     def get_queryset(self):
         u = self.request.user
         qs = super().get_queryset().filter(project__user=u)
+        if "images" in request_selection(self.get_serializer_class(), self.request):
+            qs = qs.prefetch_related("images")
         pid = self.request.query_params.get("project")
         return qs.filter(project_id=pid) if pid else qs
 
@@ -216,10 +652,7 @@ class ProjectProgressViewSet(viewsets.ModelViewSet):
             raise ValidationError({"project": "Not your project."})
 
         progress = serializer.save(project=project)
-
-        files = self.request.FILES.getlist("images")
-        for f in files:
-            ProgressImage.objects.create(progress=progress, image=f)
+        self._attach_images(progress)
 
     @transaction.atomic
     def perform_update(self, serializer):
@@ -227,10 +660,187 @@ class ProjectProgressViewSet(viewsets.ModelViewSet):
         if progress.project.user_id != self.request.user.id:
             raise ValidationError("Not your project.")
         progress = serializer.save()
+        self._attach_images(progress)
+
+    def _attach_images(self, progress):
+        uploads = [ProgressImage(progress=progress, image=f) for f in self.request.FILES.getlist("images")]
+        images.store_uploads(uploads, "image")
+        for img in uploads:
+            img.save()
+            tasks.enqueue(
+                tasks.generate_image_derivatives,
+                "api.ProgressImage", img.pk, "image", "variants",
+            )
+
+    max_batch = 500
+
+    @action(detail=False, methods=["post"])
+    def batch(self, request):
+        """
+        Log many entries, across projects, in one request. `entries` is a
+        list (a JSON string in multipart bodies) of
+        {project, date, rows_completed, stitches_completed, notes, images},
+        where `images` names the file fields carrying that entry's photos.
+        All or nothing; returns the created entries.
+        """
+        raw = request.data.get("entries")
+        if isinstance(raw, str):
+            try:
+                raw = json.loads(raw)
+            except ValueError:
+                raise ValidationError({"entries": "Must be a JSON list."})
+        if not isinstance(raw, list) or not raw:
+            raise ValidationError({"entries": "Give a non-empty list of entries."})
+        if len(raw) > self.max_batch:
+            raise ValidationError({"entries": f"At most {self.max_batch} entries per batch."})
+        ser = ProgressBatchEntrySerializer(data=raw, many=True)
+        ser.is_valid(raise_exception=True)
+        entries = ser.validated_data
+
+        projects = Project.objects.filter(
+            user=request.user, pk__in={e["project"] for e in entries}
+        ).only("id", "name", "user_id").in_bulk()
+        errors = [{} for _ in entries]
+        for entry, error in zip(entries, errors):
+            if entry["project"] not in projects:
+                error["project"] = ["Not your project."]
+            missing = [name for name in entry["images"] if name not in request.FILES]
+            if missing:
+                error["images"] = [f"No file uploaded as {name!r}." for name in missing]
+        if any(errors):
+            raise ValidationError({"entries": errors})
+
+        with transaction.atomic():
+            created = ProjectProgress.objects.bulk_create([
+                ProjectProgress(
+                    project=projects[e["project"]],
+                    **{k: v for k, v in e.items() if k not in ("project", "images")},
+                )
+                for e in entries
+            ])
+            uploads = [
+                ProgressImage(progress=progress, image=f)
+                for progress, e in zip(created, entries)
+                for name in e["images"]
+                for f in request.FILES.getlist(name)
+            ]
+            images.store_uploads(uploads, "image")
+            uploads = ProgressImage.objects.bulk_create(uploads)
+            # bulk_create skips the post_save signals that keep these current.
+            rollups.apply_many(request.user.pk, [rollups.snapshot(p) for p in created])
+            search.index_many(created)
+            versioning.bump(request.user.pk)
+            tasks.enqueue_many(
+                tasks.generate_image_derivatives,
+                [("api.ProgressImage", img.pk, "image", "variants") for img in uploads],
+            )
+
+        prefetch_related_objects(created, "images")
+        data = ProjectProgressSerializer(created, many=True, context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_201_CREATED)
+
+def _parse_day(request, name):
+    raw = request.query_params.get(name)
+    if not raw:
+        return None
+    try:
+        value = parse_date(raw)
+    except ValueError:
+        value = None
+    if value is None:
+        raise ValidationError({name: "Use YYYY-MM-DD."})
+    return value
+
+
+class ActivityStatsView(APIView):
+    """
+    Per-day progress totals for the contribution calendar:
+
+        GET /api/stats/activity/?start=2025-10-01&end=2026-09-30&tz=Europe/Berlin
 
-        files = self.request.FILES.getlist("images")
-        for f in files:
-            ProgressImage.objects.create(progress=progress, image=f)
+    Days are bucketed in `tz` (default TIME_ZONE); only days with activity are
+    returned, optionally for one `project`. The range defaults to the year
+    ending today. In TIME_ZONE the answer comes from the ProjectDailyStats
+    rollup; other zones aggregate ProjectProgress on the fly.
+    """
+    permission_classes = [IsAuthenticated]
+    max_days = 3 * 366
+
+    def get(self, request):
+        tzname = request.query_params.get("tz") or settings.TIME_ZONE
+        try:
+            tz = zoneinfo.ZoneInfo(tzname)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            raise ValidationError({"tz": "Unknown time zone."})
+
+        end = _parse_day(request, "end") or timezone.localdate(timezone=tz)
+        start = _parse_day(request, "start") or end - timedelta(days=364)
+        if start > end:
+            raise ValidationError({"start": "Must not be after end."})
+        if (end - start).days >= self.max_days:
+            raise ValidationError({"start": f"Range is limited to {self.max_days} days."})
+
+        project = request.query_params.get("project")
+        if project and not project.isdigit():
+            raise ValidationError({"project": "Must be a project id."})
+        if tz.key == timezone.get_default_timezone_name():
+            # Bucketed the same way as the rollup table: read that instead.
+            days = ProjectDailyStats.objects.filter(user=request.user, day__range=(start, end))
+            if project:
+                days = days.filter(project_id=project)
+            days = (
+                days.values("day")
+                .annotate(rows=Sum("rows"), stitches=Sum("stitches"), entries=Sum("entries"))
+                .order_by("day")
+            )
+        else:
+            lo = datetime.combine(start, time.min, tzinfo=tz)
+            hi = datetime.combine(end + timedelta(days=1), time.min, tzinfo=tz)
+            days = ProjectProgress.objects.filter(project__user=request.user, date__gte=lo, date__lt=hi)
+            if project:
+                days = days.filter(project_id=project)
+            days = (
+                days.annotate(day=TruncDate("date", tzinfo=tz))
+                .values("day")
+                .annotate(
+                    rows=Sum("rows_completed"),
+                    stitches=Sum("stitches_completed"),
+                    entries=Count("id"),
+                )
+                .order_by("day")
+            )
+        return Response({
+            "start": start,
+            "end": end,
+            "tz": tzname,
+            "days": [
+                {"date": d["day"], "rows": d["rows"], "stitches": d["stitches"], "entries": d["entries"]}
+                for d in days
+            ],
+        })
+
+class SearchView(APIView):
+    """
+    Ranked full-text search across the user's projects (name, notes, pattern
+    text), progress notes and yarns:
+
+        GET /api/search/?q=merino socks&kind=project,yarn&limit=20
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        q = (request.query_params.get("q") or "").strip()
+        if not q:
+            raise ValidationError({"q": "This field is required."})
+        kinds = [k for k in (request.query_params.get("kind") or "").split(",") if k]
+        valid = {k for k, _ in SearchDocument.KIND_CHOICES}
+        if set(kinds) - valid:
+            raise ValidationError({"kind": f"Choose from {', '.join(sorted(valid))}."})
+        try:
+            limit = int(request.query_params.get("limit") or 20)
+        except ValueError:
+            raise ValidationError({"limit": "Must be an integer."})
+        return Response({"query": q, "results": search.search(request.user, q, kinds, limit)})
 
 def _guard_self_deactivation(self, request, instance, data):
     if not data:
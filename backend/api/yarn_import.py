@@ -0,0 +1,199 @@
+"""
+Bulk yarn import from CSV or JSON.
+
+Rows are read from a byte stream one at a time (CSV, NDJSON, or a JSON
+array / {"yarns": [...]} document, which has to be parsed whole), checked
+with the model's field validation, and written with bulk_create /
+bulk_update in batches. A yarn is identified by its signature
+(uniq_yarn_signature_per_user); what happens when an imported row's
+signature is already in the stash, or earlier in the file, is `on_conflict`:
+
+  skip   - keep the existing yarn as it is
+  update - copy the row's colour name, product link and skein count onto it
+  fail   - raise YarnImportConflict, and the caller rolls everything back
+
+The report counts each yarn once: `created` new ones, `updated` ones already
+in the stash that changed. A row repeating a yarn seen earlier in the file
+counts as `skipped`, though under update its values still apply.
+
+Invalid rows don't stop the import; they're listed in the report with their
+1-based row number and field errors.
+"""
+import codecs
+import csv
+import itertools
+import json
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from . import colour_index, search, versioning
+from .models import Yarn
+
+IMPORT_BATCH_SIZE = 1000
+MAX_ROWS = 50_000
+CONFLICT_STRATEGIES = ("skip", "update", "fail")
+
+SIGNATURE = ("brand", "weight", "colour", "material", "amount_per_skein")
+UPDATE_FIELDS = ("colour_name", "product_link", "quantity_owned_skeins")
+IMPORT_FIELDS = SIGNATURE + UPDATE_FIELDS
+NULLABLE_FIELDS = {"quantity_owned_skeins"}
+
+
+class YarnImportError(Exception):
+    pass
+
+
+class YarnImportConflict(YarnImportError):
+    pass
+
+
+def iter_rows(stream):
+    """
+    Yield one dict per yarn from a UTF-8 byte stream. The layout is sniffed
+    from the first line: "[" or a {"yarns": ...} document is JSON, any other
+    "{" line starts NDJSON, and everything else is CSV with a header row.
+    """
+    text = codecs.getreader("utf-8-sig")(stream)
+    head = text.readline()
+    while head and not head.strip():
+        head = text.readline()
+    if not head:
+        raise YarnImportError("Empty file.")
+    lines = itertools.chain([head], text)
+
+    start = head.lstrip()[:1]
+    if start not in ("[", "{"):
+        yield from csv.DictReader(lines)
+        return
+    if start == "{":
+        try:
+            first = json.loads(head)
+        except ValueError:
+            first = None
+        if isinstance(first, dict) and "yarns" not in first:
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    raise YarnImportError("Malformed line in NDJSON.")
+            return
+    try:
+        doc = json.loads("".join(lines))
+    except ValueError:
+        raise YarnImportError("Malformed JSON.")
+    if isinstance(doc, dict):
+        doc = doc.get("yarns")
+    if not isinstance(doc, list):
+        raise YarnImportError('Expected a list of yarns or {"yarns": [...]}.')
+    yield from doc
+
+
+def signature(yarn):
+    return tuple(getattr(yarn, name) for name in SIGNATURE)
+
+
+class YarnImporter:
+    def __init__(self, user, on_conflict="skip", batch_size=IMPORT_BATCH_SIZE):
+        if on_conflict not in CONFLICT_STRATEGIES:
+            raise ValueError(f"on_conflict must be one of {CONFLICT_STRATEGIES}")
+        self.user = user
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.stats = {"created": 0, "updated": 0, "skipped": 0, "invalid": 0}
+        self.errors = []
+        self._created = set()  # pks created by this import
+        self._updated = set()  # pks of pre-existing yarns changed by it
+
+    def run(self, rows):
+        """
+        Import `rows` (dicts, e.g. from iter_rows) and return the report:
+        {"results": {created, updated, skipped, invalid}, "errors": [...]}.
+        """
+        batch = []
+        for n, raw in enumerate(rows, 1):
+            if n > MAX_ROWS:
+                raise YarnImportError(f"At most {MAX_ROWS} yarns per import.")
+            yarn = self._clean(n, raw)
+            if yarn is None:
+                continue
+            batch.append((n, yarn))
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        self._flush(batch)
+        # bulk writes skip post_save: bump the data version and drop the
+        # colour matrix by hand (search documents are written per batch).
+        if self.stats["created"] or self.stats["updated"]:
+            versioning.bump(self.user.pk)
+            colour_index.invalidate(self.user.pk)
+        return {"results": self.stats, "errors": self.errors}
+
+    def _clean(self, n, raw):
+        if not isinstance(raw, dict):
+            return self._invalid(n, {"__all__": ["Expected an object."]})
+        values = {}
+        for name in IMPORT_FIELDS:
+            value = raw.get(name)
+            if isinstance(value, str):
+                value = value.strip()
+            if value in (None, ""):
+                value = None if name in NULLABLE_FIELDS else ""
+            values[name] = value
+        yarn = Yarn(user=self.user, **values)
+        try:
+            # Uniqueness is the conflict strategy's business, not an error.
+            yarn.full_clean(exclude=["user"], validate_unique=False, validate_constraints=False)
+        except ValidationError as exc:
+            return self._invalid(n, exc.message_dict)
+        return yarn
+
+    def _invalid(self, n, errors):
+        self.stats["invalid"] += 1
+        self.errors.append({"row": n, "errors": errors})
+        return None
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        existing = {
+            signature(yarn): yarn
+            for yarn in Yarn.objects.filter(user=self.user, brand__in={y.brand for _, y in batch})
+        }
+        to_create, to_update = {}, {}
+        for n, yarn in batch:
+            key = signature(yarn)
+            match = to_create.get(key) or existing.get(key)
+            if match is None:
+                yarn.refresh_derived_fields()
+                to_create[key] = yarn
+                continue
+            if self.on_conflict == "fail":
+                raise YarnImportConflict(f"Row {n}: yarn {' / '.join(key)!r} already exists.")
+            changed = [f for f in UPDATE_FIELDS if getattr(match, f) != getattr(yarn, f)]
+            if self.on_conflict == "update" and changed:
+                for name in changed:
+                    setattr(match, name, getattr(yarn, name))
+                if match.pk is not None:
+                    to_update[match.pk] = match
+            # Each yarn is counted once; a row repeating one already seen is skipped.
+            repeat = match.pk is None or match.pk in self._created or match.pk in self._updated
+            if self.on_conflict == "update" and changed and not repeat:
+                self._updated.add(match.pk)
+            else:
+                self.stats["skipped"] += 1
+
+        created = Yarn.objects.bulk_create(list(to_create.values()), batch_size=self.batch_size)
+        if to_update:
+            now = timezone.now()
+            for yarn in to_update.values():
+                yarn.updated_at = now
+            Yarn.objects.bulk_update(
+                list(to_update.values()), [*UPDATE_FIELDS, "updated_at"], batch_size=self.batch_size
+            )
+        search.index_many([*created, *to_update.values()])
+        self._created.update(yarn.pk for yarn in created)
+        self.stats["created"] = len(self._created)
+        self.stats["updated"] = len(self._updated)
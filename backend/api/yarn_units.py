@@ -0,0 +1,138 @@
+"""
+Parse the free-text yarn label fields into numbers.
+
+    parse_amount("100g / 218 yds")  -> (Decimal("100.00"), Decimal("218.00"), Decimal("199.34"))
+    weight_category("Light worsted / DK (8 ply)") -> "dk"
+
+Everything is best-effort: unrecognised text yields None, never an error,
+and so does an amount too large for the Yarn columns (see MAX_AMOUNT).
+"""
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+GRAMS_PER_OUNCE = Decimal("28.3495")
+METERS_PER_YARD = Decimal("0.9144")
+_CENT = Decimal("0.01")
+# Yarn.*_per_skein are DecimalField(max_digits=8, decimal_places=2).
+MAX_AMOUNT = Decimal("999999.99")
+
+# A comma followed by exactly three digits groups thousands ("1,094 yds");
+# any other comma is a decimal point ("1,5 oz").
+_AMOUNT = re.compile(
+    r"(?P<num>\d+(?:,\d{3}(?!\d))*(?:[.,]\d+)?)\s*"
+    r"(?P<unit>grams?|gr|g|ounces?|oz|yards?|yds?|metres?|meters?|mtrs?|m)\b",
+    re.IGNORECASE,
+)
+
+# Canonical categories (Craft Yarn Council 0-7), lightest first.
+WEIGHT_CATEGORIES = [
+    ("lace", "Lace"),
+    ("fingering", "Fingering"),
+    ("sport", "Sport"),
+    ("dk", "DK"),
+    ("worsted", "Worsted"),
+    ("aran", "Aran"),
+    ("bulky", "Bulky"),
+    ("super_bulky", "Super bulky"),
+    ("jumbo", "Jumbo"),
+]
+_CYC_NUMBERS = {
+    "0": "lace", "1": "fingering", "2": "sport", "3": "dk",
+    "4": "worsted", "5": "bulky", "6": "super_bulky", "7": "jumbo",
+}
+# Checked in order, most specific first: multi-word names win over their
+# parts ("super chunky" before "chunky", "light worsted" before "worsted"),
+# names over ply counts, and ply counts only match whole numbers ("12 ply"
+# is not "2 ply", nor "14 ply" "4 ply").
+_WEIGHT_NAMES = [
+    (r"super\s*bulky|super\s*chunky", "super_bulky"),
+    (r"light\s*worsted|double\s*knit", "dk"),
+    (r"light\s*fingering", "fingering"),
+    (r"roving", "super_bulky"),
+    (r"jumbo", "jumbo"),
+    (r"\bdk\b", "dk"),
+    (r"fingering|sock|baby", "fingering"),
+    (r"lace|cobweb|thread", "lace"),
+    (r"sport", "sport"),
+    (r"worsted|afghan", "worsted"),
+    (r"aran", "aran"),
+    (r"bulky|chunky|craft|rug", "bulky"),
+    (r"\b1[24]\s*ply\b", "bulky"),
+    (r"\b10\s*ply\b", "aran"),
+    (r"\b8\s*ply\b", "dk"),
+    (r"\b5\s*ply\b", "sport"),
+    (r"\b[34]\s*ply\b", "fingering"),
+    (r"\b[12]\s*ply\b", "lace"),
+]
+_THOUSANDS = re.compile(r",(?=\d{3}(?!\d))")
+
+
+def _fit(value):
+    """
+    `value` rounded to cents, or None when that exceeds MAX_AMOUNT.
+    """
+    if value >= MAX_AMOUNT + _CENT / 2:
+        return None
+    return value.quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+def _decimal(value):
+    return _fit(Decimal(_THOUSANDS.sub("", value).replace(",", ".")))
+
+
+def parse_amount(text):
+    """
+    (grams, yards, meters) per skein from a label like "100 g / 218 yds (200 m)".
+    Yards and meters are derived from each other when only one is given.
+    Values over MAX_AMOUNT, read or derived, come back as None.
+    """
+    grams = yards = meters = None
+    for match in _AMOUNT.finditer(text or ""):
+        number, unit = _decimal(match["num"]), match["unit"].lower()
+        if number is None:
+            continue
+        if unit.startswith("g") and grams is None:
+            grams = number
+        elif unit.startswith("o") and grams is None:
+            grams = _fit(number * GRAMS_PER_OUNCE)
+        elif unit.startswith("y") and yards is None:
+            yards = number
+        elif unit.startswith("m") and meters is None:
+            meters = number
+    if yards is None and meters is not None:
+        yards = _fit(meters / METERS_PER_YARD)
+    elif meters is None and yards is not None:
+        meters = _fit(yards * METERS_PER_YARD)
+    return grams, yards, meters
+
+
+def weight_category(text):
+    """
+    Canonical weight key for a label like "Worsted", "8 ply" or "(4) Medium", or "".
+    """
+    text = (text or "").strip().lower()
+    if not text:
+        return ""
+    for pattern, key in _WEIGHT_NAMES:
+        if re.search(pattern, text):
+            return key
+    cyc = re.search(r"(?:^|[#(\s])([0-7])(?:$|[)\s])", text)
+    if cyc:
+        return _CYC_NUMBERS[cyc.group(1)]
+    return ""
+
+
+DERIVED_FIELDS = ("grams_per_skein", "yards_per_skein", "meters_per_skein", "weight_category")
+
+
+def derived_fields(weight, amount_per_skein):
+    """
+    Values for the Yarn columns computed from its free-text label fields.
+    """
+    grams, yards, meters = parse_amount(amount_per_skein)
+    return {
+        "grams_per_skein": grams,
+        "yards_per_skein": yards,
+        "meters_per_skein": meters,
+        "weight_category": weight_category(weight),
+    }
@@ -11,11 +11,36 @@ mkdir -p \
 chown -R 1000:1000 /app/media /app/staticfiles || true
 chmod -R u+rwX /app/media /app/staticfiles || true
 
+# Any arguments replace the web server, e.g. the background worker:
+#   entrypoint.sh python manage.py run_worker
+if [ "$#" -gt 0 ]; then
+  exec "$@"
+fi
+
 python manage.py migrate --noinput
 python manage.py collectstatic --noinput
 
-exec gunicorn stitchtracker_backend.wsgi:application \
-  --bind 0.0.0.0:8000 \
-  --workers 3 \
-  --log-file -
+WEB_WORKERS="${WEB_WORKERS:-3}"
+
+case "${SERVER_MODE:-wsgi}" in
+  asgi)
+    # Uvicorn workers: the event loop reads request bodies and writes
+    # responses, so slow uploads and downloads don't hold a worker.
+    exec gunicorn stitchtracker_backend.asgi:application \
+      --worker-class uvicorn_worker.UvicornWorker \
+      --bind 0.0.0.0:8000 \
+      --workers "$WEB_WORKERS" \
+      --log-file -
+    ;;
+  wsgi)
+    exec gunicorn stitchtracker_backend.wsgi:application \
+      --bind 0.0.0.0:8000 \
+      --workers "$WEB_WORKERS" \
+      --log-file -
+    ;;
+  *)
+    echo "SERVER_MODE must be 'wsgi' or 'asgi', not '${SERVER_MODE}'" >&2
+    exit 1
+    ;;
+esac
 
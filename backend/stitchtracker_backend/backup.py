@@ -0,0 +1,530 @@
+"""
+Per-user backup export.
+
+Format version 2 is newline-delimited JSON, one record per line:
+
+    {"type": "meta", "format": "stitchtracker-backup", "version": 2, ...}
+    {"type": "tag", "data": {...}}
+    ...
+    {"type": "end", "counts": {"tag": 3, ...}}
+
+Sections are written in dependency order (see SECTIONS) so an importer can
+remap keys in a single pass. The trailing "end" record lets readers detect a
+truncated file. The same rows can also be streamed as one JSON document
+({"meta": ..., "tag": [...], ...}) for tools that want plain JSON.
+
+Incremental backups (`since=`) hold only rows changed after that instant and
+end with "tombstone" records for deletions; meta carries "delta": true.
+"""
+import json
+import zlib
+from datetime import datetime, timezone
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api import rollups, search, tasks, versioning
+from api.models import Tag, Yarn, Project, ProjectYarn, ProjectProgress, ProgressImage, Tombstone
+
+FORMAT_NAME = "stitchtracker-backup"
+FORMAT_VERSION = 2
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024
+
+ProjectTag = Project.tags.through
+
+SECTIONS = ["tag", "yarn", "project", "project_tag", "project_yarn", "progress", "progress_image"]
+
+
+def _sections(user, since=None):
+    """
+    (record type, queryset of dicts) in the order rows must be restored.
+    `user_id` columns are dropped: a backup belongs to whoever imports it.
+
+    With `since`, only rows created or changed after it are included, plus a
+    trailing "tombstone" section listing deletions. A changed project carries
+    its full current tag list, since links have no timestamps of their own.
+    """
+    def columns(model, drop=("user",)):
+        return [f.attname for f in model._meta.concrete_fields if f.name not in drop]
+
+    tags = Tag.objects.filter(user=user)
+    yarns = Yarn.objects.filter(user=user)
+    projects = Project.objects.filter(user=user)
+    links = ProjectTag.objects.filter(project__user=user)
+    project_yarns = ProjectYarn.objects.filter(project__user=user)
+    progress = ProjectProgress.objects.filter(project__user=user)
+    images = ProgressImage.objects.filter(progress__project__user=user)
+    if since is not None:
+        tags = tags.filter(updated_at__gt=since)
+        yarns = yarns.filter(updated_at__gt=since)
+        projects = projects.filter(updated_at__gt=since)
+        links = links.filter(project__updated_at__gt=since)
+        project_yarns = project_yarns.filter(updated_at__gt=since)
+        progress = progress.filter(updated_at__gt=since)
+        images = images.filter(created__gt=since)
+
+    sections = [
+        ("tag", tags.order_by("pk").values(*columns(Tag))),
+        ("yarn", yarns.order_by("pk").values(*columns(Yarn))),
+        ("project", projects.order_by("pk").values(*columns(Project))),
+        ("project_tag", links.order_by("pk").values("project_id", "tag_id")),
+        ("project_yarn", project_yarns.order_by("pk").values(*columns(ProjectYarn))),
+        ("progress", progress.order_by("pk").values(*columns(ProjectProgress))),
+        ("progress_image", images.order_by("pk").values(*columns(ProgressImage))),
+    ]
+    if since is not None:
+        sections.append((
+            "tombstone",
+            Tombstone.objects.filter(user=user, deleted_at__gt=since)
+            .order_by("pk").values("kind", "object_id", "deleted_at"),
+        ))
+    return sections
+
+
+def _dumps(obj):
+    return json.dumps(obj, cls=DjangoJSONEncoder, separators=(",", ":"))
+
+
+def _isoformat(dt):
+    return dt.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def meta_record(user, since=None):
+    """
+    `exported_at` is taken before any row is read; pass it back as `since`
+    to get the next incremental backup without gaps.
+    """
+    meta = {
+        "type": "meta",
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "exported_at": _isoformat(datetime.now(timezone.utc)),
+        "user": {"id": user.id, "username": user.get_username()},
+        "sections": SECTIONS + (["tombstone"] if since is not None else []),
+    }
+    if since is not None:
+        meta["delta"] = True
+        meta["since"] = _isoformat(since)
+    return meta
+
+
+def iter_ndjson(user, since=None):
+    """
+    Yield the backup as text lines. Rows are pulled in chunks via
+    .iterator(), so memory stays flat whatever the account size.
+    """
+    yield _dumps(meta_record(user, since)) + "\n"
+    counts = {}
+    for kind, qs in _sections(user, since):
+        n = 0
+        for row in qs.iterator(chunk_size=CHUNK_SIZE):
+            n += 1
+            yield _dumps({"type": kind, "data": row}) + "\n"
+        counts[kind] = n
+    yield _dumps({"type": "end", "counts": counts}) + "\n"
+
+
+def iter_json(user, since=None):
+    """
+    The same data as one JSON object, emitted piecewise.
+    """
+    yield '{"meta":' + _dumps(meta_record(user, since))
+    for kind, qs in _sections(user, since):
+        yield f',"{kind}":['
+        first = True
+        for row in qs.iterator(chunk_size=CHUNK_SIZE):
+            yield ("" if first else ",") + _dumps(row)
+            first = False
+        yield "]"
+    yield "}\n"
+
+
+def buffered(pieces, size=FLUSH_BYTES):
+    """
+    Coalesce small text pieces into ~`size` byte chunks.
+    """
+    buf, length = [], 0
+    for piece in pieces:
+        data = piece.encode("utf-8")
+        buf.append(data)
+        length += len(data)
+        if length >= size:
+            yield b"".join(buf)
+            buf, length = [], 0
+    if buf:
+        yield b"".join(buf)
+
+
+def gzipped(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+# ---- import ----
+
+IMPORT_BATCH_SIZE = 1000
+CONFLICT_STRATEGIES = ("skip", "rename", "fail")
+
+
+class BackupError(Exception):
+    pass
+
+
+class BackupConflict(BackupError):
+    pass
+
+
+def iter_lines(stream, read_size=64 * 1024):
+    """
+    Yield decoded lines from a (possibly gzip-compressed) byte stream without
+    reading it all into memory. Compression is detected from the magic bytes.
+    """
+    decompressor = None
+    carry = b""
+    first = True
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        if first:
+            first = False
+            if chunk[:2] == b"\x1f\x8b":
+                decompressor = zlib.decompressobj(47)  # 32 + 15: auto gzip/zlib
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        carry += chunk
+        *lines, carry = carry.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line.decode("utf-8")
+    if decompressor is not None:
+        carry += decompressor.flush()
+    for line in carry.split(b"\n"):
+        if line.strip():
+            yield line.decode("utf-8")
+
+
+def iter_records(lines):
+    """
+    Normalise either backup layout into (type, row) pairs. NDJSON is consumed
+    line by line; the single-document JSON layout has to be parsed whole.
+    """
+    lines = iter(lines)
+    try:
+        head = next(lines)
+    except StopIteration:
+        raise BackupError("Empty backup.")
+    try:
+        first = json.loads(head)
+        rest = None
+    except ValueError:
+        # A pretty-printed or single-document JSON backup.
+        first = None
+        rest = head + "\n" + "\n".join(lines)
+
+    if first is not None and first.get("type") == "meta":
+        _check_meta(first)
+        yield "meta", first
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise BackupError("Malformed line in backup.")
+            yield record.get("type"), record.get("data", record)
+        return
+
+    doc = first if rest is None else json.loads(rest)
+    if not isinstance(doc, dict) or "meta" not in doc:
+        raise BackupError("Not a StitchTracker backup.")
+    _check_meta(doc["meta"])
+    yield "meta", doc["meta"]
+    for kind in SECTIONS:
+        for row in doc.get(kind, []):
+            yield kind, row
+    yield "end", {"counts": {kind: len(doc.get(kind, [])) for kind in SECTIONS}}
+
+
+def _check_meta(meta):
+    version = meta.get("version")
+    if meta.get("format") != FORMAT_NAME or version is None:
+        if version == 1:
+            raise BackupError(
+                "Version 1 backups mix every user's data and cannot be restored; "
+                "export a new backup first."
+            )
+        raise BackupError("Not a StitchTracker backup.")
+    if version > FORMAT_VERSION:
+        raise BackupError(f"Backup version {version} is newer than this server supports.")
+    if meta.get("delta"):
+        raise BackupError(
+            "This is an incremental backup; restore the full backup it was taken against instead."
+        )
+
+
+class BackupImporter:
+    """
+    Restore a backup into `user`'s namespace.
+
+    Records are consumed in order and written with bulk_create in batches of
+    IMPORT_BATCH_SIZE. Every primary key in the file is remapped to the row
+    created (or matched) here, and foreign keys follow those maps.
+
+    Rows that collide with an existing per-user unique constraint are handled
+    by `on_conflict`:
+      skip   - reuse the existing tag/yarn/project; a skipped project's links,
+               progress and images are not imported again (re-imports are no-ops)
+      rename - tags and projects are created as "Name (2)", "Name (3)", ...;
+               yarns, whose key is their whole signature, are reused as in skip
+      fail   - raise BackupConflict, and the caller rolls everything back
+
+    A backup carries media file names, not files, and those names are not
+    trusted: a project's main_image is kept only if `user` already owns a
+    file of that name, else it is cleared, and a progress image naming a
+    file they don't own is skipped. Both count as "files_dropped". Stored
+    variants are never imported; they are regenerated by a background task.
+    """
+
+    def __init__(self, user, on_conflict="skip", batch_size=IMPORT_BATCH_SIZE):
+        if on_conflict not in CONFLICT_STRATEGIES:
+            raise ValueError(f"on_conflict must be one of {CONFLICT_STRATEGIES}")
+        self.user = user
+        self.on_conflict = on_conflict
+        self.batch_size = batch_size
+        self.maps = {kind: {} for kind in ("tag", "yarn", "project", "progress")}
+        self.new_projects = set()
+        self.new_progress = set()
+        self.progress_projects = set()
+        self.stats = {kind: {"created": 0, "matched": 0, "renamed": 0, "skipped": 0} for kind in SECTIONS}
+        for kind in ("project", "progress_image"):
+            self.stats[kind]["files_dropped"] = 0
+        self.owned_files = None
+        self.seen_end = False
+
+    def run(self, records):
+        kind, pending = None, []
+        for rec_kind, row in records:
+            if rec_kind == "meta":
+                continue
+            if rec_kind != kind or len(pending) >= self.batch_size:
+                self._flush(kind, pending)
+                kind, pending = rec_kind, []
+            if rec_kind == "end":
+                self.seen_end = True
+                continue
+            if rec_kind not in SECTIONS:
+                raise BackupError(f"Unknown record type {rec_kind!r}.")
+            pending.append(row)
+        self._flush(kind, pending)
+        if not self.seen_end:
+            raise BackupError("Backup is truncated (no end record).")
+        # bulk_create skips post_save, so bump the data version, roll up the
+        # imported progress and refresh the search index by hand.
+        if self.progress_projects:
+            rollups.rebuild(user=self.user, project_ids=self.progress_projects)
+        search.reindex(user=self.user)
+        versioning.bump(self.user.pk)
+        return self.stats
+
+    def _flush(self, kind, rows):
+        if rows:
+            getattr(self, f"_import_{kind}")(rows)
+
+    # -- helpers --
+
+    @staticmethod
+    def _fields(model, row, drop=("id", "user_id", "main_image_variants", "variants")):
+        allowed = {f.attname for f in model._meta.concrete_fields}
+        return {k: v for k, v in row.items() if k in allowed and k not in drop}
+
+    def _owns_file(self, name):
+        """
+        Whether one of `user`'s projects or progress images already stores
+        the media file `name`.
+        """
+        if self.owned_files is None:
+            self.owned_files = set(
+                Project.objects.filter(user=self.user).values_list("main_image", flat=True)
+            ) | set(
+                ProgressImage.objects.filter(progress__project__user=self.user)
+                .values_list("image", flat=True)
+            )
+            self.owned_files -= {"", None}
+        return bool(name) and name in self.owned_files
+
+    @staticmethod
+    def _queue_derivatives(model_label, objs, field_name, variants_field):
+        tasks.enqueue_many(tasks.generate_image_derivatives, [
+            (model_label, obj.pk, field_name, variants_field)
+            for obj in objs if getattr(obj, field_name)
+        ])
+
+    def _conflict(self, kind, label):
+        if self.on_conflict == "fail":
+            raise BackupConflict(f"{kind} {label!r} already exists.")
+
+    def _unique_name(self, base, taken, max_length):
+        n = 2
+        while True:
+            suffix = f" ({n})"
+            candidate = base[: max_length - len(suffix)] + suffix
+            if candidate not in taken:
+                return candidate
+            n += 1
+
+    def _import_named(self, kind, model, rows):
+        """
+        Shared path for tags and projects, unique on (user, name).
+        """
+        max_length = model._meta.get_field("name").max_length
+        names = [r["name"] for r in rows]
+        existing = dict(model.objects.filter(user=self.user, name__in=names).values_list("name", "pk"))
+        to_create, old_ids, repeats = [], [], []
+        taken = None
+        for row in rows:
+            name = row["name"]
+            if name in existing:
+                self._conflict(kind, name)
+                if self.on_conflict == "skip":
+                    if existing[name] is None:
+                        repeats.append((row["id"], name))  # repeated within this batch
+                    else:
+                        self.maps[kind][row["id"]] = existing[name]
+                    self.stats[kind]["matched"] += 1
+                    continue
+                if taken is None:
+                    taken = set(model.objects.filter(user=self.user).values_list("name", flat=True))
+                name = self._unique_name(name, taken, max_length)
+                self.stats[kind]["renamed"] += 1
+            if taken is not None:
+                taken.add(name)
+            existing[name] = None
+            to_create.append(model(user=self.user, **{**self._fields(model, row), "name": name}))
+            old_ids.append(row["id"])
+        created = model.objects.bulk_create(to_create, batch_size=self.batch_size)
+        for old_id, obj in zip(old_ids, created):
+            self.maps[kind][old_id] = obj.pk
+            if kind == "project":
+                self.new_projects.add(obj.pk)
+        by_name = {obj.name: obj.pk for obj in created}
+        for old_id, name in repeats:
+            self.maps[kind][old_id] = by_name[name]
+        self.stats[kind]["created"] += len(created)
+        return created
+
+    # -- sections --
+
+    def _import_tag(self, rows):
+        self._import_named("tag", Tag, rows)
+
+    def _import_project(self, rows):
+        dropped = []
+        for row in rows:
+            if row.get("main_image") and not self._owns_file(row["main_image"]):
+                row["main_image"] = ""
+                dropped.append(row["id"])
+        created = self._import_named("project", Project, rows)
+        self.stats["project"]["files_dropped"] += sum(
+            self.maps["project"].get(old_id) in self.new_projects for old_id in dropped
+        )
+        self._queue_derivatives("api.Project", created, "main_image", "main_image_variants")
+
+    def _import_yarn(self, rows):
+        key_fields = ("brand", "weight", "colour", "material", "amount_per_skein")
+        key = lambda d: tuple(d.get(f, "") for f in key_fields)
+        existing = {
+            key(d): d["pk"]
+            for d in Yarn.objects.filter(user=self.user, brand__in={r["brand"] for r in rows})
+            .values("pk", *key_fields)
+        }
+        to_create, old_ids, repeats = [], [], []
+        for row in rows:
+            k = key(row)
+            if k in existing:
+                self._conflict("yarn", " / ".join(k))
+                if existing[k] is None:
+                    repeats.append((row["id"], k))
+                else:
+                    self.maps["yarn"][row["id"]] = existing[k]
+                self.stats["yarn"]["matched"] += 1
+                continue
+            existing[k] = None
+            yarn = Yarn(user=self.user, **self._fields(Yarn, row))
+            yarn.refresh_derived_fields()
+            to_create.append(yarn)
+            old_ids.append(row["id"])
+        created = Yarn.objects.bulk_create(to_create, batch_size=self.batch_size)
+        for old_id, obj in zip(old_ids, created):
+            self.maps["yarn"][old_id] = obj.pk
+            existing[key(vars(obj))] = obj.pk
+        for old_id, k in repeats:
+            self.maps["yarn"][old_id] = existing[k]
+        self.stats["yarn"]["created"] += len(created)
+
+    def _remap(self, row, **fks):
+        """
+        Map each foreign key column to its new id, or None when the parent
+        wasn't imported (unknown id or a skipped project).
+        """
+        out = {}
+        for column, kind in fks.items():
+            new_id = self.maps[kind].get(row.get(column))
+            if new_id is None:
+                return None
+            if kind == "project" and new_id not in self.new_projects:
+                return None
+            if kind == "progress" and new_id not in self.new_progress:
+                return None
+            out[column] = new_id
+        return out
+
+    def _import_links(self, kind, model, rows, **fks):
+        objs = []
+        for row in rows:
+            mapped = self._remap(row, **fks)
+            if mapped is None:
+                self.stats[kind]["skipped"] += 1
+                continue
+            objs.append(model(**{**self._fields(model, row), **mapped}))
+        model.objects.bulk_create(objs, batch_size=self.batch_size, ignore_conflicts=True)
+        self.stats[kind]["created"] += len(objs)
+
+    def _import_project_tag(self, rows):
+        self._import_links("project_tag", ProjectTag, rows, project_id="project", tag_id="tag")
+
+    def _import_project_yarn(self, rows):
+        self._import_links("project_yarn", ProjectYarn, rows, project_id="project", yarn_id="yarn")
+
+    def _import_progress(self, rows):
+        objs, old_ids = [], []
+        for row in rows:
+            mapped = self._remap(row, project_id="project")
+            if mapped is None:
+                self.stats["progress"]["skipped"] += 1
+                continue
+            objs.append(ProjectProgress(**{**self._fields(ProjectProgress, row), **mapped}))
+            old_ids.append(row["id"])
+        created = ProjectProgress.objects.bulk_create(objs, batch_size=self.batch_size)
+        for old_id, obj in zip(old_ids, created):
+            self.maps["progress"][old_id] = obj.pk
+            self.new_progress.add(obj.pk)
+            self.progress_projects.add(obj.project_id)
+        self.stats["progress"]["created"] += len(created)
+
+    def _import_progress_image(self, rows):
+        objs = []
+        for row in rows:
+            mapped = self._remap(row, progress_id="progress")
+            if mapped is None:
+                self.stats["progress_image"]["skipped"] += 1
+                continue
+            if not self._owns_file(row.get("image")):
+                self.stats["progress_image"]["files_dropped"] += 1
+                continue
+            objs.append(ProgressImage(**{**self._fields(ProgressImage, row), **mapped}))
+        created = ProgressImage.objects.bulk_create(objs, batch_size=self.batch_size)
+        self.stats["progress_image"]["created"] += len(created)
+        self._queue_derivatives("api.ProgressImage", created, "image", "variants")
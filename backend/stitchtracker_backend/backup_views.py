@@ -1,33 +1,92 @@
-from datetime import datetime
+from datetime import timezone as dt_timezone
 from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from api.models import (
-    Tag, Yarn, Project, ProjectYarn, ProjectProgress, ProgressImage
-)
+from api.streaming import stream_response
+
+from . import backup
 
 import json
+import zlib
 
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def backup_all(request):
-    data = {
-        "meta": {
-            "exported_at": datetime.utcnow().isoformat() + "Z",
-            "version": 1,
-        },
-        "tags": list(Tag.objects.all().values()),
-        "yarn": list(Yarn.objects.all().values()),
-        "projects": list(Project.objects.all().values()),
-        "project_yarns": list(ProjectYarn.objects.all().values()),
-        "progress": list(ProjectProgress.objects.all().values()),
-        "progress_images": list(ProgressImage.objects.all().values()),
-    }
-    return Response(data, status=status.HTTP_200_OK)
+    """
+    Stream the caller's data as a versioned backup (see stitchtracker_backend.backup).
+
+    ?layout=ndjson (default) or json; ?compress=0 to skip gzip;
+    ?since=<ISO datetime> for an incremental backup (use the previous
+    backup's meta.exported_at).
+    """
+    layout = request.query_params.get("layout", "ndjson")
+    if layout not in ("ndjson", "json"):
+        return Response({"detail": "layout must be 'ndjson' or 'json'."}, status=400)
+    compress = request.query_params.get("compress", "1").lower() not in ("0", "false", "no")
+
+    since = None
+    raw_since = request.query_params.get("since")
+    if raw_since:
+        since = parse_datetime(raw_since)
+        if since is None:
+            return Response({"detail": "since must be an ISO 8601 datetime."}, status=400)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since, dt_timezone.utc)
+
+    iterate = backup.iter_ndjson if layout == "ndjson" else backup.iter_json
+    pieces = iterate(request.user, since=since)
+    chunks = backup.buffered(pieces)
+    ext = "ndjson" if layout == "ndjson" else "json"
+    content_type = "application/x-ndjson" if layout == "ndjson" else "application/json"
+    if compress:
+        chunks = backup.gzipped(chunks)
+        ext += ".gz"
+        content_type = "application/gzip"
+
+    stamp = timezone.now().strftime("%Y%m%d-%H%M%S")
+    kind = "delta" if since else "backup"
+    response = stream_response(request, chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="stitchtracker-{kind}-{stamp}.{ext}"'
+    response["X-Backup-Format-Version"] = str(backup.FORMAT_VERSION)
+    return response
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def restore_backup(request):
+    """
+    Import a backup produced by backup_all into the caller's account.
+
+    The body is the backup file itself (gzip or plain, NDJSON or JSON layout),
+    read as a stream. ?on_conflict=skip (default), rename or fail decides what
+    happens to tags/yarns/projects that already exist. All-or-nothing.
+    """
+    on_conflict = request.query_params.get("on_conflict", "skip")
+    if on_conflict not in backup.CONFLICT_STRATEGIES:
+        return Response(
+            {"detail": f"on_conflict must be one of {', '.join(backup.CONFLICT_STRATEGIES)}."},
+            status=400,
+        )
+    stream = request.stream
+    if stream is None:
+        return Response({"detail": "Empty body."}, status=400)
+
+    importer = backup.BackupImporter(request.user, on_conflict=on_conflict)
+    try:
+        with transaction.atomic():
+            stats = importer.run(backup.iter_records(backup.iter_lines(stream)))
+    except backup.BackupConflict as exc:
+        return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+    except (backup.BackupError, ValueError, zlib.error) as exc:
+        return Response({"detail": str(exc) or "Invalid backup."}, status=400)
+    return Response({"ok": True, "on_conflict": on_conflict, "results": stats}, status=200)
+
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
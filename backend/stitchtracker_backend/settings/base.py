@@ -10,6 +10,9 @@ ALLOWED_HOSTS = os.getenv("ALLOWED_HOSTS", "localhost,127.0.0.1,0.0.0.0,frontend
 
 AUTH_USER_MODEL = "accounts.User"
 
+# Also the day boundary for the activity rollups (re-run rebuild_rollups after changing it).
+TIME_ZONE = os.getenv("TIME_ZONE", "America/Chicago")
+
 INSTALLED_APPS = [
     "django.contrib.admin","django.contrib.auth","django.contrib.contenttypes",
     "django.contrib.sessions","django.contrib.messages","django.contrib.staticfiles",
@@ -17,6 +20,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -50,7 +54,34 @@ WSGI_APPLICATION = "stitchtracker_backend.wsgi.application"
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": ("rest_framework_simplejwt.authentication.JWTAuthentication",),
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticatedOrReadOnly",),
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.KeysetPagination",
+    "PAGE_SIZE": int(os.getenv("API_PAGE_SIZE", "50")),
+}
+
+_CACHE_BACKENDS = {
+    "locmem": ("django.core.cache.backends.locmem.LocMemCache", "stitchtracker"),
+    "file": ("django.core.cache.backends.filebased.FileBasedCache", str(BASE_DIR / "cache")),
+    "redis": ("django.core.cache.backends.redis.RedisCache", "redis://localhost:6379/1"),
+    "dummy": ("django.core.cache.backends.dummy.DummyCache", ""),
+}
+_cache_backend, _cache_location = _CACHE_BACKENDS[os.getenv("CACHE_BACKEND", "locmem")]
+CACHES = {
+    "default": {
+        "BACKEND": _cache_backend,
+        "LOCATION": os.getenv("CACHE_LOCATION", _cache_location),
+        "KEY_PREFIX": os.getenv("CACHE_KEY_PREFIX", "stitchtracker"),
+    }
 }
+# Seconds a serialized API response stays cached; 0 disables the response cache.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", "300"))
+
+# Per-route request metrics, served at /api/admin/metrics (see api.metrics).
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+# Seconds between a worker's writes of its metrics to the database.
+METRICS_FLUSH_INTERVAL = int(os.getenv("METRICS_FLUSH_INTERVAL", "10"))
+# Seconds before an exited worker's metrics row is folded into the totals
+# row and deleted; 0 keeps every row.
+METRICS_RETENTION = int(os.getenv("METRICS_RETENTION", "3600"))
 
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "staticfiles"
@@ -37,6 +37,25 @@ def env_bool(k: str, default: bool) -> bool:
 
 ENABLE_HTTPS = env_bool("ENABLE_HTTPS", False)
 
+# Reuse database connections instead of connecting on every request. With
+# DB_POOL (the default) each process keeps a psycopg pool, which also suits
+# SERVER_MODE=asgi, where views run on many threads; otherwise each thread
+# keeps its connection for DB_CONN_MAX_AGE seconds. Django can't do both.
+# Pool and connect counts are in /api/admin/metrics.
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = env_bool("DB_CONN_HEALTH_CHECKS", True)
+if env_bool("DB_POOL", True):
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.getenv("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.getenv("DB_POOL_MAX_SIZE", "8")),
+            "timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+            "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+            "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "3600")),
+        },
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("DB_CONN_MAX_AGE", "60"))
+
 CSRF_COOKIE_SECURE = ENABLE_HTTPS
 SESSION_COOKIE_SECURE = ENABLE_HTTPS
 CSRF_COOKIE_SAMESITE = os.getenv("CSRF_COOKIE_SAMESITE", "Lax")
@@ -53,6 +72,8 @@ REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
+    "DEFAULT_PAGINATION_CLASS": "api.pagination.KeysetPagination",
+    "PAGE_SIZE": int(os.getenv("API_PAGE_SIZE", "50")),
 }
 
 if "corsheaders" not in INSTALLED_APPS:
@@ -15,6 +15,7 @@ urlpatterns = [
     path("api-auth/", include("rest_framework.urls")),
     path('api/', include('api.urls')),
     path("api/backup/", backup_views.backup_all, name="backup-all"),
+    path("api/restore/", backup_views.restore_backup, name="restore-backup"),
     path("api/restore-local/", backup_views.restore_local_state, name="restore-local"),]
 
 if settings.DEBUG:
@@ -5,17 +5,13 @@ const SHELF_KEY = "stashShelf.v2";
 const THEME_KEY = "theme";
 
 export default function BackupControls() {
-  const downloadBackup = async () => {
+  const saveBackup = async () => {
     try {
-      const res = await apiFetch("/api/backup/", { method: "GET" });
-      if (!res.ok) throw new Error(`Backup failed: ${res.status}`);
-      const data = await res.json();
-
-      const blob = new Blob([JSON.stringify(data, null, 2)], { type: "application/json" });
+      const { blob, filename } = await downloadBackup();
       const url = URL.createObjectURL(blob);
       const a = document.createElement("a");
       a.href = url;
-      a.download = `stitchtracker-backup-${new Date().toISOString().slice(0,10)}.json`;
+      a.download = filename;
       a.click();
       URL.revokeObjectURL(url);
     } catch (e) {
@@ -25,6 +21,13 @@ export default function BackupControls() {
 
   const importBackup = async (file) => {
     try {
+      // Server backups (.ndjson.gz / .ndjson) are restored by the API as a stream.
+      if (/\.ndjson(\.gz)?$|\.gz$/i.test(file.name)) {
+        await restoreBackup(file, { onConflict: "skip" });
+        alert("Restore complete.");
+        return;
+      }
+
       const text = await file.text();
       const json = JSON.parse(text);
 
@@ -50,10 +53,10 @@ export default function BackupControls() {
 
   return (
     <div className="flex flex-wrap items-center gap-2">
-      <button className="btn btn-primary btn-sm" onClick={downloadBackup}>Download backup</button>
+      <button className="btn btn-primary btn-sm" onClick={saveBackup}>Download backup</button>
       <label className="btn btn-ghost btn-sm">
         Restore…
-        <input type="file" accept="application/json" className="hidden"
+        <input type="file" accept="application/json,application/gzip,.ndjson,.gz" className="hidden"
                onChange={(e) => { const f = e.target.files?.[0]; if (f) importBackup(f); e.target.value=""; }} />
       </label>
     </div>
@@ -3,6 +3,8 @@ import { listProjects } from "../lib/api";
 import { Link } from "react-router-dom";
 import ProjectFormModal from "./ProjectFormModal";
 
+const GRID_FIELDS = "id,name,type,tags,start_date,expected_end_date,notes,main_image,main_image_srcset";
+
 function formatDate(d) {
   if (!d) return "—";
   const dt = new Date(d);
@@ -37,7 +39,7 @@ export default function ProjectGrid() {
   const load = async () => {
     try {
       setErr("");
-      const data = await listProjects();
+      const data = await listProjects({ fields: GRID_FIELDS });
       setProjects(Array.isArray(data) ? data : []);
     } catch (e) {
       setErr(e.message || "Failed to load projects");
@@ -49,7 +51,7 @@ export default function ProjectGrid() {
     (async () => {
       try {
         setErr("");
-        const data = await listProjects();
+        const data = await listProjects({ fields: GRID_FIELDS });
         if (alive) setProjects(Array.isArray(data) ? data : []);
       } catch (e) {
         if (alive) setErr(e.message || "Failed to load projects");
@@ -203,12 +205,19 @@ export default function ProjectGrid() {
                     <div className="avatar">
                       <div className="w-12 h-12 rounded-full ring ring-base-300 ring-offset-2 ring-offset-base-100 overflow-hidden">
                         {p.main_image ? (
-                          <img
-                            src={p.main_image}
-                            alt={`${p.name} cover`}
-                            className="object-cover w-full h-full"
-                            loading="lazy"
-                          />
+                          <picture>
+                            {p.main_image_srcset?.webp && (
+                              <source type="image/webp" srcSet={p.main_image_srcset.webp} sizes="48px" />
+                            )}
+                            <img
+                              src={p.main_image}
+                              srcSet={p.main_image_srcset?.jpeg}
+                              sizes="48px"
+                              alt={`${p.name} cover`}
+                              className="object-cover w-full h-full"
+                              loading="lazy"
+                            />
+                          </picture>
                         ) : (
                           <Initials text={p.name} />
                         )}
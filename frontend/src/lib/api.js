@@ -118,6 +118,27 @@ async function apiGet(path) {
   return res.json();
 }
 
+function pagePath(nextUrl) {
+  const u = new URL(nextUrl, window.location.origin);
+  const basePath = new URL(BASE, window.location.origin).pathname.replace(/\/+$/, "");
+  const path = u.pathname.startsWith(basePath) ? u.pathname.slice(basePath.length) : u.pathname;
+  return `${path}${u.search}`;
+}
+
+// List endpoints are cursor-paginated ({ next, previous, results }).
+// Follow `next` until exhausted for callers that want the whole collection.
+async function apiGetAll(path) {
+  const items = [];
+  let next = path;
+  while (next) {
+    const data = await apiGet(next);
+    if (Array.isArray(data)) return data;
+    items.push(...(data?.results || []));
+    next = data?.next ? pagePath(data.next) : null;
+  }
+  return items;
+}
+
 async function apiPost(path, body) {
   const doFetch = () =>
     fetch(api(path), {
@@ -197,14 +218,28 @@ export async function getCurrentUser() {
   return apiGet("auth/me/");
 }
 
-export function listProjects() {
-  return apiGet("/projects/");
+// `fields` / `expand` trim the payload server-side, e.g. fields: "id,name,tags"
+export function listProjects({ fields, expand } = {}) {
+  const qs = new URLSearchParams();
+  if (fields) qs.set("fields", fields);
+  if (expand) qs.set("expand", expand);
+  const suffix = qs.toString() ? `?${qs}` : "";
+  return apiGetAll(`/projects/${suffix}`);
+}
+export function listProjectsPage({ cursor, pageSize, fields, expand } = {}) {
+  const qs = new URLSearchParams();
+  if (cursor) qs.set("cursor", cursor);
+  if (pageSize) qs.set("page_size", pageSize);
+  if (fields) qs.set("fields", fields);
+  if (expand) qs.set("expand", expand);
+  const suffix = qs.toString() ? `?${qs}` : "";
+  return apiGet(`/projects/${suffix}`);
 }
 export function getProject(id) {
   return apiGet(`/projects/${id}/`);
 }
 export function listProgressByProject(projectId) {
-  return apiGet(`/progress/?project=${encodeURIComponent(projectId)}`);
+  return apiGetAll(`/progress/?project=${encodeURIComponent(projectId)}`);
 }
 export function createProgress({ project, rows_completed, stitches_completed, notes }) {
   return apiPost("/progress/", { project, rows_completed, stitches_completed, notes });
@@ -221,7 +256,7 @@ export function deleteProgress(id) {
 
 // Yarn
 export function listYarn() {
-  return apiGet("/yarns/");
+  return apiGetAll("/yarns/");
 }
 export function createYarn(payload) {
   return apiPost("/yarns/", payload);
@@ -274,6 +309,20 @@ export function createProgressWithImages({ project, rows_completed, stitches_com
   images.forEach((file) => fd.append("images", file));
   return apiPostForm("/progress/", fd);
 }
+// Many entries (any projects) in one request; each entry's `images` are File objects
+export function createProgressBatch(entries) {
+  const fd = new FormData();
+  const payload = entries.map(({ images = [], ...entry }, i) => {
+    const names = images.map((file, j) => {
+      const name = `image_${i}_${j}`;
+      fd.append(name, file);
+      return name;
+    });
+    return { ...entry, images: names };
+  });
+  fd.append("entries", JSON.stringify(payload));
+  return apiPostForm("/progress/batch/", fd);
+}
 
 export function updateProjectCover(projectId, file) {
   const fd = new FormData();
@@ -305,10 +354,7 @@ export function updateProjectYarn(id, patch) {
 
 export async function listTags(search = "") {
   const qs = search ? `?search=${encodeURIComponent(search)}` : "";
-  const res = await apiFetch(`/tags/${qs}`);
-  if (res.status === 401) throw new Error("Not authorized to list tags.");
-  if (!res.ok) throw new Error(`Tags failed ${res.status}: ${await res.text().catch(() => "")}`);
-  return res.json();
+  return apiGetAll(`/tags/${qs}`);
 }
 export async function createTag(name) {
   const res = await apiFetch(`/tags/`, {
@@ -336,23 +382,64 @@ export async function deleteTag(id) {
   return true;
 }
 
+// Bulk tag operations: `tags` are ids, `tag_names` are created if missing (apply only)
+export function applyTags({ projects, tags, tag_names }) {
+  return apiPost(`/tags/apply/`, { projects, tags, tag_names });
+}
+export function removeTags({ projects, tags, tag_names }) {
+  return apiPost(`/tags/remove/`, { projects, tags, tag_names });
+}
+export function mergeTag(id, into) {
+  return apiPost(`/tags/${id}/merge/`, { into });
+}
+// { [tagId]: "new name" }
+export function renameTags(names) {
+  return apiPost(`/tags/rename/`, { names });
+}
+
 export function listAllProgress({ start, end } = {}) {
   const qs = new URLSearchParams();
   if (start) qs.set("start", start);
   if (end) qs.set("end", end);
   const suffix = qs.toString() ? `?${qs}` : "";
-  return apiGet(`/progress/${suffix}`);
+  return apiGetAll(`/progress/${suffix}`);
+}
+// Ranked results; `title`/`snippet` are escaped HTML with <mark> around hits
+export function searchAll(q, { kind, limit } = {}) {
+  const qs = new URLSearchParams({ q });
+  if (kind) qs.set("kind", kind);
+  if (limit) qs.set("limit", limit);
+  return apiGet(`/search/?${qs}`);
+}
+// Yarns nearest in colour, each with its `delta_e` (CIEDE2000) from the query
+export function similarYarns({ colour, yarn, k, maxDeltaE } = {}) {
+  const qs = new URLSearchParams();
+  if (yarn) qs.set("yarn", yarn);
+  else if (colour) qs.set("colour", colour);
+  if (k) qs.set("k", k);
+  if (maxDeltaE != null) qs.set("max_delta_e", maxDeltaE);
+  return apiGet(`/yarns/similar/?${qs}`);
+}
+// CSV/JSON file -> { results: { created, updated, skipped, invalid }, errors: [{ row, errors }] }
+export function importYarns(file, { onConflict = "skip" } = {}) {
+  const fd = new FormData();
+  fd.append("file", file);
+  return apiPostForm(`/yarns/import/?on_conflict=${encodeURIComponent(onConflict)}`, fd);
+}
+// Per-day { date, rows, stitches, entries } bucketed in the browser's time zone
+export function getActivity({ start, end, tz } = {}) {
+  const qs = new URLSearchParams();
+  if (start) qs.set("start", start);
+  if (end) qs.set("end", end);
+  qs.set("tz", tz || Intl.DateTimeFormat().resolvedOptions().timeZone);
+  return apiGet(`/stats/activity/?${qs}`);
 }
 export function changePassword({ old_password, new_password }) {
   return apiPost(`/auth/change-password/`, { old_password, new_password });
 }
 
 export async function adminListUsers(query = "") {
-  const t = withTimeout(null, 10000, "adminListUsers");
-  const url = `/admin/users/${query ? `?search=${encodeURIComponent(query)}` : ""}`;
-  const res = await t.run((signal) => apiFetch(url, { signal }));
-  if (!res.ok) throw new Error(`Failed to list users: ${res.status}`);
-  return res.json();
+  return apiGetAll(`/admin/users/${query ? `?search=${encodeURIComponent(query)}` : ""}`);
 }
 export async function adminSetPassword(userId, newPassword) {
   const res = await apiFetch(`/admin/users/${userId}/set-password/`, {
@@ -404,18 +491,28 @@ export async function adminUpdateUser(userId, patch) {
 }
 
 export async function downloadBackup() {
-  const res = await fetch(api("/backup/"), { credentials: "omit" });
+  const res = await apiFetch("/backup/");
   if (!res.ok) throw new Error(`Backup failed: ${res.status}`);
-  return res.json();
+  // The server streams a gzip-compressed NDJSON file; it is saved as-is.
+  const disposition = res.headers.get("Content-Disposition") || "";
+  const match = disposition.match(/filename="([^"]+)"/);
+  return {
+    blob: await res.blob(),
+    filename: match?.[1] || `stitchtracker-backup-${new Date().toISOString().slice(0, 10)}.ndjson.gz`,
+  };
 }
-export async function restoreBackup(data, { mode = "replace" } = {}) {
-  const res = await fetch(api(`/restore/?mode=${encodeURIComponent(mode)}`), {
+export async function restoreBackup(file, { onConflict = "skip" } = {}) {
+  // The file (.ndjson.gz / .ndjson / .json) is sent untouched; the API reads it as a stream.
+  const res = await apiFetch(`/restore/?on_conflict=${encodeURIComponent(onConflict)}`, {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
-    credentials: "omit",
-    body: JSON.stringify(data),
+    headers: { "Content-Type": "application/octet-stream" },
+    body: file,
   });
-  if (!res.ok) throw new Error(await res.text());
+  if (!res.ok) {
+    let msg = `Restore failed: ${res.status}`;
+    try { const data = await res.json(); msg = data?.detail || msg; } catch {}
+    throw new Error(msg);
+  }
   return res.json();
 }
 
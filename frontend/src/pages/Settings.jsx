@@ -30,8 +30,7 @@ function AdminUsersPanel() {
   const load = async (search = "") => {
     setLoading(true);
     try {
-      const list = await adminListUsers(search);
-      setUsers(Array.isArray(list) ? list : list?.results ?? []);
+      setUsers(await adminListUsers(search));
     } finally {
       setLoading(false);
     }
@@ -1,6 +1,6 @@
 import { useEffect, useMemo, useState } from "react";
 import { useNavigate } from "react-router-dom";
-import { getCurrentUser, listAllProgress } from "../lib/api";
+import { getActivity, getCurrentUser } from "../lib/api";
 import { logout } from "../lib/auth";
 import ContributionCalendar from "../components/ContributionCalendar";
 import ChangePasswordModal from "../components/ChangePasswordModal";
@@ -23,12 +23,15 @@ function Avatar({ name = "", size = 64 }) {
   );
 }
 
+const dayKey = (d) =>
+  `${d.getFullYear()}-${String(d.getMonth()+1).padStart(2,"0")}-${String(d.getDate()).padStart(2,"0")}`;
+
 export default function UserPage() {
   const [user, setUser] = useState(null);
   const [err, setErr] = useState("");
   const [loading, setLoading] = useState(true);
 
-  const [progress, setProgress] = useState([]);
+  const [activity, setActivity] = useState([]);
   const [calWeeks, setCalWeeks] = useState(53);
   const [pwOpen, setPwOpen] = useState(false);
 
@@ -39,8 +42,11 @@ export default function UserPage() {
       setErr(""); setLoading(true);
       const me = await getCurrentUser();
       setUser(me);
-      const all = await listAllProgress();
-      setProgress(Array.isArray(all) ? all : []);
+      // Enough history for the widest calendar view (53 weeks + current week).
+      const start = new Date();
+      start.setDate(start.getDate() - 54 * 7);
+      const res = await getActivity({ start: dayKey(start) });
+      setActivity(Array.isArray(res?.days) ? res.days : []);
     } catch (e) {
       setErr(e.message || "Failed to load user");
     } finally {
@@ -52,16 +58,9 @@ export default function UserPage() {
 
   const countsByDate = useMemo(() => {
     const counts = {};
-    for (const p of progress) {
-      const raw = p.date || p.created_at || p.created || p.timestamp || p.updated_at || null;
-      if (!raw) continue;
-      const d = new Date(raw);
-      if (Number.isNaN(d.getTime())) continue;
-      const key = `${d.getFullYear()}-${String(d.getMonth()+1).padStart(2,"0")}-${String(d.getDate()).padStart(2,"0")}`;
-      counts[key] = (counts[key] || 0) + 1;
-    }
+    for (const day of activity) counts[day.date] = day.entries;
     return counts;
-  }, [progress]);
+  }, [activity]);
 
   if (loading) return <div className="card bg-base-200 h-40 animate-pulse" />;
 
@@ -50,6 +50,17 @@ function YarnCard({ yarn, onEdit, onDelete }) {
             <div className="opacity-60">Owned (skeins)</div>
             <div>{yarn.quantity_owned_skeins ?? "—"}</div>
           </div>
+          <div>
+            <div className="opacity-60">Remaining</div>
+            <div className={Number(yarn.remaining_skeins) < 0 ? "text-error" : ""}>
+              {yarn.remaining_skeins ?? "—"}
+              {yarn.project_count > 0 && (
+                <span className="opacity-60">
+                  {" "}· {yarn.project_count} project{yarn.project_count === 1 ? "" : "s"}
+                </span>
+              )}
+            </div>
+          </div>
         </div>
 
         <div className="mt-2 flex items-center justify-end gap-3">